@@ -1,20 +1,26 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlmodel import Session, select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm, HTTPBearer
-from typing import List
+from typing import List, Optional
 from app.schemas.user import UserCreate, UserRead, UserLogin, UserUpdatePassword
-from app.crud.user import create_user, authenticate_user, change_password, get_user_by_username, get_all_users
-from app.core.security import create_access_token, verify_password, decode_access_token
-from app.db.session import get_session
+from app.core.cache import user_cache
+from app.core.security import create_access_token, verify_password, get_password_hash, decode_access_token
+from app.db.session import get_async_session
 from app.models.user import User
 
 router = APIRouter()
 
 security = HTTPBearer()
 
-def get_current_user_from_bearer(
+async def get_user_by_username(db: AsyncSession, username: str) -> Optional[User]:
+    result = await db.exec(select(User).where(User.username == username))
+    return result.first()
+
+async def get_current_user_from_bearer(
     token: str = Depends(security),
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_async_session)
 ) -> User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -27,38 +33,72 @@ def get_current_user_from_bearer(
         raise credentials_exception
     
     username: str = payload["sub"]
-    user = db.exec(select(User).where(User.username == username)).first()
+    user = await user_cache.get(username)
     if user is None:
-        raise credentials_exception
+        version = await user_cache.version(username)
+        user = await get_user_by_username(db, username)
+        if user is None:
+            raise credentials_exception
+        await user_cache.set(user, version, payload.get("exp"))
+    if not user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
     return user
 
+# bcrypt hashing is CPU-bound (~0.1-0.3 s), so it runs in the threadpool
+# instead of blocking the event loop for every other request
+
 @router.post("/register", response_model=UserRead)
-def register(user: UserCreate, db: Session = Depends(get_session)) -> UserRead:
-    if get_user_by_username(db, user.username):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_session)) -> UserRead:
+    if await get_user_by_username(db, user.username):
         raise HTTPException(status_code=400, detail="Username already registered")
-    db_user = create_user(db, user.username, user.email, user.password)
+    hashed_password = await run_in_threadpool(get_password_hash, user.password)
+    db_user = User(username=user.username, email=user.email, hashed_password=hashed_password)
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return UserRead.model_validate(db_user, from_attributes=True)
 
 @router.post("/login")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_session)) -> dict:
-    db_user = authenticate_user(db, form_data.username, form_data.password)
-    if not db_user:
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_session)) -> dict:
+    db_user = await get_user_by_username(db, form_data.username)
+    if not db_user or not await run_in_threadpool(verify_password, form_data.password, db_user.hashed_password):
         raise HTTPException(status_code=400, detail="Incorrect username or password")
     access_token = create_access_token({"sub": db_user.username})
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/", response_model=List[UserRead])
-def read_users(db: Session = Depends(get_session), current_user=Depends(get_current_user_from_bearer)) -> List[UserRead]:
-    users = get_all_users(db)
+async def read_users(db: AsyncSession = Depends(get_async_session), current_user=Depends(get_current_user_from_bearer)) -> List[UserRead]:
+    users = (await db.exec(select(User))).all()
     return [UserRead.from_orm(user) for user in users]
 
 @router.get("/me", response_model=UserRead)
-def read_users_me(current_user=Depends(get_current_user_from_bearer)) -> UserRead:
+async def read_users_me(current_user=Depends(get_current_user_from_bearer)) -> UserRead:
     return UserRead.from_orm(current_user)
 
 @router.post("/change-password")
-def change_user_password(data: UserUpdatePassword, db: Session = Depends(get_session), current_user=Depends(get_current_user_from_bearer)):
-    if not verify_password(data.old_password, current_user.hashed_password):
+async def change_user_password(data: UserUpdatePassword, db: AsyncSession = Depends(get_async_session), current_user=Depends(get_current_user_from_bearer)):
+    # current_user may come from the cache, the update goes to the database row
+    db_user = await db.get(User, current_user.id)
+    if db_user is None:
+        # The row may have been deleted since the user was cached
+        await user_cache.invalidate(current_user.username)
+        raise HTTPException(status_code=404, detail="User not found")
+    if not await run_in_threadpool(verify_password, data.old_password, db_user.hashed_password):
         raise HTTPException(status_code=400, detail="Old password incorrect")
-    change_password(db, current_user, data.new_password)
-    return {"msg": "Password updated successfully"} 
\ No newline at end of file
+    db_user.hashed_password = await run_in_threadpool(get_password_hash, data.new_password)
+    db.add(db_user)
+    await db.commit()
+    await user_cache.invalidate(db_user.username)
+    return {"msg": "Password updated successfully"}
+
+@router.post("/deactivate")
+async def deactivate_user(db: AsyncSession = Depends(get_async_session), current_user=Depends(get_current_user_from_bearer)):
+    db_user = await db.get(User, current_user.id)
+    if db_user is None:
+        await user_cache.invalidate(current_user.username)
+        raise HTTPException(status_code=404, detail="User not found")
+    db_user.is_active = False
+    db.add(db_user)
+    await db.commit()
+    await user_cache.invalidate(db_user.username)
+    return {"msg": "User deactivated"}
@@ -0,0 +1,197 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+from app.core.config import settings
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+# Write the user only if its version key still holds the value read before the database load
+SET_IF_VERSION_LUA = """
+if (redis.call('GET', KEYS[2]) or '') == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+    return 1
+end
+return 0
+"""
+
+# Version read before a database load: (in-process marker, Redis marker or None if unknown)
+Version = Tuple[str, Optional[str]]
+
+class TTLCache:
+    """
+    In-process LRU cache with a per-entry expiry time
+    
+    With maxsize=None nothing is evicted by size; expired entries are dropped from
+    the oldest end on every set, which keeps the map bounded when all entries share one TTL.
+    """
+    
+    def __init__(self, maxsize: Optional[int]):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+    
+    def set(self, key: str, value: Any, ttl: float):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            if self.maxsize is None:
+                now = time.monotonic()
+                while next(iter(self._data.values()))[0] <= now:
+                    self._data.popitem(last=False)
+            else:
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+    
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+class UserCache:
+    """
+    Authenticated users keyed by token subject (username)
+    
+    Entries live no longer than USER_CACHE_TTL and the remaining lifetime of the
+    token that loaded them. With USER_CACHE_REDIS_URL a shared Redis tier sits behind
+    the in-process one; local entries are then kept at most USER_CACHE_LOCAL_TTL,
+    since invalidation in another process only reaches Redis. Cache errors never
+    fail a request: the user is loaded from the database instead.
+    
+    Without Redis, invalidation only reaches the current process: with several workers
+    (uvicorn --workers N) the others keep serving the old user for up to USER_CACHE_TTL.
+    Multi-worker deployments must set USER_CACHE_REDIS_URL or disable the cache.
+    
+    Every invalidation replaces the user's version marker (in process and in Redis).
+    A user loaded from the database is cached only if the marker is unchanged since
+    before the load, so a load racing with a password change or deactivation in any
+    process cannot put the old state back. hashed_password is not cached: cached users
+    carry an empty hash, and code that checks the password reloads the row.
+    """
+    
+    def __init__(self, maxsize: int, ttl: float, redis_url: str = "", local_ttl: float = 0):
+        self.ttl = ttl
+        self.local = TTLCache(maxsize)
+        # Version markers replaced on invalidation. Kept apart from the users and never evicted
+        # by size: a dropped marker would let a load that read the old state cache it again
+        self.versions = TTLCache(None)
+        # A marker outlives any database load that could have read the previous one
+        self.marker_ttl = max(60, ttl)
+        self.redis = None
+        self.local_ttl = ttl
+        if redis_url:
+            try:
+                import redis.asyncio as aioredis
+                self.redis = aioredis.Redis.from_url(redis_url, decode_responses=True)
+                self.local_ttl = min(ttl, local_ttl)
+            except ImportError:
+                logger.warning("redis package is not installed, user cache stays in-process")
+    
+    @staticmethod
+    def _key(username: str) -> str:
+        return f"auth:user:{username}"
+    
+    @staticmethod
+    def _version_key(username: str) -> str:
+        return f"auth:user:{username}:version"
+    
+    async def version(self, username: str) -> Version:
+        """Version markers to read before loading the user from the database (pass to set)"""
+        local = self.versions.get(username) or ""
+        remote = None
+        if self.redis is not None:
+            try:
+                remote = await self.redis.get(self._version_key(username)) or ""
+            except Exception as e:
+                logger.warning(f"User cache version read failed: {e}")
+        return local, remote
+    
+    async def get(self, username: str) -> Optional[User]:
+        data = self.local.get(username)
+        if data is None and self.redis is not None:
+            try:
+                raw = await self.redis.get(self._key(username))
+                if raw is not None:
+                    data = json.loads(raw)
+                    ttl = await self.redis.ttl(self._key(username))
+                    if ttl > 0:
+                        self.local.set(username, data, min(self.local_ttl, ttl))
+            except Exception as e:
+                logger.warning(f"User cache read failed: {e}")
+        # New instance on every hit, so callers may modify it freely
+        return User.model_validate({**data, "hashed_password": ""}) if data is not None else None
+    
+    async def set(self, user: User, version: Version, token_expires_at: Optional[float] = None):
+        """
+        Cache a user loaded for a token
+        
+        Args:
+            user: User loaded from the database
+            version: Result of version() taken before the load; the user is not cached
+                if it was invalidated since
+            token_expires_at: Token "exp" claim (unix time), caps the entry lifetime
+        """
+        local_version, remote_version = version
+        if (self.versions.get(user.username) or "") != local_version:
+            return
+        ttl = self.ttl
+        if token_expires_at is not None:
+            ttl = min(ttl, token_expires_at - time.time())
+        if ttl <= 0:
+            return
+        data = user.model_dump(mode="json", exclude={"hashed_password"})
+        if self.redis is not None:
+            if remote_version is None:
+                return
+            try:
+                written = await self.redis.eval(SET_IF_VERSION_LUA, 2, self._key(user.username),
+                                                self._version_key(user.username), remote_version,
+                                                json.dumps(data), max(1, int(ttl)))
+            except Exception as e:
+                logger.warning(f"User cache write failed: {e}")
+                return
+            if not written:
+                return
+        self.local.set(user.username, data, min(ttl, self.local_ttl))
+    
+    async def invalidate(self, username: str):
+        """Drop a user after password change or deactivation"""
+        self.local.delete(username)
+        if self.ttl <= 0:
+            return
+        marker = uuid.uuid4().hex
+        self.versions.set(username, marker, self.marker_ttl)
+        if self.redis is not None:
+            try:
+                async with self.redis.pipeline(transaction=True) as pipe:
+                    pipe.set(self._version_key(username), marker, ex=int(self.marker_ttl))
+                    pipe.delete(self._key(username))
+                    await pipe.execute()
+            except Exception as e:
+                logger.warning(f"User cache invalidation failed: {e}")
+
+user_cache = UserCache(
+    maxsize=settings.USER_CACHE_SIZE,
+    ttl=settings.USER_CACHE_TTL if settings.USER_CACHE_ENABLED else 0,
+    redis_url=settings.USER_CACHE_REDIS_URL if settings.USER_CACHE_ENABLED else "",
+    local_ttl=settings.USER_CACHE_LOCAL_TTL,
+)
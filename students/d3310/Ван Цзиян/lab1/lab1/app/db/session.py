@@ -1,10 +1,34 @@
 from sqlmodel import Session, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from app.core.config import settings
 
-# Create engine with minimal configuration
-engine: Engine = create_engine(settings.DATABASE_URL, echo=True)
+# Each engine has its own pool, so one process opens up to
+# DB_POOL_SIZE + DB_MAX_OVERFLOW + DB_SYNC_POOL_SIZE + DB_SYNC_MAX_OVERFLOW connections
+POOL_OPTIONS = dict(
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+)
+
+# Sync engine: init_db, Alembic and routes that still use Session; a small pool is enough
+engine: Engine = create_engine(settings.DATABASE_URL, echo=settings.DB_ECHO, pool_size=settings.DB_SYNC_POOL_SIZE,
+                               max_overflow=settings.DB_SYNC_MAX_OVERFLOW, **POOL_OPTIONS)
+
+# Async engine (asyncpg): async routes wait for the database without taking a threadpool worker
+async_engine: AsyncEngine = create_async_engine(settings.ASYNC_DATABASE_URL, echo=settings.DB_ECHO,
+                                                pool_size=settings.DB_POOL_SIZE,
+                                                max_overflow=settings.DB_MAX_OVERFLOW, **POOL_OPTIONS)
+
+# expire_on_commit=False: objects stay readable after commit without a lazy load,
+# which an AsyncSession cannot do implicitly
+async_session_maker = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
 
 def get_session():
     with Session(engine) as session:
-        yield session 
\ No newline at end of file
+        yield session
+
+async def get_async_session():
+    async with async_session_maker() as session:
+        yield session
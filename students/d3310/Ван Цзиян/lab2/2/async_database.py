@@ -0,0 +1,361 @@
+import asyncio
+import asyncpg
+from database import (CREATE_TABLE_SQL, INDEX_EXISTS_SQL, MIGRATE_SQL, ON_CONFLICT_SQL, STALE_INDEXES_SQL,
+                      STATUS_UPDATE_SQL, UNIQUE_INDEX_NAME, UPSERT, STORED_BY_PARSER, PageRow, WriteStats,
+                      bisect_groups, committed_results, drop_index_sql, stored_pages_sql, unique_rows, unique_links, link_rows,
+                      row_url, split_rows, url_groups)
+from config import (DB_CONFIG, DB_BATCH_SIZE, DB_FLUSH_INTERVAL, ASYNC_DB_WRITERS, ASYNC_DB_QUEUE_SIZE,
+                    CONTENT_HASH_ENABLED)
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import logging
+import time
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Ошибки соединения: пакет не делится на части, повтор по частям тоже не удастся
+CONNECTION_ERRORS = (OSError, asyncio.TimeoutError, asyncpg.PostgresConnectionError,
+                     asyncpg.ConnectionDoesNotExistError)
+
+# Многострочная вставка одним запросом через массивы параметров
+INSERT_ROWS_SQL = f"""
+INSERT INTO web_pages (url, title, parser_type, content_hash)
+SELECT * FROM unnest($1::text[], $2::text[], $3::text[], $4::text[]){ON_CONFLICT_SQL};
+"""
+
+INSERT_LINKS_SQL = """
+INSERT INTO web_links (source_url, target_url)
+SELECT * FROM unnest($1::text[], $2::text[]) ON CONFLICT DO NOTHING;
+"""
+
+INSERT_STATUS_SQL = f"""
+INSERT INTO crawl_urls (run_id, url, status, depth, attempts, last_error, next_attempt_at)
+SELECT run_id, url, status, depth, attempts, last_error, CURRENT_TIMESTAMP + make_interval(secs => delay)
+FROM unnest($1::int[], $2::text[], $3::text[], $4::int[], $5::int[], $6::text[], $7::float8[])
+    AS t(run_id, url, status, depth, attempts, last_error, delay){STATUS_UPDATE_SQL};
+"""
+
+class AsyncDatabaseSink:
+    """
+    Неблокирующее хранилище web_pages для асинхронного парсера
+    
+    Группы строк кладутся в asyncio.Queue, а несколько writer-корутин
+    забирают их пакетами и записывают через пул asyncpg. Группа (строки
+    страницы, ссылок и статуса одного URL) не делится между пакетами,
+    поэтому записывается одной транзакцией одной writer-корутины.
+    Запись в базу данных идет параллельно с загрузкой страниц и не
+    блокирует цикл событий. Результаты, добавленные вместе со строками,
+    после commit пакета передаются в on_commit в потоке исполнителя
+    (см. BatchWriter).
+    """
+    
+    def __init__(self, writers: int = ASYNC_DB_WRITERS, queue_size: int = ASYNC_DB_QUEUE_SIZE,
+                 batch_size: int = DB_BATCH_SIZE, flush_interval: float = DB_FLUSH_INTERVAL,
+                 on_commit: Optional[Callable[[List[dict]], None]] = None):
+        self.writers = max(1, writers)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.on_commit = on_commit
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.pool: Optional[asyncpg.Pool] = None
+        self._tasks: List[asyncio.Task] = []
+        self.write_stats = WriteStats()
+    
+    async def connect(self) -> bool:
+        """
+        Создание пула соединений asyncpg
+        
+        Returns:
+            bool: Успешность подключения
+        """
+        try:
+            self.pool = await asyncpg.create_pool(
+                host=DB_CONFIG['host'],
+                port=int(DB_CONFIG['port']),
+                user=DB_CONFIG['user'],
+                password=DB_CONFIG['password'],
+                database=DB_CONFIG['database'],
+                min_size=1,
+                max_size=self.writers,
+            )
+            logger.info(f"Асинхронный пул соединений создан (до {self.writers} соединений)")
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка подключения к базе данных: {e}")
+            return False
+    
+    async def create_table(self):
+        """Создание таблицы для хранения данных веб-страниц"""
+        try:
+            async with self.pool.acquire() as conn:
+                await conn.execute(CREATE_TABLE_SQL)
+            logger.info("Таблица данных создана успешно")
+        except Exception as e:
+            logger.error(f"Ошибка создания таблицы: {e}")
+            return
+        await self.drop_stale_indexes()
+        if UPSERT:
+            await self.migrate_unique_index()
+    
+    async def drop_stale_indexes(self) -> List[str]:
+        """
+        Удаление индексов прежнего режима записи (см. DatabaseManager.drop_stale_indexes)
+        
+        Returns:
+            List[str]: Имена удаленных индексов
+        """
+        try:
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    names = [row["name"] for row in await conn.fetch(STALE_INDEXES_SQL)]
+                    for name in names:
+                        await conn.execute(drop_index_sql(name))
+        except Exception as e:
+            logger.error(f"Ошибка удаления индексов web_pages: {e}")
+            return []
+        if names:
+            logger.warning(f"Удалены уникальные индексы прежнего режима записи: {', '.join(names)}")
+        return names
+    
+    async def migrate_unique_index(self) -> int:
+        """
+        Разовая миграция к уникальному индексу (см. DatabaseManager.migrate_unique_index)
+        
+        Returns:
+            int: Количество удаленных дубликатов
+        """
+        try:
+            async with self.pool.acquire() as conn:
+                if await conn.fetchval(INDEX_EXISTS_SQL):
+                    return 0
+                async with conn.transaction():
+                    await conn.execute(MIGRATE_SQL[0])
+                    status = await conn.execute(MIGRATE_SQL[1])
+                    await conn.execute(MIGRATE_SQL[2])
+            # Статус команды: "DELETE <число строк>"
+            deleted = int(status.split()[-1])
+            logger.info(f"Создан индекс {UNIQUE_INDEX_NAME}, удалено дубликатов: {deleted}")
+            return deleted
+        except Exception as e:
+            logger.error(f"Ошибка миграции web_pages: {e}")
+            return 0
+    
+    async def stored_pages(self, urls: List[str], parser_type: str) -> Dict[str, dict]:
+        """
+        Хэши и заголовки страниц, записанные прошлыми обходами
+        
+        Args:
+            urls: URL текущего обхода
+            parser_type: Тип парсера
+            
+        Returns:
+            Dict[str, dict]: URL -> {"content_hash", "title"}
+        """
+        if not CONTENT_HASH_ENABLED or not urls:
+            return {}
+        try:
+            sql = stored_pages_sql("$1::text[]", "$2")
+            args = (list(urls), parser_type) if STORED_BY_PARSER else (list(urls),)
+            async with self.pool.acquire() as conn:
+                rows = await conn.fetch(sql, *args)
+            return {row["url"]: {"content_hash": row["content_hash"], "title": row["title"]} for row in rows}
+        except Exception as e:
+            logger.error(f"Ошибка чтения хэшей страниц: {e}")
+            return {}
+    
+    def start(self):
+        """Запуск writer-корутин"""
+        for _ in range(self.writers):
+            self._tasks.append(asyncio.create_task(self._writer_loop()))
+        return self
+    
+    async def put(self, url: str, title: str, parser_type: str, content_hash: Optional[str] = None):
+        """
+        Добавление строки в очередь записи
+        
+        Args:
+            url: URL веб-страницы
+            title: Заголовок страницы
+            parser_type: Тип парсера
+            content_hash: Хэш тела ответа
+        """
+        await self.put_rows([PageRow(url, title, parser_type, content_hash)])
+    
+    async def put_links(self, url: str, links: List[str]):
+        """
+        Добавление ссылок страницы в очередь записи web_links
+        
+        Args:
+            url: URL страницы
+            links: Нормализованные ссылки страницы
+        """
+        await self.put_rows(link_rows(url, links))
+    
+    async def put_rows(self, rows: List[tuple], results: Sequence[dict] = ()):
+        """
+        Добавление группы строк (PageRow, LinkRow, StatusRow) в очередь записи
+        
+        Строки группы записываются вместе, в одной транзакции.
+        
+        Args:
+            rows: Строки группы
+            results: Результаты по URL группы для on_commit
+        """
+        if rows or results:
+            await self.queue.put((list(rows), list(results)))
+    
+    async def _next_batch(self) -> Tuple[List[tuple], List[dict], bool]:
+        """
+        Сбор следующего пакета из очереди
+        
+        Пакет отправляется, когда набрано batch_size строк или с момента
+        получения первой группы прошло flush_interval секунд. Группы
+        добавляются в пакет целиком.
+        
+        Returns:
+            Tuple[List, List, bool]: Пакет строк, результаты этих групп и признак завершения работы
+        """
+        rows, results = [], []
+        item = await self.queue.get()
+        if item is None:
+            return rows, results, True
+        rows.extend(item[0])
+        results.extend(item[1])
+        
+        deadline = time.monotonic() + self.flush_interval
+        while len(rows) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if item is None:
+                return rows, results, True
+            rows.extend(item[0])
+            results.extend(item[1])
+        return rows, results, False
+    
+    async def _writer_loop(self):
+        """Writer-корутина: пакетная запись строк из очереди"""
+        done = False
+        while not done:
+            rows, results, done = await self._next_batch()
+            if rows or results:
+                await self._write(rows, results)
+    
+    async def _insert_rows(self, rows: List[tuple]):
+        """Запись строк одним INSERT на таблицу в одной транзакции (при ошибке - исключение)"""
+        pages, links, statuses = split_rows(rows)
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                if pages:
+                    await conn.execute(INSERT_ROWS_SQL, *[list(column) for column in zip(*unique_rows(pages))])
+                if links:
+                    await conn.execute(INSERT_LINKS_SQL, *[list(column) for column in zip(*unique_links(links))])
+                if statuses:
+                    await conn.execute(INSERT_STATUS_SQL, *[list(column) for column in zip(*statuses)])
+    
+    async def _write_groups(self, groups: List[List[tuple]]) -> List[tuple]:
+        """
+        Запись групп строк одной транзакцией, при ошибке - по половинам (см. DatabaseManager.save_many)
+        
+        Returns:
+            List[tuple]: Строки, которые не удалось записать
+        """
+        rows = [row for group in groups for row in group]
+        try:
+            await self._insert_rows(rows)
+            return []
+        except CONNECTION_ERRORS as e:
+            logger.error(f"Ошибка пакетного сохранения данных: {e}")
+            return rows
+        except Exception as e:
+            if len(groups) == 1:
+                logger.error(f"Строки URL {row_url(rows[0])} не записаны: {e}")
+                return rows
+        first, second = bisect_groups(groups)
+        return await self._write_groups(first) + await self._write_groups(second)
+    
+    async def _write(self, rows: List[tuple], results: Sequence[dict] = ()) -> bool:
+        """
+        Запись пакета одним INSERT (в режиме upsert - с обновлением существующих строк)
+        
+        Ссылки и статусы URL из пакета записываются в web_links и crawl_urls
+        в той же транзакции. Строки каждой таблицы сортируются по ключу,
+        чтобы параллельные writer-корутины блокировали строки в одном порядке.
+        Пакет с ошибкой в данных повторяется по половинам, и теряются
+        только строки URL с ошибкой.
+        
+        Args:
+            rows: Список кортежей PageRow, LinkRow и StatusRow
+            results: Результаты по URL пакета для on_commit
+            
+        Returns:
+            bool: Записаны ли все строки пакета
+        """
+        failed = []
+        if rows:
+            flush_start = time.perf_counter()
+            failed = await self._write_groups(url_groups(rows))
+            latency = time.perf_counter() - flush_start
+            self.write_stats.record(len(rows), latency, len(failed))
+            logger.info(f"Сброс пакета: {len(rows)} строк за {latency * 1000:.1f} мс")
+        if self.on_commit is not None and results:
+            committed = committed_results(list(results), failed)
+            if committed:
+                # Обработчик (запись кэша в SQLite) блокирующий: выполняется вне цикла событий
+                await asyncio.get_running_loop().run_in_executor(None, self.on_commit, committed)
+        return not failed
+    
+    async def close(self):
+        """Запись оставшихся строк, остановка writer-корутин и закрытие пула"""
+        # Один маркер завершения на каждую writer-корутину после всех строк
+        for _ in self._tasks:
+            await self.queue.put(None)
+        if self._tasks:
+            await asyncio.gather(*self._tasks)
+            self._tasks = []
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+            logger.info("Асинхронный пул соединений закрыт")
+    
+    def report(self, prefix: str):
+        """Вывод статистики записи на экран"""
+        self.write_stats.report(prefix)
+
+class NullAsyncSink:
+    """Хранилище с интерфейсом AsyncDatabaseSink, которое ничего не записывает (прогон без базы данных)"""
+    
+    def __init__(self):
+        self.write_stats = WriteStats()
+    
+    async def connect(self) -> bool:
+        return True
+    
+    async def create_table(self):
+        pass
+    
+    async def stored_pages(self, urls: List[str], parser_type: str) -> Dict[str, dict]:
+        return {}
+    
+    def start(self):
+        return self
+    
+    async def put(self, url: str, title: str, parser_type: str, content_hash: Optional[str] = None):
+        pass
+    
+    async def put_links(self, url: str, links: List[str]):
+        pass
+    
+    async def put_rows(self, rows: List[tuple], results: Sequence[dict] = ()):
+        pass
+    
+    async def close(self):
+        pass
+    
+    def report(self, prefix: str):
+        pass
@@ -1,115 +1,437 @@
 import asyncio
 import aiohttp
 import time
-from bs4 import BeautifulSoup, XMLParsedAsHTMLWarning
-from database import db_manager
-from config import URLS, ASYNC_CONCURRENCY
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from async_database import AsyncDatabaseSink, NullAsyncSink
+from database import result_rows
+from config import (ASYNC_CONCURRENCY, ASYNC_WORKERS, HOST_CONCURRENCY, PARSE_EXECUTOR, PARSE_EXECUTOR_WORKERS,
+                    PARSE_QUEUE_DEPTH, TITLE_STREAMING, FRONTIER_POLL_INTERVAL, HTTP_TIMEOUT, HTTP_CONNECT_TIMEOUT)
+from crawl_stats import CrawlStats
+from frontier import Frontier
+from title_extractor import (fetch_title_async, extract_title, extract_title_links, conditional_headers, page_result,
+                             content_hash, unchanged, page_changed, unchanged_reason, response_encoding)
+from links import page_links
+from metrics import add_timing, trace_config
+from http_cache import HttpCache
+from rate_limit import AsyncHostLimiter
+from typing import Awaitable, Callable, List, Tuple
 import logging
-import warnings
-
-# Игнорировать предупреждения XML парсинга
-warnings.filterwarnings("ignore", category=XMLParsedAsHTMLWarning)
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def parse_and_save(url: str, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore) -> bool:
+def timed_extract_title(content: bytes, url: str) -> Tuple[str, float]:
+    """
+    Извлечение заголовка страницы с замером времени разбора
+    
+    Функция верхнего уровня, чтобы ее можно было выполнить в пуле процессов.
+    
+    Args:
+        content: Тело HTTP-ответа
+        url: URL страницы (для заголовка по умолчанию)
+        
+    Returns:
+        Tuple[str, float]: Заголовок и время разбора в секундах
+    """
+    parse_start = time.perf_counter()
+    
+    # Разбор цепочкой бэкендов из config.TITLE_BACKENDS
+    title_text = extract_title(content, url)
+    
+    return title_text, time.perf_counter() - parse_start
+
+def timed_extract_title_links(content: bytes, url: str, encoding: str) -> Tuple[Tuple[str, List[str]], float]:
+    """
+    Извлечение заголовка и ссылок за один проход с замером времени разбора
+    
+    Args:
+        content: Тело HTTP-ответа
+        url: URL страницы (для заголовка по умолчанию)
+        encoding: Кодировка тела ответа
+        
+    Returns:
+        Tuple[Tuple[str, List[str]], float]: Заголовок и значения href, время разбора в секундах
+    """
+    parse_start = time.perf_counter()
+    title_links = extract_title_links(content, url, encoding)
+    return title_links, time.perf_counter() - parse_start
+
+class ParseOffloader:
+    """
+    Вынос разбора HTML из цикла событий
+    
+    Разбор выполняется в пуле потоков или процессов через run_in_executor.
+    Количество одновременно отправленных заданий ограничено семафором,
+    чтобы очередь executor не росла без предела.
+    """
+    
+    def __init__(self, mode: str = PARSE_EXECUTOR, workers: int = PARSE_EXECUTOR_WORKERS,
+                 queue_depth: int = PARSE_QUEUE_DEPTH):
+        self.mode = mode
+        self.workers = max(1, workers)
+        self.executor = None
+        self._slots = asyncio.Semaphore(max(1, queue_depth))
+        
+        # Статистика разбора
+        self.parse_count = 0
+        self.work_time = 0.0      # время самого разбора
+        self.wait_time = 0.0      # время ожидания результата корутиной
+        self.blocking_time = 0.0  # время, на которое разбор занял цикл событий
+    
+    def start(self):
+        """Создание executor в соответствии с режимом"""
+        if self.mode == "process":
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        elif self.mode == "thread":
+            self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        return self
+    
+    async def _run(self, func: Callable, *args):
+        """Выполнение функции разбора вида timed_* в executor (или в цикле событий в режиме "inline")"""
+        if self.executor is None:
+            # Режим "inline": разбор прямо в цикле событий
+            value, elapsed = func(*args)
+            self.blocking_time += elapsed
+        else:
+            async with self._slots:
+                wait_start = time.perf_counter()
+                loop = asyncio.get_running_loop()
+                value, elapsed = await loop.run_in_executor(self.executor, func, *args)
+                self.wait_time += time.perf_counter() - wait_start
+        self.parse_count += 1
+        self.work_time += elapsed
+        return value
+    
+    async def extract(self, content: bytes, url: str) -> str:
+        """
+        Извлечение заголовка без блокировки цикла событий
+        
+        Args:
+            content: Тело HTTP-ответа
+            url: URL страницы
+            
+        Returns:
+            str: Заголовок страницы
+        """
+        return await self._run(timed_extract_title, content, url)
+    
+    async def extract_links(self, content: bytes, url: str, encoding: str) -> Tuple[str, List[str]]:
+        """
+        Извлечение заголовка и ссылок без блокировки цикла событий
+        
+        Args:
+            content: Тело HTTP-ответа
+            url: URL страницы
+            encoding: Кодировка тела ответа
+            
+        Returns:
+            Tuple[str, List[str]]: Заголовок и значения href
+        """
+        return await self._run(timed_extract_title_links, content, url, encoding)
+    
+    def close(self):
+        """Остановка executor"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+    
+    def report(self, prefix: str, monitor: "LoopLagMonitor"):
+        """Вывод статистики разбора и блокировки цикла событий"""
+        print(f"[{prefix}] Разбор ({self.mode}): {self.parse_count} страниц, "
+              f"работа {self.work_time * 1000:.1f} мс, ожидание {self.wait_time * 1000:.1f} мс, "
+              f"блокировка цикла разбором {self.blocking_time * 1000:.1f} мс")
+        print(f"[{prefix}] Задержка цикла событий: суммарно {monitor.total_lag * 1000:.1f} мс, "
+              f"максимум {monitor.max_lag * 1000:.1f} мс")
+
+class LoopLagMonitor:
+    """Измерение того, насколько цикл событий опаздывает с пробуждением"""
+    
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self._task = None
+    
+    async def _run(self):
+        """Периодический сон с измерением опоздания пробуждения"""
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - expected)
+            self.total_lag += lag
+            self.max_lag = max(self.max_lag, lag)
+    
+    def start(self):
+        """Запуск измерения"""
+        self._task = asyncio.create_task(self._run())
+        return self
+    
+    async def stop(self):
+        """Остановка измерения"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+async def parse_and_save(url: str, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore,
+                         limiter: AsyncHostLimiter, offloader: ParseOffloader,
+                         cache: HttpCache, parser_type: str = "async", links: bool = False) -> dict:
     """
-    Асинхронный парсинг указанного URL и сохранение в базу данных
+    Асинхронный парсинг указанного URL
+    
+    Строки страницы, ссылок и статуса URL записывает обработчик результата
+    (result_rows) одной группой, чтобы они попали в одну транзакцию.
     
     Args:
         url: URL веб-страницы для парсинга
         session: aiohttp сессия
         semaphore: семафор для контроля конкурентности
+        limiter: ограничения запросов по хостам
+        offloader: вынос разбора HTML из цикла событий
+        cache: кэш валидаторов для условных запросов и хэшей прошлого обхода
+        parser_type: Тип парсера для вывода и записи в базу данных
+        links: Извлекать ли ссылки страницы (обход по ссылкам); запрос тогда безусловный
         
     Returns:
-        bool: Успешность парсинга и сохранения
+        dict: Результат по URL (url, success, title, etag, last_modified, not_modified,
+        content_hash, unchanged, links, elapsed, timings)
     """
-    async with semaphore:
-        try:
-            # Отправка асинхронного HTTP-запроса
-            async with session.get(url, timeout=aiohttp.ClientTimeout(total=10)) as response:
+    started = None
+    timings = {}
+    cached = cache.get(url) if not links else None
+    stored = cache.stored(url)
+    
+    # Одна попытка загрузки; слот хоста на каждую попытку занимает limiter.fetch,
+    # а общий семафор берется после него: ожидание ограниченного хоста
+    # не занимает общие слоты, нужные другим хостам
+    async def fetch_streaming():
+        nonlocal started
+        async with semaphore:
+            started = started or time.perf_counter()
+            # Чтение ответа частями только до </title>, разбор инкрементальный
+            return await fetch_title_async(url, session, cached, stored, links, timings)
+    
+    async def fetch_body():
+        nonlocal started
+        async with semaphore:
+            started = started or time.perf_counter()
+            # Отправка асинхронного (условного, если есть кэш) HTTP-запроса
+            async with session.get(url, headers=conditional_headers(cached), trace_request_ctx=timings) as response:
+                if response.status == 304 and cached:
+                    return page_result(cached["title"], response.headers, cached), None, None, None
                 response.raise_for_status()
+                body_started = time.perf_counter()
                 content = await response.read()
+                add_timing(timings, "download", time.perf_counter() - body_started)
+                return None, content, response.headers, str(response.url)
+    
+    try:
+        if TITLE_STREAMING:
+            page = await limiter.fetch(url, fetch_streaming)
+        else:
+            page, content, headers, final_url = await limiter.fetch(url, fetch_body)
             
-            # Единый HTML парсер, игнорировать XML предупреждения
-            soup = BeautifulSoup(content, 'html.parser')
-            title = soup.find('title')
-            
-            if title:
-                title_text = title.get_text().strip()
-            else:
-                # Для страниц без title использовать путь URL как заголовок
-                from urllib.parse import urlparse
-                parsed_url = urlparse(url)
-                path = parsed_url.path.strip('/')
-                if path:
-                    title_text = f"{parsed_url.netloc} - {path}"
+            if page is None:
+                # Время разбора с ожиданием пула разбора
+                parse_started = time.perf_counter()
+                digest = content_hash(content)
+                if links:
+                    # Ссылки нужны и у неизменившейся страницы: разбор одним проходом
+                    title_text, hrefs = await offloader.extract_links(
+                        content, url, response_encoding(headers.get('Content-Type')))
+                    page = page_result(title_text, headers, digest=digest,
+                                       stored=stored if unchanged(digest, stored) else None,
+                                       links=page_links(hrefs, final_url))
+                elif unchanged(digest, stored):
+                    # Тело не изменилось с прошлого обхода: разбор не нужен
+                    page = page_result(stored["title"], headers, digest=digest, stored=stored)
                 else:
-                    title_text = f"{parsed_url.netloc} - главная"
-            
-            # Сохранение в базу данных
-            success = db_manager.save_page_data(url, title_text, "async")
-            
-            # Вывод результата на экран
-            if success:
-                print(f"[async] {url} -> {title_text}")
-            else:
-                print(f"[async] {url} -> ошибка сохранения")
-                
-            return success
-            
-        except Exception as e:
-            logger.error(f"Ошибка парсинга {url}: {e}")
-            print(f"[async] {url} -> ошибка парсинга: {e}")
-            return False
+                    # Разбор выполняется вне семафора, чтобы не занимать слот загрузки
+                    page = page_result(await offloader.extract(content, url), headers, digest=digest)
+                add_timing(timings, "parse", time.perf_counter() - parse_started)
+    except Exception as e:
+        logger.error(f"Ошибка парсинга {url}: {e}")
+        print(f"[{parser_type}] {url} -> ошибка парсинга: {e}")
+        elapsed = time.perf_counter() - started if started is not None else 0.0
+        return {"url": url, "success": False, "error": str(e), "elapsed": elapsed, "timings": timings}
+    elapsed = time.perf_counter() - started
+    title_text = page["title"]
+    
+    if not page_changed(page):
+        # Страница не изменилась с прошлого обхода: строка не записывается
+        print(f"[{parser_type}] {url} -> {title_text} ({unchanged_reason(page)})")
+    else:
+        # Вывод результата на экран
+        print(f"[{parser_type}] {url} -> {title_text}")
+    
+    return {"url": url, "success": True, **page, "elapsed": elapsed, "timings": timings}
+
+async def crawl_worker(work_queue: asyncio.Queue, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore,
+                       limiter: AsyncHostLimiter, offloader: ParseOffloader,
+                       cache: HttpCache, on_result: Callable[[dict], Awaitable[None]], parser_type: str = "async",
+                       follows: Callable[[str], bool] = lambda url: False):
+    """
+    Рабочая корутина: обработка URL из очереди до маркера None
+    
+    Рабочих корутин постоянное число, поэтому число задач не зависит
+    от числа URL.
+    
+    Args:
+        work_queue: Очередь URL от распределителя
+        session: aiohttp сессия
+        semaphore: семафор для контроля конкурентности
+        limiter: ограничения запросов по хостам
+        offloader: вынос разбора HTML из цикла событий
+        cache: кэш валидаторов и хэшей прошлого обхода
+        on_result: Корутина-обработчик результата по каждому URL
+        parser_type: Тип парсера для вывода и записи в базу данных
+        follows: Нужно ли извлекать ссылки URL (обход по ссылкам)
+    """
+    while True:
+        url = await work_queue.get()
+        if url is None:
+            return
+        await on_result(await parse_and_save(url, session, semaphore, limiter, offloader, cache,
+                                             parser_type, follows(url)))
 
-async def main():
-    """Главная асинхронная функция"""
-    print("=== Асинхронный парсер веб-страниц ===")
-    start_time = time.time()
+async def feed_frontier(frontier: Frontier, work_queue: asyncio.Queue, cache: HttpCache,
+                        sink: AsyncDatabaseSink, workers: int):
+    """
+    Распределитель: передача URL из Frontier рабочим корутинам
+    
+    URL берутся группами по половине окна Frontier; для каждой группы
+    читаются записи кэша и хэши прошлого обхода. Очередь рабочих
+    ограничена, поэтому распределитель не обгоняет обработку.
+    Чтение Frontier и файла кэша выполняется вне цикла событий.
     
-    # Подключение к базе данных
-    if not db_manager.connect():
-        print("Не удалось подключиться к базе данных, выход из программы")
-        return
+    Args:
+        frontier: Очередь URL
+        work_queue: Очередь URL рабочих корутин
+        cache: кэш валидаторов и хэшей прошлого обхода
+        sink: хранилище, из которого читаются хэши
+        workers: Число рабочих корутин (столько же маркеров завершения)
+    """
+    loop = asyncio.get_running_loop()
+    batch_size = max(1, frontier.window // 2)
+    while True:
+        batch = await loop.run_in_executor(None, frontier.get_batch, batch_size)
+        if not batch:
+            if frontier.finished:
+                break
+            await asyncio.sleep(FRONTIER_POLL_INTERVAL)
+            continue
+        await loop.run_in_executor(None, cache.prefetch, batch)
+        cache.with_stored(await sink.stored_pages(batch, "async"))
+        for url in batch:
+            await work_queue.put(url)
+    for _ in range(workers):
+        await work_queue.put(None)
+
+async def crawl(frontier: Frontier, store: bool = True) -> CrawlStats:
+    """
+    Асинхронная обработка URL из очереди
+    
+    Args:
+        frontier: Очередь URL
+        store: Записывать ли результаты в базу данных
+        
+    Returns:
+        CrawlStats: Итоги обхода
+    """
+    # Валидаторы и хэши прошлого обхода читаются распределителем для каждой группы URL,
+    # новые валидаторы сохраняются после commit пакета со строками их URL
+    cache = HttpCache("async")
+    
+    # Подключение к базе данных через асинхронный пул
+    sink = AsyncDatabaseSink(on_commit=cache.save) if store else NullAsyncSink()
+    if not await sink.connect():
+        raise RuntimeError("Не удалось подключиться к базе данных")
     
     # Создание таблицы данных
-    db_manager.create_table()
+    await sink.create_table()
     
-    print(f"Использование {ASYNC_CONCURRENCY} конкурентных соединений для обработки {len(URLS)} URL")
+    print(f"Использование {ASYNC_CONCURRENCY} конкурентных соединений и {ASYNC_WORKERS} рабочих корутин "
+          f"(окно очереди: {frontier.window} URL)")
     
     # Создание семафора для контроля конкурентности
     semaphore = asyncio.Semaphore(ASYNC_CONCURRENCY)
     
+    # Семафор и адаптивная скорость на каждый хост
+    limiter = AsyncHostLimiter()
+    
+    stats = CrawlStats()
+    loop = asyncio.get_running_loop()
+    
+    async def on_result(result: dict):
+        stats.add(result)
+        # Постановка ссылок в Frontier берет его блокировку и может писать очередь на диск:
+        # выполняется вне цикла событий, как чтение Frontier распределителем
+        status_rows = await loop.run_in_executor(None, frontier.complete, result)
+        # Страница, ссылки и статус URL - одна группа строк, которую одна writer-корутина
+        # записывает одной транзакцией; очередь записи заполняется после освобождения
+        # семафора, поэтому загрузки страниц не ждут базу данных
+        await sink.put_rows(result_rows(result, "async") + status_rows, [result])
+        cache.forget(result["url"])
+        frontier.done()
+    
     # Создание aiohttp сессии
-    connector = aiohttp.TCPConnector(limit=ASYNC_CONCURRENCY)
-    timeout = aiohttp.ClientTimeout(total=10)
-    
-    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-        # Создание всех задач
-        tasks = [
-            parse_and_save(url, session, semaphore) 
-            for url in URLS
-        ]
-        
-        # Ожидание завершения всех задач
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+    connector = aiohttp.TCPConnector(limit=ASYNC_CONCURRENCY, limit_per_host=HOST_CONCURRENCY)
+    timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
     
-    # Расчет времени выполнения
-    execution_time = time.time() - start_time
+    # Запуск writer-корутин, записывающих параллельно с загрузкой
+    sink.start()
     
-    # Подсчет успешных и неудачных запросов
-    successful = sum(1 for result in results if result is True)
-    failed = len(results) - successful
+    # Разбор HTML вне цикла событий и измерение задержки цикла
+    offloader = ParseOffloader().start()
+    monitor = LoopLagMonitor().start()
     
-    print(f"[async] Завершено {len(URLS)} URL, успешно {successful}, неудачно {failed}")
-    print(f"[async] Общее время {execution_time:.2f}s")
+    # Writer-корутины, пул разбора и монитор закрываются и тогда, когда обход завершился ошибкой
+    try:
+        # Трассировка запросов для замеров DNS, соединения и первого байта
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                         trace_configs=[trace_config()]) as session:
+            # Распределитель и постоянное число рабочих корутин вместо задачи на каждый URL
+            work_queue = asyncio.Queue(maxsize=ASYNC_WORKERS)
+            tasks = [
+                asyncio.create_task(feed_frontier(frontier, work_queue, cache, sink, ASYNC_WORKERS)),
+                *[
+                    asyncio.create_task(crawl_worker(work_queue, session, semaphore, limiter, offloader, cache,
+                                                     on_result, follows=frontier.follows))
+                    for _ in range(ASYNC_WORKERS)
+                ],
+            ]
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                # После ошибки одной корутины остальные останавливаются до закрытия сессии
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        await monitor.stop()
+        offloader.close()
+        
+        # Запись оставшихся строк и закрытие пула
+        await sink.close()
     
-    # Закрытие соединения с базой данных
-    db_manager.close()
+    offloader.report("async", monitor)
+    limiter.report("async")
+    sink.report("async")
+    cache.report("async", stats)
+    return stats
+
+def run(frontier: Frontier, store: bool = True) -> CrawlStats:
+    """Синхронная точка входа для движка: запуск crawl в новом цикле событий"""
+    return asyncio.run(crawl(frontier, store))
+
+def main():
+    """Главная функция"""
+    import crawl_engine
+    crawl_engine.main(["--mode", "async"])
 
 if __name__ == "__main__":
-    # Запуск асинхронной главной функции
-    asyncio.run(main())
+    main()
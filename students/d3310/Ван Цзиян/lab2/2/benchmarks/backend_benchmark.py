@@ -0,0 +1,85 @@
+"""
+Микро-бенчмарк бэкендов извлечения заголовка
+
+Каждый установленный бэкенд из title_extractor.BACKENDS прогоняется по
+страницам из benchmarks/fixtures (копии страниц httpbin /html, /xml,
+/links, /forms/post и большая страница в стиле python.org), результат
+выводится в страницах в секунду.
+
+Запуск: python benchmarks/backend_benchmark.py [--repeat 200]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from title_extractor import BACKENDS, available_backends
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+def load_fixtures() -> dict:
+    """Загрузка тел страниц из каталога fixtures"""
+    pages = {}
+    for name in sorted(os.listdir(FIXTURES_DIR)):
+        with open(os.path.join(FIXTURES_DIR, name), 'rb') as f:
+            pages[name] = f.read()
+    return pages
+
+def run_backend(backend, pages: dict, repeat: int) -> dict:
+    """
+    Прогон одного бэкенда по всем страницам
+    
+    Returns:
+        dict: Страниц в секунду (всего и по каждой странице) и найденные заголовки
+    """
+    per_page = {}
+    titles = {}
+    total_time = 0.0
+    for name, content in pages.items():
+        try:
+            titles[name] = backend(content)
+        except Exception as e:
+            titles[name] = f"ошибка: {e}"
+        start = time.perf_counter()
+        for _ in range(repeat):
+            try:
+                backend(content)
+            except Exception:
+                pass
+        elapsed = time.perf_counter() - start
+        total_time += elapsed
+        per_page[name] = repeat / elapsed
+    return {
+        "pages_per_sec": repeat * len(pages) / total_time,
+        "per_page": per_page,
+        "titles": titles,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=200, help='повторов на страницу')
+    args = parser.parse_args()
+    
+    pages = load_fixtures()
+    names = list(pages)
+    print(f"Страниц: {len(pages)}, повторов: {args.repeat}")
+    print(f"{'бэкенд':<14}{'стр/с':>10}  " + "  ".join(f"{name[:18]:>18}" for name in names))
+    
+    results = {}
+    for backend_name in available_backends():
+        result = run_backend(BACKENDS[backend_name], pages, args.repeat)
+        results[backend_name] = result
+        per_page = "  ".join(f"{result['per_page'][name]:>18.0f}" for name in names)
+        print(f"{backend_name:<14}{result['pages_per_sec']:>10.0f}  {per_page}")
+    
+    # Расхождения заголовков между бэкендами
+    print()
+    for name in names:
+        found = {backend_name: result['titles'][name] for backend_name, result in results.items()}
+        if len(set(map(str, found.values()))) > 1:
+            print(f"Расхождение на {name}: {found}")
+
+if __name__ == '__main__':
+    main()
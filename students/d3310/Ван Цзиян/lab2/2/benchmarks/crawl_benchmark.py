@@ -0,0 +1,89 @@
+"""
+Сравнение режимов выполнения на локальном HTTP-сервере
+
+Для каждого режима crawl_engine запускается в отдельном процессе
+(без записи в базу данных) против StandInServer с заданной задержкой,
+размером страниц и долей ошибок. Сводка по режимам выводится в JSON:
+пропускная способность, p50/p95/p99 задержки по URL, CPU и пиковый RSS.
+
+Запуск: python benchmarks/crawl_benchmark.py --urls 200 --latency-ms 100 --output results.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from standin_server import StandInServer
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENGINE = os.path.join(PROJECT_DIR, 'crawl_engine.py')
+DEFAULT_MODES = ['async', 'threading', 'multiprocessing', 'hybrid']
+
+def run_mode(mode: str, urls_file: str, workdir: str, host_limits: bool = False) -> dict:
+    """
+    Прогон одного режима в отдельном процессе
+    
+    Отдельный процесс нужен, чтобы CPU и пиковый RSS относились только к этому режиму.
+    Ограничения по хостам по умолчанию выключены: все URL относятся к одному
+    локальному серверу, и сравнивались бы ограничения, а не режимы.
+    Кэш условных запросов выключен, чтобы каждый режим загружал страницы полностью.
+    """
+    env = {**os.environ, 'HOST_LIMITS': '1' if host_limits else '0', 'HTTP_CACHE': '0'}
+    summary_path = os.path.join(workdir, f'{mode}.json')
+    completed = subprocess.run(
+        [sys.executable, ENGINE, '--mode', mode, '--no-db', '--urls-file', urls_file, '--json', summary_path],
+        cwd=PROJECT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+    if completed.returncode != 0 or not os.path.exists(summary_path):
+        lines = completed.stderr.strip().splitlines()
+        return {"mode": mode, "error": lines[-1] if lines else "нет сводки"}
+    with open(summary_path, encoding='utf-8') as f:
+        return json.load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--modes', default=','.join(DEFAULT_MODES), help='режимы через запятую')
+    parser.add_argument('--urls', type=int, default=200, help='количество URL')
+    parser.add_argument('--latency-ms', type=float, default=100, help='задержка ответа сервера')
+    parser.add_argument('--jitter-ms', type=float, default=20, help='разброс задержки')
+    parser.add_argument('--page-size', type=int, default=16 * 1024, help='размер страницы в байтах')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов 500')
+    parser.add_argument('--host-limits', action='store_true', help='включить ограничения по хостам (HOST_LIMITS=1)')
+    parser.add_argument('--output', help='файл для JSON-результата (по умолчанию stdout)')
+    args = parser.parse_args()
+    
+    server = StandInServer(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                           page_size=args.page_size, error_rate=args.error_rate).start()
+    report = {
+        "server": {
+            "urls": args.urls,
+            "latency_ms": args.latency_ms,
+            "jitter_ms": args.jitter_ms,
+            "page_size": args.page_size,
+            "error_rate": args.error_rate,
+            "host_limits": args.host_limits,
+        },
+        "modes": [],
+    }
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            urls_file = os.path.join(workdir, 'urls.txt')
+            with open(urls_file, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(server.urls(args.urls)))
+            for mode in args.modes.split(','):
+                print(f"Прогон режима {mode}...", file=sys.stderr)
+                report["modes"].append(run_mode(mode.strip(), urls_file, workdir, args.host_limits))
+    finally:
+        server.stop()
+    
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Статическое и динамическое распределение URL в многопоточном парсере
+
+Два локальных сервера играют роль быстрого и медленного сайтов. URL
+медленного сайта идут подряд в начале списка, как URL одного сайта
+в config.URLS, поэтому при статическом распределении они попадают
+в часть одного потока. Для каждого распределения выводится общее время
+и задержка по URL (p50/p99).
+
+Запуск: python benchmarks/skew_benchmark.py [--urls 100 --slow-fraction 0.1 --slow-ms 1000]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Сравниваются распределения URL, а не ограничения по хостам
+os.environ.setdefault('HOST_LIMITS', '0')
+
+import threading_parser
+from frontier import Frontier
+from standin_server import StandInServer
+
+def measure(urls: list, scheduling: str) -> dict:
+    """Прогон многопоточного парсера без записи в базу данных"""
+    started = time.perf_counter()
+    # Построчный вывод парсера не нужен в отчете
+    with contextlib.redirect_stdout(io.StringIO()):
+        stats = threading_parser.run(Frontier(urls), store=False, scheduling=scheduling)
+    wall_time = time.perf_counter() - started
+    return {
+        "wall_time_s": wall_time,
+        "latency_p50_ms": stats.percentile(50) * 1000,
+        "latency_p99_ms": stats.percentile(99) * 1000,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--urls', type=int, default=100, help='количество URL')
+    parser.add_argument('--slow-fraction', type=float, default=0.1, help='доля URL медленного сайта')
+    parser.add_argument('--fast-ms', type=float, default=20, help='задержка быстрого сайта')
+    parser.add_argument('--slow-ms', type=float, default=1000, help='задержка медленного сайта')
+    args = parser.parse_args()
+    
+    fast = StandInServer(latency_ms=args.fast_ms, page_size=4096).start()
+    slow = StandInServer(latency_ms=args.slow_ms, page_size=4096).start()
+    slow_count = int(args.urls * args.slow_fraction)
+    urls = slow.urls(slow_count) + fast.urls(args.urls - slow_count)
+    
+    print(f"URL: {len(urls)}, медленных: {slow_count} ({args.slow_ms:.0f} мс), "
+          f"быстрых: {len(urls) - slow_count} ({args.fast_ms:.0f} мс), потоков: {threading_parser.THREADING_WORKERS}")
+    print(f"{'распределение':<16}{'время, с':>10}{'p50, мс':>10}{'p99, мс':>10}")
+    try:
+        results = {}
+        for scheduling in ("static", "dynamic"):
+            results[scheduling] = measure(urls, scheduling)
+            r = results[scheduling]
+            print(f"{scheduling:<16}{r['wall_time_s']:>10.2f}{r['latency_p50_ms']:>10.0f}{r['latency_p99_ms']:>10.0f}")
+    finally:
+        fast.stop()
+        slow.stop()
+    print(f"Ускорение общего времени: {results['static']['wall_time_s'] / results['dynamic']['wall_time_s']:.2f}x")
+
+if __name__ == '__main__':
+    main()
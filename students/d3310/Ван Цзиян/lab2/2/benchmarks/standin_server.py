@@ -0,0 +1,159 @@
+"""
+Локальный HTTP-сервер, заменяющий реальные сайты в бенчмарках
+
+Отдает страницы /page/<n> с заголовком "Page <n>" и телом заданного
+размера. Задержка ответа, ее разброс и доля ответов 500 настраиваются;
+параметр запроса ?delay=<мс> задает задержку конкретной страницы.
+С etag=True страницы отдаются с ETag и Last-Modified, а на условный
+запрос с совпадающим If-None-Match сервер отвечает 304.
+С links=k страница n содержит ссылки на страницы n*k+1 ... n*k+k,
+поэтому от /page/0 страницы образуют дерево для обхода по ссылкам.
+
+Запуск отдельно: python benchmarks/standin_server.py --port 8080 --latency-ms 50
+"""
+import argparse
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+class StandInServer:
+    """HTTP-сервер с настраиваемой задержкой, размером страниц и долей ошибок"""
+    
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency_ms: float = 50,
+                 jitter_ms: float = 0, page_size: int = 16 * 1024, error_rate: float = 0.0,
+                 seed: int = 42, etag: bool = False, links: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.page_size = page_size
+        self.error_rate = error_rate
+        self.etag = etag
+        self.links = links
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self.requests_served = 0
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+    
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def urls(self, count: int) -> list:
+        """Список из count URL страниц сервера"""
+        return [f"{self.base_url}/page/{i}" for i in range(count)]
+    
+    def _roll(self):
+        """Случайная задержка в секундах и признак ошибки для очередного запроса"""
+        with self._random_lock:
+            jitter = self._random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+            failed = self._random.random() < self.error_rate
+            self.requests_served += 1
+        return max(0.0, self.latency_ms + jitter) / 1000, failed
+    
+    def render_page(self, number: str) -> bytes:
+        """HTML-страница с заголовком в <head> и телом размером около page_size байт"""
+        head = (f"<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n"
+                f"<title>Page {number}</title>\n</head>\n<body>\n").encode()
+        if self.links and number.isdigit():
+            first = int(number) * self.links + 1
+            head += "".join(f"<a href=\"{child}\">Page {child}</a>\n"
+                            for child in range(first, first + self.links)).encode()
+        line = f"<p><a href=\"/page/{number}\">Lorem ipsum dolor sit amet</a></p>\n".encode()
+        repeats = max(0, (self.page_size - len(head)) // len(line))
+        return head + line * repeats + b"</body>\n</html>\n"
+    
+    def _make_handler(self):
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Заголовки и тело пишутся отдельно: без TCP_NODELAY повторно
+            # используемое соединение ждет отложенного ACK клиента
+            disable_nagle_algorithm = True
+            
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                delay, failed = server._roll()
+                query = parse_qs(parsed.query)
+                if 'delay' in query:
+                    delay = float(query['delay'][0]) / 1000
+                time.sleep(delay)
+                
+                if failed or not parsed.path.startswith('/page/'):
+                    status = 500 if failed else 404
+                    body = b"error"
+                    self.send_response(status)
+                else:
+                    number = parsed.path.rsplit('/', 1)[-1]
+                    etag = f'"page-{number}-{server.page_size}"'
+                    if server.etag and self.headers.get('If-None-Match') == etag:
+                        body = b""
+                        self.send_response(304)
+                    else:
+                        body = server.render_page(number)
+                        self.send_response(200)
+                    if server.etag:
+                        self.send_header('ETag', etag)
+                        self.send_header('Last-Modified', 'Mon, 01 Jan 2024 00:00:00 GMT')
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Клиент закрыл соединение после </title>
+                    pass
+            
+            def handle(self):
+                try:
+                    super().handle()
+                except ConnectionResetError:
+                    # Клиент закрыл keep-alive соединение между запросами
+                    pass
+            
+            def log_message(self, format, *args):
+                pass
+        
+        return Handler
+    
+    def start(self):
+        """Запуск сервера в фоновом потоке"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        """Остановка сервера"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--page-size', type=int, default=16 * 1024)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--etag', action='store_true', help='ETag/Last-Modified и ответы 304')
+    parser.add_argument('--links', type=int, default=0, help='ссылок на дочерние страницы на каждой странице')
+    args = parser.parse_args()
+    
+    server = StandInServer(port=args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                           page_size=args.page_size, error_rate=args.error_rate, etag=args.etag,
+                           links=args.links)
+    print(f"Сервер запущен: {server.base_url}/page/<n>")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Сравнение потокового извлечения заголовка с разбором BeautifulSoup
+
+Для каждой страницы из benchmarks/fixtures измеряется время извлечения
+заголовка и количество байт тела, которые нужно прочитать:
+BeautifulSoup разбирает все тело, потоковый парсер останавливается на </title>.
+
+Запуск: python benchmarks/title_benchmark.py [--repeat 200]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import STREAM_CHUNK_SIZE
+from title_extractor import stream_title, title_html_parser
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+def load_fixtures() -> dict:
+    """Загрузка тел страниц из каталога fixtures"""
+    pages = {}
+    for name in sorted(os.listdir(FIXTURES_DIR)):
+        with open(os.path.join(FIXTURES_DIR, name), 'rb') as f:
+            pages[name] = f.read()
+    return pages
+
+def chunked(content: bytes):
+    """Разбиение тела на части, как при потоковом чтении ответа"""
+    for i in range(0, len(content), STREAM_CHUNK_SIZE):
+        yield content[i:i + STREAM_CHUNK_SIZE]
+
+def measure(func, repeat: int) -> float:
+    """Среднее время одного вызова в миллисекундах"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=200, help='повторов на страницу')
+    args = parser.parse_args()
+    
+    print(f"{'страница':<26}{'bs4, мс':>10}{'поток, мс':>11}{'ускорение':>11}{'байт bs4':>10}{'байт поток':>12}  совпадение")
+    total_soup = total_stream = 0.0
+    for name, content in load_fixtures().items():
+        soup_ms = measure(lambda: title_html_parser(content), args.repeat)
+        stream_ms = measure(lambda: stream_title(chunked(content)), args.repeat)
+        streamed, read = stream_title(chunked(content))
+        same = 'да' if streamed == title_html_parser(content) else 'нет'
+        total_soup += soup_ms
+        total_stream += stream_ms
+        print(f"{name:<26}{soup_ms:>10.3f}{stream_ms:>11.3f}{soup_ms / stream_ms:>10.1f}x{len(content):>10}{read:>12}  {same}")
+    print(f"{'итого':<26}{total_soup:>10.3f}{total_stream:>11.3f}{total_soup / total_stream:>10.1f}x")
+
+if __name__ == '__main__':
+    main()
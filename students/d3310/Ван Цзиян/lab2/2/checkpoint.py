@@ -0,0 +1,256 @@
+import logging
+import threading
+import psycopg2
+import psycopg2.extras
+from config import DB_CONFIG, FRONTIER_WINDOW, CRAWL_MAX_ATTEMPTS, CRAWL_RETRY_BACKOFF
+from database import CREATE_TABLE_SQL, StatusRow
+from typing import Dict, Iterator, List, Tuple
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# URL, которые нужно обработать: еще не обработанные и ошибочные с оставшимися попытками,
+# у которых истекла пауза до повтора
+ELIGIBLE_SQL = """
+status = 'pending' OR (status = 'failed' AND attempts < %(max_attempts)s
+                       AND (next_attempt_at IS NULL OR next_attempt_at <= CURRENT_TIMESTAMP))
+"""
+
+REGISTER_SQL = "INSERT INTO crawl_urls (run_id, url) VALUES %s ON CONFLICT DO NOTHING"
+
+COUNTS_SQL = f"""
+SELECT
+    count(*) FILTER (WHERE status = 'done') AS done,
+    count(*) FILTER (WHERE {ELIGIBLE_SQL}) AS ready,
+    count(*) FILTER (WHERE status = 'failed' AND attempts < %(max_attempts)s
+                     AND next_attempt_at > CURRENT_TIMESTAMP) AS waiting,
+    count(*) FILTER (WHERE status = 'failed' AND attempts >= %(max_attempts)s) AS exhausted
+FROM crawl_urls WHERE run_id = %(run_id)s
+"""
+
+class CrawlRun:
+    """
+    Обход с сохранением прогресса в crawl_runs и crawl_urls
+    
+    URL источника записываются в crawl_urls со статусом "pending" по мере
+    выдачи Frontier (register), пакетами, поэтому источник читается потоково,
+    а не целиком при создании обхода. Режимы записывают статус каждого обработанного URL ("done" или
+    "failed") и найденные ссылки ("pending") теми же пакетами, что и строки
+    web_pages, поэтому прогресс сохраняется без отдельных запросов на URL.
+    
+    После остановки (ошибка, Ctrl+C, завершение процесса) обход продолжается
+    через --resume RUN_ID: обрабатываются URL в статусе "pending" и
+    ошибочные URL, у которых осталось меньше CRAWL_MAX_ATTEMPTS попыток и
+    истекла пауза до повтора (CRAWL_RETRY_BACKOFF, удваивается с каждой
+    попыткой), а затем источник (source) читается заново: его URL, еще не
+    попавшие в crawl_urls, регистрируются, остальные отсекаются фильтром
+    повторов. URL, выданные, но не записанные до остановки, остаются
+    "pending" и обрабатываются повторно.
+    """
+    
+    def __init__(self, run_id: int, mode: str, source: str, max_attempts: int = CRAWL_MAX_ATTEMPTS):
+        self.id = run_id
+        self.mode = mode
+        self.source = source
+        self.max_attempts = max_attempts
+        self.registered = 0
+        # Соединение для регистрации URL открывается при первой выдаче, а не до запуска процессов режима
+        self._conn = None
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _connect():
+        try:
+            return psycopg2.connect(**DB_CONFIG)
+        except psycopg2.Error as e:
+            logger.error(f"Ошибка подключения к базе данных: {e}")
+            raise RuntimeError("Не удалось подключиться к базе данных")
+    
+    @classmethod
+    def create(cls, mode: str, source: str) -> "CrawlRun":
+        """
+        Создание обхода (URL регистрируются позже, по мере выдачи)
+        
+        Args:
+            mode: Режим выполнения
+            source: Описание источника URL для crawl_runs
+            
+        Returns:
+            CrawlRun: Новый обход
+        """
+        conn = cls._connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(CREATE_TABLE_SQL)
+                cursor.execute("INSERT INTO crawl_runs (mode, source) VALUES (%s, %s) RETURNING id", (mode, source))
+                run = cls(cursor.fetchone()[0], mode, source)
+            conn.commit()
+        finally:
+            conn.close()
+        print(f"[{mode}] Обход {run.id} (продолжение после остановки: --resume {run.id})")
+        return run
+    
+    def register(self, urls: List[str]) -> int:
+        """
+        Регистрация выданных URL источника в crawl_urls одним INSERT
+        
+        Повторы отсекаются первичным ключом (run_id, url). Ошибка записи
+        не останавливает обход: статус URL все равно записывается после
+        обработки, а незарегистрированные URL источника снова читаются
+        при --resume.
+        
+        Args:
+            urls: URL из очередного пакета Frontier
+            
+        Returns:
+            int: Количество новых строк crawl_urls
+        """
+        if not urls:
+            return 0
+        with self._lock:
+            try:
+                if self._conn is None:
+                    self._conn = self._connect()
+                with self._conn.cursor() as cursor:
+                    psycopg2.extras.execute_values(cursor, REGISTER_SQL, [(self.id, url) for url in urls],
+                                                   page_size=len(urls))
+                    added = cursor.rowcount
+                self._conn.commit()
+            except (psycopg2.Error, RuntimeError) as e:
+                logger.error(f"Ошибка регистрации URL обхода {self.id}: {e}")
+                if self._conn is not None:
+                    self._conn.close()
+                    self._conn = None
+                return 0
+            self.registered += added
+            return added
+    
+    def close(self):
+        """Закрытие соединения регистрации URL"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+    
+    @classmethod
+    def resume(cls, run_id: int, mode: str) -> "CrawlRun":
+        """
+        Продолжение остановленного обхода
+        
+        Args:
+            run_id: Номер обхода в crawl_runs
+            mode: Режим выполнения (может отличаться от режима прошлого запуска)
+            
+        Returns:
+            CrawlRun: Обход с прежним номером
+        """
+        conn = cls._connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("UPDATE crawl_runs SET mode = %s, status = 'running', updated_at = CURRENT_TIMESTAMP, "
+                               "finished_at = NULL WHERE id = %s RETURNING source", (mode, run_id))
+                if cursor.rowcount != 1:
+                    raise RuntimeError(f"Обход {run_id} не найден")
+                source = cursor.fetchone()[0]
+            conn.commit()
+        finally:
+            conn.close()
+        run = cls(run_id, mode, source)
+        counts = run.counts()
+        print(f"[{mode}] Продолжение обхода {run_id}: обработано {counts['done']}, к обработке {counts['ready']}, "
+              f"ждут повтора {counts['waiting']}, попытки исчерпаны {counts['exhausted']}")
+        return run
+    
+    def counts(self) -> Dict[str, int]:
+        """Число URL обхода по состояниям: done, ready, waiting, exhausted"""
+        conn = self._connect()
+        try:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+                cursor.execute(COUNTS_SQL, {"run_id": self.id, "max_attempts": self.max_attempts})
+                return dict(cursor.fetchone())
+        finally:
+            conn.close()
+    
+    def _iter(self, query: str, batch_size: int) -> Iterator[tuple]:
+        """Потоковое чтение строк crawl_urls обхода через серверный курсор"""
+        conn = self._connect()
+        try:
+            with conn.cursor(name="crawl_run_urls") as cursor:
+                cursor.itersize = batch_size
+                cursor.execute(query, {"run_id": self.id, "max_attempts": self.max_attempts})
+                yield from cursor
+        finally:
+            conn.close()
+    
+    def urls(self, batch_size: int = FRONTIER_WINDOW) -> Iterator[Tuple[str, int]]:
+        """
+        Источник для Frontier: зарегистрированные URL, которые нужно обработать, с их глубиной
+        
+        Выборка выполняется при чтении первого URL, то есть после запуска
+        рабочих процессов режима.
+        
+        Yields:
+            Tuple[str, int]: URL и глубина
+        """
+        return self._iter(f"SELECT url, depth FROM crawl_urls WHERE run_id = %(run_id)s AND ({ELIGIBLE_SQL})",
+                          batch_size)
+    
+    def settled_urls(self, batch_size: int = FRONTIER_WINDOW) -> Iterator[str]:
+        """
+        URL, которые в этом запуске не обрабатываются: обработанные, ждущие
+        повтора и с исчерпанными попытками (для фильтра повторов Frontier,
+        чтобы ссылки на них не ставились в очередь)
+        """
+        for (url,) in self._iter(f"SELECT url FROM crawl_urls WHERE run_id = %(run_id)s AND NOT ({ELIGIBLE_SQL})",
+                                 batch_size):
+            yield url
+    
+    def rows(self, result: dict, depth: int, links: List[str]) -> List[StatusRow]:
+        """
+        Строки crawl_urls для результата URL
+        
+        Args:
+            result: Результат parse_and_save
+            depth: Глубина URL
+            links: URL, поставленные в очередь по ссылкам страницы
+            
+        Returns:
+            List[StatusRow]: Статус URL и строки "pending" для новых ссылок
+        """
+        rows = [StatusRow(self.id, link, "pending", depth + 1, 0, None, None) for link in links]
+        if result["success"]:
+            rows.append(StatusRow(self.id, result["url"], "done", depth, 1, None, None))
+        else:
+            rows.append(StatusRow(self.id, result["url"], "failed", depth, 1, result.get("error"), CRAWL_RETRY_BACKOFF))
+        return rows
+    
+    def finish(self, source_done: bool = True) -> Dict[str, int]:
+        """
+        Завершение запуска: итоговый статус обхода в crawl_runs
+        
+        Обход завершен ("finished"), если источник прочитан до конца и не
+        осталось URL к обработке и URL, ждущих повтора; иначе он остается
+        "incomplete" и может быть продолжен.
+        
+        Args:
+            source_done: Прочитан ли источник и обработаны ли все выданные URL (Frontier.finished)
+            
+        Returns:
+            Dict[str, int]: Число URL по состояниям
+        """
+        self.close()
+        counts = self.counts()
+        status = "incomplete" if counts["ready"] or counts["waiting"] or not source_done else "finished"
+        conn = self._connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("UPDATE crawl_runs SET status = %s, updated_at = CURRENT_TIMESTAMP, "
+                               "finished_at = CASE WHEN %s = 'finished' THEN CURRENT_TIMESTAMP END WHERE id = %s",
+                               (status, status, self.id))
+            conn.commit()
+        finally:
+            conn.close()
+        print(f"[{self.mode}] Обход {self.id}: {status}, обработано {counts['done']}, к обработке {counts['ready']}, "
+              f"ждут повтора {counts['waiting']}, попытки исчерпаны {counts['exhausted']}")
+        return counts
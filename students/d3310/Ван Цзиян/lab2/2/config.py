@@ -25,7 +25,107 @@ URLS = [
     'https://httpbin.org/ip'
 ]
 
+# Очередь URL (frontier): потоковое чтение источника, окно в памяти и очередь на диске
+FRONTIER_WINDOW = int(os.getenv('FRONTIER_WINDOW', '1000'))  # URL, одновременно выданных из очереди в память
+FRONTIER_DEDUP = os.getenv('FRONTIER_DEDUP', 'bloom')  # "bloom", "set" (точный, память растет с числом URL) или "none"
+FRONTIER_CAPACITY = int(os.getenv('FRONTIER_CAPACITY', '10000000'))  # ожидаемое число разных URL для фильтра Блума
+FRONTIER_ERROR_RATE = float(os.getenv('FRONTIER_ERROR_RATE', '0.001'))  # доля ложных повторов фильтра Блума
+FRONTIER_SPOOL_DIR = os.getenv('FRONTIER_SPOOL_DIR') or None  # каталог файла очереди, по умолчанию временный
+FRONTIER_POLL_INTERVAL = 0.05  # секунды ожидания, пока URL обрабатываются, а очередь пуста
+LATENCY_SAMPLE_SIZE = int(os.getenv('LATENCY_SAMPLE_SIZE', '10000'))  # задержек в выборке для перцентилей
+
+# Замеры этапов URL (DNS, соединение, первый байт, загрузка, разбор, запись) в гистограммах по режимам
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))  # порт HTTP-адреса /metrics на время обхода, 0 - без него
+METRICS_FILE = os.getenv('METRICS_FILE') or None  # файл метрик в формате Prometheus по окончании обхода
+TIMINGS_LOG = os.getenv('TIMINGS_LOG') or None  # файл строк JSON с замерами каждого URL
+
+# Обход по ссылкам: <a href> извлекаются при том же разборе, что и заголовок
+CRAWL_DEPTH = int(os.getenv('CRAWL_DEPTH', '0'))  # глубина от исходных URL, 0 - ссылки не извлекаются
+CRAWL_SCOPE = os.getenv('CRAWL_SCOPE', 'host')  # "host" - тот же хост, "domain" - тот же домен, "any" - любые
+CRAWL_MAX_LINKS = int(os.getenv('CRAWL_MAX_LINKS', '200'))  # ссылок, учитываемых на одной странице
+
+# Учет обхода в crawl_runs/crawl_urls: статус каждого URL, возобновление через --resume RUN_ID
+CRAWL_CHECKPOINT = os.getenv('CRAWL_CHECKPOINT', '1') == '1'  # только при записи в базу данных
+CRAWL_MAX_ATTEMPTS = int(os.getenv('CRAWL_MAX_ATTEMPTS', '3'))  # попыток URL до окончательной ошибки
+CRAWL_RETRY_BACKOFF = float(os.getenv('CRAWL_RETRY_BACKOFF', '60'))  # секунды до повтора после первой ошибки
+CRAWL_RETRY_BACKOFF_MAX = float(os.getenv('CRAWL_RETRY_BACKOFF_MAX', '3600'))  # предел удвоения паузы
+
 # Конфигурация конкурентности
 THREADING_WORKERS = 5
-MULTIPROCESSING_WORKERS = min(8, os.cpu_count() - 1) if os.cpu_count() else 4
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', str(THREADING_WORKERS)))  # соединений в пуле для потоков
+# Распределение URL по потокам: "dynamic" - общая очередь с чередованием хостов, "static" - равные части заранее
+THREADING_SCHEDULING = os.getenv('THREADING_SCHEDULING', 'dynamic')
+MULTIPROCESSING_WORKERS = max(1, min(8, os.cpu_count() - 1)) if os.cpu_count() else 4
+MULTIPROCESSING_BATCH_SIZE = int(os.getenv('MULTIPROCESSING_BATCH_SIZE', '0'))  # URL в одном задании процесса, 0 - автоматически
+# Кто пишет в БД: "parent" - родитель одной пакетной записью, "worker" - каждый процесс через свое соединение
+MULTIPROCESSING_DB_WRITES = os.getenv('MULTIPROCESSING_DB_WRITES', 'parent')
 ASYNC_CONCURRENCY = 10
+# Рабочих корутин асинхронного режима: больше ASYNC_CONCURRENCY, чтобы разбор и ожидание хоста не простаивали загрузки
+ASYNC_WORKERS = int(os.getenv('ASYNC_WORKERS', str(4 * ASYNC_CONCURRENCY)))
+ASYNC_DB_WRITERS = int(os.getenv('ASYNC_DB_WRITERS', '2'))  # writer-корутин и соединений asyncpg
+ASYNC_DB_QUEUE_SIZE = int(os.getenv('ASYNC_DB_QUEUE_SIZE', '1000'))  # максимальная длина очереди записи
+
+# Гибридный режим: процессы, в каждом свой цикл событий с ASYNC_CONCURRENCY загрузками
+HYBRID_WORKERS = int(os.getenv('HYBRID_WORKERS', str(MULTIPROCESSING_WORKERS)))
+HYBRID_RESULT_BATCH = int(os.getenv('HYBRID_RESULT_BATCH', '50'))  # результатов в одной передаче агрегатору
+
+# Вынос разбора HTML из цикла событий: "thread", "process" или "inline" (в цикле событий)
+PARSE_EXECUTOR = os.getenv('PARSE_EXECUTOR', 'thread')
+PARSE_EXECUTOR_WORKERS = int(os.getenv('PARSE_EXECUTOR_WORKERS', str(os.cpu_count() or 2)))
+PARSE_QUEUE_DEPTH = int(os.getenv('PARSE_QUEUE_DEPTH', str(2 * (os.cpu_count() or 2))))  # заданий разбора одновременно
+
+# HTTP-клиент синхронных режимов: "requests" - сессия на поток, "httpx" - общий клиент процесса
+HTTP_CLIENT = os.getenv('HTTP_CLIENT', 'requests')
+HTTP2 = os.getenv('HTTP2', '0') == '1'  # только для httpx, нужен пакет h2
+HTTP_POOL_HOSTS = int(os.getenv('HTTP_POOL_HOSTS', '32'))  # хостов с keep-alive соединениями в сессии
+
+# Ограничения по хостам во всех режимах: одновременные запросы и скорость с подстройкой AIMD
+HOST_LIMITS_ENABLED = os.getenv('HOST_LIMITS', '1') == '1'
+HOST_CONCURRENCY = int(os.getenv('HOST_CONCURRENCY', '4'))  # одновременных запросов к одному хосту
+HOST_RATE = float(os.getenv('HOST_RATE', '20'))  # начальная скорость, запросов/с на хост
+HOST_MIN_RATE = float(os.getenv('HOST_MIN_RATE', '0.5'))
+HOST_MAX_RATE = float(os.getenv('HOST_MAX_RATE', '100'))
+HOST_LATENCY_TARGET = float(os.getenv('HOST_LATENCY_TARGET', '2.0'))  # секунды, медленнее - снижение скорости
+AIMD_INCREASE = float(os.getenv('AIMD_INCREASE', '1.0'))  # прирост скорости, запросов/с за секунду работы
+AIMD_DECREASE = float(os.getenv('AIMD_DECREASE', '0.5'))  # множитель скорости при 429/5xx или медленном ответе
+# Значения для отдельных хостов (ключ - хост или хост:порт), остальные берутся из общих
+HOST_LIMITS = {
+    'httpbin.org': {'concurrency': 4, 'rate': 10},
+}
+
+# Таймауты HTTP-запроса: aiohttp - на весь запрос, requests и httpx - на каждое чтение из сокета
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '10'))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))  # секунды на установку соединения
+
+# Повторы после ошибок соединения, таймаутов, 5xx и 429 и автоматические выключатели по хостам
+RETRY_ATTEMPTS = int(os.getenv('RETRY_ATTEMPTS', '3'))  # попыток на URL, 1 - без повторов
+RETRY_BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', '0.5'))  # секунды, удваивается с каждой попыткой
+RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', '10'))  # наибольшая пауза без Retry-After
+RETRY_AFTER_MAX = float(os.getenv('RETRY_AFTER_MAX', '60'))  # наибольшая пауза по заголовку Retry-After
+BREAKER_THRESHOLD = int(os.getenv('BREAKER_THRESHOLD', '10'))  # неудачных попыток подряд до размыкания, 0 - без выключателя
+BREAKER_COOLDOWN = float(os.getenv('BREAKER_COOLDOWN', '30'))  # секунды до пробного запроса
+
+# Кэш условных запросов (ETag/Last-Modified): при ответе 304 заголовок берется из кэша, строка не записывается
+HTTP_CACHE_ENABLED = os.getenv('HTTP_CACHE', '1') == '1'
+HTTP_CACHE_PATH = os.getenv('HTTP_CACHE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'http_cache.sqlite3'))
+# Хэш тела ответа (blake2b) в web_pages: при совпадении с прошлым обходом разбор и запись пропускаются
+CONTENT_HASH_ENABLED = os.getenv('CONTENT_HASH', '1') == '1'
+
+# Конфигурация пакетной записи в базу данных
+DB_BATCH_SIZE = int(os.getenv('DB_BATCH_SIZE', '100'))  # 1 - запись каждой строки отдельно
+DB_FLUSH_INTERVAL = float(os.getenv('DB_FLUSH_INTERVAL', '2.0'))  # секунды
+# Запись web_pages: "upsert" - одна строка на ключ (INSERT ... ON CONFLICT DO UPDATE), "append" - новая строка каждый раз
+DB_WRITE_MODE = os.getenv('DB_WRITE_MODE', 'upsert')
+# Столбцы уникального индекса для upsert: "url" или "url,parser_type" (своя строка на каждый режим)
+DB_UNIQUE_KEY = tuple(os.getenv('DB_UNIQUE_KEY', 'url').split(','))
+
+# Потоковое извлечение заголовка: чтение ответа частями до </title>
+TITLE_STREAMING = os.getenv('TITLE_STREAMING', '1') == '1'
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', '4096'))  # байт в одной части
+STREAM_MAX_BYTES = int(os.getenv('STREAM_MAX_BYTES', str(256 * 1024)))  # максимум байт на страницу
+STREAM_DRAIN_BYTES = int(os.getenv('STREAM_DRAIN_BYTES', str(32 * 1024)))  # остаток, дочитываемый ради keep-alive
+
+# Бэкенды извлечения заголовка в порядке приоритета: selectolax, lxml, regex, html.parser
+# При ошибке или отсутствии библиотеки используется следующий бэкенд цепочки
+TITLE_BACKENDS = os.getenv('TITLE_BACKENDS', 'selectolax,lxml,html.parser').split(',')
+REGEX_MAX_BYTES = int(os.getenv('REGEX_MAX_BYTES', str(64 * 1024)))  # граница поиска для regex
@@ -0,0 +1,196 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+import async_parser
+import threading_parser
+import multiprocessing_parser
+import hybrid_parser
+from checkpoint import CrawlRun
+from config import URLS, CRAWL_CHECKPOINT
+from database import iter_table_urls
+from frontier import Frontier, iter_url_file
+from metrics import metrics
+from typing import Iterable, List, Optional
+
+try:
+    import resource
+except ImportError:
+    # На Windows модуля resource нет: CPU только текущего процесса, без пикового RSS
+    resource = None
+
+# Режимы выполнения: имя -> функция run(frontier, store) -> CrawlStats
+MODES = {
+    "async": async_parser.run,
+    "threading": threading_parser.run,
+    "multiprocessing": multiprocessing_parser.run,
+    "hybrid": hybrid_parser.run,
+}
+
+MODE_TITLES = {
+    "async": "Асинхронный парсер веб-страниц",
+    "threading": "Многопоточный парсер веб-страниц",
+    "multiprocessing": "Многопроцессный парсер веб-страниц",
+    "hybrid": "Гибридный парсер веб-страниц (процессы x asyncio)",
+}
+
+def cpu_seconds() -> float:
+    """Процессорное время (user + sys) текущего процесса и завершенных дочерних процессов"""
+    if resource is None:
+        return time.process_time()
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+def peak_rss_mb() -> Optional[float]:
+    """Пиковый RSS в МБ: максимум из текущего процесса и самого большого дочернего"""
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # Linux возвращает килобайты, macOS - байты
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def open_source(source: str, resumed: bool = False) -> Iterable[str]:
+    """
+    Источник URL по его описанию в crawl_runs.source
+    
+    Args:
+        source: "file:путь", "table:таблица.столбец" или "config.URLS"
+        resumed: Открывается ли источник продолжаемого обхода повторно
+        
+    Returns:
+        Iterable[str]: URL источника (при продолжении для stdin и удаленного файла -
+        пустой список: продолжаются только зарегистрированные URL)
+    """
+    kind, _, name = source.partition(':')
+    if kind == "file":
+        if resumed and (name == "-" or not os.path.exists(name)):
+            print(f"Источник {source} не читается повторно: продолжаются только зарегистрированные URL")
+            return []
+        return iter_url_file(name)
+    if kind == "table":
+        table, _, column = name.rpartition('.')
+        return iter_table_urls(table, column)
+    return list(URLS)
+
+def run_crawl(mode: str, urls: Iterable[str], store: bool = True, run: Optional[CrawlRun] = None) -> dict:
+    """
+    Запуск обработки в выбранном режиме с замером метрик
+    
+    URL передаются режиму через Frontier, поэтому источник
+    (список, файл, stdin, таблица) читается по мере обработки.
+    
+    Args:
+        mode: Режим выполнения из MODES
+        urls: Источник URL
+        store: Записывать ли результаты в базу данных
+        run: Обход с сохранением прогресса: сначала выдаются его URL к обработке
+            (run.urls()), затем URL источника, еще не встречавшиеся в обходе
+            
+    Returns:
+        dict: Сводка: пропускная способность, перцентили задержки по URL, CPU и RSS
+    """
+    frontier = Frontier(itertools.chain(run.urls(), urls) if run is not None else urls, checkpoint=run)
+    if run is not None:
+        frontier.mark_seen(run.settled_urls())
+    metrics.start(mode)
+    cpu_before = cpu_seconds()
+    started = time.perf_counter()
+    try:
+        stats = MODES[mode](frontier, store)
+    finally:
+        frontier.close()
+        # Гистограммы этапов в METRICS_FILE, в том числе после ошибки обхода
+        metrics.finish()
+    wall_time = time.perf_counter() - started
+    cpu_time = cpu_seconds() - cpu_before
+    frontier.report(mode)
+    metrics.report(mode)
+    counts = run.finish(frontier.finished) if run is not None else {}
+    
+    return {
+        "mode": mode,
+        "run_id": run.id if run is not None else None,
+        "run_remaining": counts.get("ready", 0) + counts.get("waiting", 0),
+        "urls": stats.total,
+        "duplicates": frontier.duplicates,
+        "successful": stats.successful,
+        "failed": stats.failed,
+        "not_modified": stats.not_modified,
+        "unchanged": stats.unchanged,
+        "changed": stats.changed,
+        "wall_time_s": wall_time,
+        "throughput_urls_per_s": stats.total / wall_time if wall_time > 0 else 0.0,
+        "latency_p50_ms": stats.percentile(50) * 1000,
+        "latency_p95_ms": stats.percentile(95) * 1000,
+        "latency_p99_ms": stats.percentile(99) * 1000,
+        "cpu_time_s": cpu_time,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def print_summary(summary: dict):
+    """Вывод сводки на экран"""
+    mode = summary["mode"]
+    print(f"[{mode}] Завершено {summary['urls']} URL, успешно {summary['successful']} "
+          f"(без изменений {summary['not_modified']}, тот же хэш {summary['unchanged']}, "
+          f"изменено {summary['changed']}), неудачно {summary['failed']}")
+    print(f"[{mode}] Общее время {summary['wall_time_s']:.2f}s, {summary['throughput_urls_per_s']:.1f} URL/с")
+    print(f"[{mode}] Задержка по URL: p50 {summary['latency_p50_ms']:.0f} мс, "
+          f"p95 {summary['latency_p95_ms']:.0f} мс, p99 {summary['latency_p99_ms']:.0f} мс")
+    rss = f"{summary['peak_rss_mb']:.1f} МБ" if summary['peak_rss_mb'] is not None else "н/д"
+    print(f"[{mode}] CPU {summary['cpu_time_s']:.2f}s, пиковый RSS {rss}")
+
+def main(argv: Optional[List[str]] = None):
+    """Единая точка входа: выбор режима выполнения из командной строки"""
+    parser = argparse.ArgumentParser(description="Парсер веб-страниц с выбором режима выполнения")
+    parser.add_argument('--mode', choices=sorted(MODES), default='async', help='режим выполнения')
+    parser.add_argument('--urls-file', help='файл со списком URL, "-" - stdin (по умолчанию config.URLS)')
+    parser.add_argument('--urls-table', help='таблица PostgreSQL со списком URL')
+    parser.add_argument('--urls-column', default='url', help='столбец с URL в --urls-table')
+    parser.add_argument('--no-db', action='store_true', help='не записывать результаты в базу данных')
+    parser.add_argument('--resume', type=int, metavar='RUN_ID',
+                        help='продолжить остановленный обход: только необработанные и ошибочные URL')
+    parser.add_argument('--json', dest='json_path', help='записать сводку в JSON-файл')
+    args = parser.parse_args(argv)
+    
+    # Источник читается потоково: список URL целиком в памяти не хранится
+    if args.urls_file:
+        source = f"file:{args.urls_file}"
+    elif args.urls_table:
+        source = f"table:{args.urls_table}.{args.urls_column}"
+    else:
+        source = "config.URLS"
+    store = not args.no_db
+    if args.resume and not store:
+        parser.error("--resume требует записи в базу данных")
+    
+    print(f"=== {MODE_TITLES[args.mode]} ===")
+    try:
+        # Прогресс обхода сохраняется в crawl_urls: при --resume источник берется из crawl_runs
+        run = None
+        if args.resume:
+            run = CrawlRun.resume(args.resume, args.mode)
+            source = run.source
+        elif store and CRAWL_CHECKPOINT:
+            run = CrawlRun.create(args.mode, source)
+        urls = open_source(source, resumed=bool(args.resume))
+        summary = run_crawl(args.mode, urls, store=store, run=run)
+    except RuntimeError as e:
+        print(f"{e}, выход из программы")
+        return
+    
+    print_summary(summary)
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    # Поддержка заморозки для Windows
+    multiprocessing.freeze_support()
+    main()
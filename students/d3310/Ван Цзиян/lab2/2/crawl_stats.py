@@ -0,0 +1,83 @@
+import math
+import random
+import threading
+from config import LATENCY_SAMPLE_SIZE
+from metrics import metrics
+from typing import Iterable, List
+
+def percentile(values: List[float], p: float) -> float:
+    """
+    Перцентиль методом ближайшего ранга
+    
+    Args:
+        values: Значения
+        p: Перцентиль от 0 до 100
+        
+    Returns:
+        float: Значение перцентиля (0.0 для пустого списка)
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+class CrawlStats:
+    """
+    Итоги обхода с постоянным расходом памяти
+    
+    Вместо списка результатов по всем URL хранятся счетчики и равномерная
+    выборка задержек (reservoir sampling) из sample_size значений: до этого
+    числа URL перцентили точные, дальше - оценка по выборке.
+    Потокобезопасна.
+    """
+    
+    def __init__(self, sample_size: int = LATENCY_SAMPLE_SIZE):
+        self.sample_size = max(1, sample_size)
+        self._lock = threading.Lock()
+        self._random = random.Random(0)
+        self.latencies: List[float] = []
+        self.total = 0
+        self.successful = 0
+        self.not_modified = 0
+        self.unchanged = 0
+    
+    def add(self, result: dict):
+        """
+        Учет результата по одному URL
+        
+        Args:
+            result: Результат parse_and_save (success, elapsed, not_modified, unchanged, timings)
+        """
+        metrics.observe_result(result)
+        with self._lock:
+            self.total += 1
+            if result["success"]:
+                self.successful += 1
+                self.not_modified += bool(result.get("not_modified"))
+                self.unchanged += bool(result.get("unchanged"))
+            if len(self.latencies) < self.sample_size:
+                self.latencies.append(result["elapsed"])
+            else:
+                index = self._random.randrange(self.total)
+                if index < self.sample_size:
+                    self.latencies[index] = result["elapsed"]
+    
+    def add_many(self, results: Iterable[dict]):
+        """Учет группы результатов"""
+        for result in results:
+            self.add(result)
+    
+    @property
+    def failed(self) -> int:
+        return self.total - self.successful
+    
+    @property
+    def changed(self) -> int:
+        """Успешные страницы, записанные в этом обходе"""
+        return self.successful - self.not_modified - self.unchanged
+    
+    def percentile(self, p: float) -> float:
+        """Перцентиль задержки по URL в секундах"""
+        with self._lock:
+            return percentile(self.latencies, p)
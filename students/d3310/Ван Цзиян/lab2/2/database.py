@@ -1,18 +1,372 @@
 import psycopg2
 import psycopg2.extras
-from config import DB_CONFIG
+import psycopg2.pool
+from psycopg2 import sql
+from config import (DB_CONFIG, DB_BATCH_SIZE, DB_FLUSH_INTERVAL, DB_POOL_SIZE, DB_WRITE_MODE, DB_UNIQUE_KEY,
+                    CONTENT_HASH_ENABLED, FRONTIER_WINDOW, CRAWL_RETRY_BACKOFF, CRAWL_RETRY_BACKOFF_MAX)
+from metrics import metrics
+from title_extractor import page_changed
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
 import logging
+import threading
+import time
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+if DB_WRITE_MODE not in ("upsert", "append"):
+    raise ValueError(f"Неизвестный DB_WRITE_MODE: {DB_WRITE_MODE}")
+if DB_UNIQUE_KEY not in (("url",), ("url", "parser_type")):
+    raise ValueError(f"Неизвестный DB_UNIQUE_KEY: {','.join(DB_UNIQUE_KEY)}")
+
+UPSERT = DB_WRITE_MODE == "upsert"
+
+# Ошибки соединения: пакет не делится на части, повтор по частям тоже не удастся
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+# Строки пакета записи: тип строки определяет таблицу, порядок полей - порядок столбцов в INSERT
+
+class PageRow(NamedTuple):
+    """Строка web_pages"""
+    url: str
+    title: str
+    parser_type: str
+    content_hash: Optional[str]
+
+class LinkRow(NamedTuple):
+    """Строка web_links: ссылка, найденная при обходе по ссылкам"""
+    source_url: str
+    target_url: str
+
+class StatusRow(NamedTuple):
+    """Строка crawl_urls: attempts прибавляется к записанному числу попыток, retry_delay - секунды до повтора"""
+    run_id: int
+    url: str
+    status: str
+    depth: int
+    attempts: int
+    last_error: Optional[str]
+    retry_delay: Optional[float]
+
+# SQL создания таблицы, общий для синхронного и асинхронного хранилищ
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS web_pages (
+    id SERIAL PRIMARY KEY,
+    url TEXT NOT NULL,
+    title TEXT NOT NULL,
+    parser_type VARCHAR(20) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    content_hash TEXT
+);
+ALTER TABLE web_pages ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE web_pages ADD COLUMN IF NOT EXISTS content_hash TEXT;
+CREATE TABLE IF NOT EXISTS web_links (
+    source_url TEXT NOT NULL,
+    target_url TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (source_url, target_url)
+);
+CREATE TABLE IF NOT EXISTS crawl_runs (
+    id SERIAL PRIMARY KEY,
+    mode VARCHAR(20) NOT NULL,
+    source TEXT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'running',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS crawl_urls (
+    run_id INTEGER NOT NULL REFERENCES crawl_runs (id) ON DELETE CASCADE,
+    url TEXT NOT NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'pending',
+    depth INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    next_attempt_at TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (run_id, url)
+);
+"""
+
+# Ссылка записывается один раз: повторный обход не дублирует ребра
+INSERT_LINKS_SQL = "INSERT INTO web_links (source_url, target_url) VALUES %s ON CONFLICT DO NOTHING"
+
+# Обновление статуса URL: строка "pending" (найденная ссылка) не меняет статус уже известного URL,
+# а после ошибки пауза до повтора удваивается с каждой попыткой
+STATUS_UPDATE_SQL = f"""
+ON CONFLICT (run_id, url) DO UPDATE SET
+    status = CASE WHEN EXCLUDED.status = 'pending' THEN crawl_urls.status ELSE EXCLUDED.status END,
+    attempts = crawl_urls.attempts + EXCLUDED.attempts,
+    last_error = CASE WHEN EXCLUDED.status = 'pending' THEN crawl_urls.last_error ELSE EXCLUDED.last_error END,
+    next_attempt_at = CASE
+        WHEN EXCLUDED.status = 'pending' THEN crawl_urls.next_attempt_at
+        WHEN EXCLUDED.status = 'failed' THEN CURRENT_TIMESTAMP + make_interval(
+            secs => LEAST({CRAWL_RETRY_BACKOFF_MAX}, {CRAWL_RETRY_BACKOFF} * power(2, crawl_urls.attempts)))
+    END,
+    updated_at = CURRENT_TIMESTAMP
+"""
+INSERT_STATUS_SQL = ("INSERT INTO crawl_urls (run_id, url, status, depth, attempts, last_error, next_attempt_at) "
+                     "VALUES %s" + STATUS_UPDATE_SQL)
+STATUS_TEMPLATE = "(%s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP + make_interval(secs => %s))"
+
+# Уникальный индекс по DB_UNIQUE_KEY, на который опирается ON CONFLICT
+UNIQUE_INDEX_NAME = "web_pages_" + "_".join(DB_UNIQUE_KEY) + "_key"
+UNIQUE_COLUMNS = ", ".join(DB_UNIQUE_KEY)
+INDEX_EXISTS_SQL = f"SELECT to_regclass('{UNIQUE_INDEX_NAME}') IS NOT NULL"
+
+# Разовая миграция: удаление дубликатов (остается последняя строка ключа) и создание индекса.
+# Блокировка таблицы не дает другому процессу вставить дубликат между DELETE и CREATE INDEX
+MIGRATE_SQL = [
+    "LOCK TABLE web_pages IN SHARE ROW EXCLUSIVE MODE",
+    f"""
+    DELETE FROM web_pages WHERE id IN (
+        SELECT id FROM (
+            SELECT id, row_number() OVER (PARTITION BY {UNIQUE_COLUMNS} ORDER BY id DESC) AS rn
+            FROM web_pages
+        ) ranked WHERE rn > 1
+    )
+    """,
+    f"CREATE UNIQUE INDEX IF NOT EXISTS {UNIQUE_INDEX_NAME} ON web_pages ({UNIQUE_COLUMNS})",
+]
+
+# Уникальные индексы, которые мешают текущему режиму: индекс другого ключа
+# при смене DB_UNIQUE_KEY и оба индекса в режиме append
+UNIQUE_INDEX_NAMES = ("web_pages_url_key", "web_pages_url_parser_type_key")
+STALE_INDEX_NAMES = [name for name in UNIQUE_INDEX_NAMES if not (UPSERT and name == UNIQUE_INDEX_NAME)]
+# Какие из них есть в каталоге: при обычном запуске ни одного, и таблица не блокируется
+STALE_INDEXES_SQL = ("SELECT name FROM unnest(ARRAY[" + ", ".join(f"'{name}'" for name in STALE_INDEX_NAMES)
+                     + "]::text[]) AS name WHERE to_regclass(name) IS NOT NULL")
+
+
+def drop_index_sql(name: str) -> str:
+    """Удаление индекса из UNIQUE_INDEX_NAMES (имена заданы в коде, а не во вводе)"""
+    return f"DROP INDEX IF EXISTS {name}"
+
+# Обновляемые при конфликте столбцы: все, кроме ключа
+UPSERT_SET_SQL = ", ".join(
+    [f"{column} = EXCLUDED.{column}" for column in ("title", "parser_type", "content_hash")
+     if column not in DB_UNIQUE_KEY]
+    + ["updated_at = CURRENT_TIMESTAMP"]
+)
+ON_CONFLICT_SQL = f" ON CONFLICT ({UNIQUE_COLUMNS}) DO UPDATE SET {UPSERT_SET_SQL}" if UPSERT else ""
+
+# Последние хэш и заголовок по каждому URL; при ключе с parser_type - только строки своего режима
+STORED_PAGES_SQL = """
+SELECT DISTINCT ON (url) url, content_hash, title FROM web_pages
+WHERE url = ANY({urls}) AND content_hash IS NOT NULL{parser_filter}
+ORDER BY url, id DESC
+"""
+
+STORED_BY_PARSER = "parser_type" in DB_UNIQUE_KEY
+
+def stored_pages_sql(urls_param: str, parser_param: str) -> str:
+    """
+    Запрос прошлых хэшей страниц с плейсхолдерами драйвера
+    
+    Args:
+        urls_param: Плейсхолдер массива URL (%s для psycopg2, $1::text[] для asyncpg)
+        parser_param: Плейсхолдер типа парсера
+    """
+    parser_filter = f" AND parser_type = {parser_param}" if STORED_BY_PARSER else ""
+    return STORED_PAGES_SQL.format(urls=urls_param, parser_filter=parser_filter)
+
+def link_rows(url: str, links: List[str]) -> List[LinkRow]:
+    """Строки web_links для ссылок страницы"""
+    return [LinkRow(url, target) for target in links]
+
+def result_rows(result: dict, parser_type: str) -> List[tuple]:
+    """
+    Строки web_pages (если страница изменилась) и web_links успешного результата
+    
+    Режимы добавляют их в writer одной группой вместе со статусом URL,
+    поэтому они попадают в один пакет и одну транзакцию.
+    """
+    if not result["success"]:
+        return []
+    rows: List[tuple] = []
+    if page_changed(result):
+        rows.append(PageRow(result["url"], result["title"], parser_type, result["content_hash"]))
+    rows.extend(link_rows(result["url"], result["links"]))
+    return rows
+
+def split_rows(rows: List[tuple]) -> Tuple[List[PageRow], List[LinkRow], List[StatusRow]]:
+    """Разделение пакета writer на строки web_pages, web_links и crawl_urls по типу строки"""
+    pages, links, statuses = [], [], []
+    by_type = {PageRow: pages, LinkRow: links, StatusRow: statuses}
+    for row in rows:
+        target = by_type.get(type(row))
+        if target is None:
+            raise TypeError(f"Неизвестная строка пакета записи: {row!r}")
+        target.append(row)
+    return pages, links, unique_statuses(statuses)
+
+def row_url(row: tuple) -> str:
+    """URL, к которому относится строка пакета: страница, источник ссылки или URL статуса"""
+    return row.source_url if type(row) is LinkRow else row.url
+
+def url_groups(rows: List[tuple]) -> List[List[tuple]]:
+    """
+    Строки пакета, сгруппированные по URL (row_url) в порядке пакета
+    
+    Группа - наименьшая часть пакета при повторе записи по частям: строка
+    страницы, ее ссылки и статус URL записываются или отбрасываются вместе.
+    """
+    groups: Dict[str, List[tuple]] = {}
+    for row in rows:
+        groups.setdefault(row_url(row), []).append(row)
+    return list(groups.values())
+
+def bisect_groups(groups: List[List[tuple]]) -> Tuple[List[List[tuple]], List[List[tuple]]]:
+    """Деление групп пакета пополам для повтора записи по частям"""
+    middle = len(groups) // 2
+    return groups[:middle], groups[middle:]
+
+def committed_results(results: List[dict], failed: List[tuple]) -> List[dict]:
+    """Результаты пакета без URL, строки которых не записаны (для on_commit writer)"""
+    failed_urls = {row_url(row) for row in failed}
+    return [result for result in results if result["url"] not in failed_urls]
+
+def unique_links(rows: List[LinkRow]) -> List[LinkRow]:
+    """Ссылки пакета без повторов, по порядку ключа (как unique_rows, против взаимных блокировок)"""
+    return sorted(set(rows))
+
+def unique_statuses(rows: List[StatusRow]) -> List[StatusRow]:
+    """
+    Одна строка статуса на URL в пакете (ON CONFLICT не обновляет строку дважды)
+    
+    Итоговый статус URL важнее строки "pending" той же ссылки, найденной на другой странице.
+    """
+    latest = {}
+    for row in rows:
+        key = (row.run_id, row.url)
+        if key not in latest or row.status != "pending" or latest[key].status == "pending":
+            latest[key] = row
+    return [latest[key] for key in sorted(latest)]
+
+def unique_rows(rows: List[PageRow]) -> List[PageRow]:
+    """
+    Подготовка пакета к upsert
+    
+    Один INSERT ... ON CONFLICT DO UPDATE не может обновить строку дважды,
+    поэтому из повторов ключа в пакете остается последний. Строки
+    сортируются по ключу, чтобы параллельные пакеты блокировали строки
+    в одном порядке и не попадали во взаимную блокировку.
+    
+    Args:
+        rows: Список кортежей (url, title, parser_type, content_hash)
+        
+    Returns:
+        List[PageRow]: Строки с уникальным ключом
+    """
+    if not UPSERT:
+        return rows
+    by_parser = "parser_type" in DB_UNIQUE_KEY
+    latest = {(row.url, row.parser_type if by_parser else ""): row for row in rows}
+    return [latest[key] for key in sorted(latest)]
+
+def iter_table_urls(table: str, column: str = "url", batch_size: int = FRONTIER_WINDOW) -> Iterator[str]:
+    """
+    Потоковое чтение URL из таблицы через серверный курсор
+    
+    Строки передаются с сервера частями по batch_size, поэтому
+    в памяти не бывает всей таблицы. Соединение открывается при
+    чтении первого URL и закрывается после последнего.
+    
+    Args:
+        table: Таблица (можно со схемой: schema.table)
+        column: Столбец с URL
+        batch_size: Строк в одной передаче с сервера
+        
+    Yields:
+        str: URL
+    """
+    query = sql.SQL("SELECT {} FROM {}").format(sql.Identifier(column), sql.Identifier(*table.split('.')))
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        with conn.cursor(name="frontier_urls") as cursor:
+            cursor.itersize = batch_size
+            cursor.execute(query)
+            for (url,) in cursor:
+                if url:
+                    yield url
+    finally:
+        conn.close()
+
+class WriteStats:
+    """Потокобезопасная статистика пакетной записи"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started_at = time.monotonic()
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.flush_count = 0
+        self.flush_time = 0.0
+        self.max_flush_latency = 0.0
+    
+    def record(self, rows: int, latency: float, failed: int = 0):
+        """
+        Учет одного сброса пакета
+        
+        Args:
+            rows: Количество строк в пакете
+            latency: Длительность сброса в секундах
+            failed: Количество строк пакета, которые не удалось записать
+        """
+        metrics.observe("db_write", latency)
+        with self._lock:
+            self.flush_count += 1
+            self.flush_time += latency
+            self.max_flush_latency = max(self.max_flush_latency, latency)
+            self.rows_written += rows - failed
+            self.rows_failed += failed
+    
+    def as_dict(self) -> dict:
+        """
+        Статистика записи
+        
+        Returns:
+            dict: Количество строк, скорость записи и задержка сброса
+        """
+        elapsed = time.monotonic() - self._started_at
+        return {
+            "rows_written": self.rows_written,
+            "rows_failed": self.rows_failed,
+            "flushes": self.flush_count,
+            "rows_per_sec": self.rows_written / elapsed if elapsed > 0 else 0.0,
+            "flush_rows_per_sec": self.rows_written / self.flush_time if self.flush_time > 0 else 0.0,
+            "avg_flush_latency_ms": self.flush_time / self.flush_count * 1000 if self.flush_count else 0.0,
+            "max_flush_latency_ms": self.max_flush_latency * 1000,
+        }
+    
+    def report(self, prefix: str):
+        """Вывод статистики записи на экран"""
+        s = self.as_dict()
+        print(f"[{prefix}] Записано строк {s['rows_written']}, ошибок {s['rows_failed']}, сбросов {s['flushes']}")
+        print(f"[{prefix}] Скорость записи {s['rows_per_sec']:.1f} строк/с "
+              f"({s['flush_rows_per_sec']:.1f} строк/с во время сброса)")
+        print(f"[{prefix}] Задержка сброса: средняя {s['avg_flush_latency_ms']:.1f} мс, "
+              f"максимальная {s['max_flush_latency_ms']:.1f} мс")
+
 class DatabaseManager:
     """Менеджер базы данных для работы с PostgreSQL"""
     
     def __init__(self):
         self.connection = None
         self.cursor = None
+        self.pool = None
+        # Свободные соединения пула: getconn не ждет, а бросает PoolError при исчерпании
+        self._pool_slots = None
+        # Одно соединение нельзя использовать из нескольких потоков одновременно
+        self._lock = threading.Lock()
+    
+    @property
+    def pooled(self) -> bool:
+        """Работает ли менеджер в режиме пула соединений"""
+        return self.pool is not None
     
     def connect(self) -> bool:
         """
@@ -30,25 +384,156 @@ class DatabaseManager:
             logger.error(f"Ошибка подключения к базе данных: {e}")
             return False
     
+    def connect_pool(self, minconn: int = 1, maxconn: int = DB_POOL_SIZE) -> bool:
+        """
+        Подключение к базе данных через потокобезопасный пул соединений
+        
+        Каждый поток получает из пула собственное соединение на время
+        операции, поэтому запись из разных потоков идет параллельно, а ошибка
+        в одном потоке не прерывает транзакции остальных. Если все maxconn
+        соединений заняты (сбросы потоков, таймер writer и чтение хэшей),
+        поток ждет освобождения соединения, а не получает ошибку.
+        
+        Args:
+            minconn: Минимальное количество открытых соединений
+            maxconn: Максимальное количество соединений в пуле
+            
+        Returns:
+            bool: Успешность подключения
+        """
+        try:
+            self.pool = psycopg2.pool.ThreadedConnectionPool(minconn, maxconn, **DB_CONFIG)
+            self._pool_slots = threading.BoundedSemaphore(maxconn)
+            logger.info(f"Пул соединений с базой данных создан (до {maxconn} соединений)")
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка создания пула соединений: {e}")
+            return False
+    
+    @contextmanager
+    def get_connection(self):
+        """
+        Получение соединения для одной операции
+        
+        В режиме пула соединение берется из пула (с ожиданием свободного)
+        и возвращается обратно, иначе используется единственное соединение
+        под блокировкой.
+        """
+        if self.pool is not None:
+            with self._pool_slots:
+                conn = self.pool.getconn()
+                try:
+                    yield conn
+                except Exception:
+                    conn.rollback()
+                    raise
+                finally:
+                    self.pool.putconn(conn)
+        else:
+            with self._lock:
+                try:
+                    yield self.connection
+                except Exception:
+                    self.connection.rollback()
+                    raise
+    
     def create_table(self):
         """Создание таблицы для хранения данных веб-страниц"""
         try:
-            create_table_sql = """
-            CREATE TABLE IF NOT EXISTS web_pages (
-                id SERIAL PRIMARY KEY,
-                url TEXT NOT NULL,
-                title TEXT NOT NULL,
-                parser_type VARCHAR(20) NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-            """
-            self.cursor.execute(create_table_sql)
-            self.connection.commit()
+            with self.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(CREATE_TABLE_SQL)
+                conn.commit()
             logger.info("Таблица данных создана успешно")
         except Exception as e:
             logger.error(f"Ошибка создания таблицы: {e}")
+            return
+        self.drop_stale_indexes()
+        if UPSERT:
+            self.migrate_unique_index()
     
-    def save_page_data(self, url: str, title: str, parser_type: str) -> bool:
+    def drop_stale_indexes(self) -> List[str]:
+        """
+        Удаление уникальных индексов, которые мешают текущему режиму записи
+        
+        Выполняется только при смене DB_UNIQUE_KEY или переходе в режим append:
+        сначала каталог проверяется на наличие таких индексов, и если их нет,
+        ничего не удаляется.
+        
+        Returns:
+            List[str]: Имена удаленных индексов
+        """
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(STALE_INDEXES_SQL)
+                    names = [row[0] for row in cursor.fetchall()]
+                    for name in names:
+                        cursor.execute(drop_index_sql(name))
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Ошибка удаления индексов web_pages: {e}")
+            return []
+        if names:
+            logger.warning(f"Удалены уникальные индексы прежнего режима записи: {', '.join(names)}")
+        return names
+    
+    def migrate_unique_index(self) -> int:
+        """
+        Разовая миграция к уникальному индексу по DB_UNIQUE_KEY
+        
+        Если индекса еще нет, в одной транзакции удаляются дубликаты
+        (для каждого ключа остается строка с наибольшим id) и создается
+        индекс. При следующих запусках индекс уже есть, и таблица
+        не просматривается.
+        
+        Returns:
+            int: Количество удаленных дубликатов
+        """
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(INDEX_EXISTS_SQL)
+                    if cursor.fetchone()[0]:
+                        conn.rollback()
+                        return 0
+                    cursor.execute(MIGRATE_SQL[0])
+                    cursor.execute(MIGRATE_SQL[1])
+                    deleted = cursor.rowcount
+                    cursor.execute(MIGRATE_SQL[2])
+                conn.commit()
+            logger.info(f"Создан индекс {UNIQUE_INDEX_NAME}, удалено дубликатов: {deleted}")
+            return deleted
+        except Exception as e:
+            logger.error(f"Ошибка миграции web_pages: {e}")
+            return 0
+    
+    def stored_pages(self, urls: List[str], parser_type: str) -> Dict[str, dict]:
+        """
+        Хэши и заголовки страниц, записанные прошлыми обходами
+        
+        Args:
+            urls: URL текущего обхода
+            parser_type: Тип парсера
+            
+        Returns:
+            Dict[str, dict]: URL -> {"content_hash", "title"}
+        """
+        if not CONTENT_HASH_ENABLED or not urls:
+            return {}
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    params = (list(urls), parser_type) if STORED_BY_PARSER else (list(urls),)
+                    cursor.execute(stored_pages_sql("%s", "%s"), params)
+                    rows = cursor.fetchall()
+                conn.rollback()
+            return {url: {"content_hash": digest, "title": title} for url, digest, title in rows}
+        except Exception as e:
+            logger.error(f"Ошибка чтения хэшей страниц: {e}")
+            return {}
+    
+    def save_page_data(self, url: str, title: str, parser_type: str, content_hash: Optional[str] = None) -> bool:
         """
         Сохранение данных веб-страницы в базу данных
         
@@ -56,29 +541,261 @@ class DatabaseManager:
             url: URL веб-страницы
             title: Заголовок страницы
             parser_type: Тип парсера (async/threading/multiprocessing)
+            content_hash: Хэш тела ответа
             
         Returns:
             bool: Успешность сохранения
         """
         try:
-            insert_sql = """
-            INSERT INTO web_pages (url, title, parser_type)
-            VALUES (%s, %s, %s);
+            insert_sql = f"""
+            INSERT INTO web_pages (url, title, parser_type, content_hash)
+            VALUES (%s, %s, %s, %s){ON_CONFLICT_SQL};
             """
-            self.cursor.execute(insert_sql, (url, title, parser_type))
-            self.connection.commit()
+            with self.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(insert_sql, (url, title, parser_type, content_hash))
+                conn.commit()
             return True
         except Exception as e:
             logger.error(f"Ошибка сохранения данных: {e}")
             return False
     
+    def _insert_rows(self, rows: List[tuple]):
+        """Запись строк одним многострочным INSERT на таблицу и одним commit (при ошибке - исключение)"""
+        pages, links, statuses = split_rows(rows)
+        pages = unique_rows(pages)
+        insert_sql = "INSERT INTO web_pages (url, title, parser_type, content_hash) VALUES %s" + ON_CONFLICT_SQL
+        with self.get_connection() as conn:
+            with conn.cursor() as cursor:
+                if pages:
+                    psycopg2.extras.execute_values(cursor, insert_sql, pages, page_size=len(pages))
+                if links:
+                    links = unique_links(links)
+                    psycopg2.extras.execute_values(cursor, INSERT_LINKS_SQL, links, page_size=len(links))
+                if statuses:
+                    psycopg2.extras.execute_values(cursor, INSERT_STATUS_SQL, statuses,
+                                                   template=STATUS_TEMPLATE, page_size=len(statuses))
+            conn.commit()
+    
+    def _save_groups(self, groups: List[List[tuple]]) -> List[tuple]:
+        """
+        Запись групп строк одной транзакцией, при ошибке - по половинам
+        
+        Returns:
+            List[tuple]: Строки, которые не удалось записать
+        """
+        rows = [row for group in groups for row in group]
+        try:
+            self._insert_rows(rows)
+            return []
+        except CONNECTION_ERRORS as e:
+            logger.error(f"Ошибка пакетного сохранения данных: {e}")
+            return rows
+        except Exception as e:
+            if len(groups) == 1:
+                logger.error(f"Строки URL {row_url(rows[0])} не записаны: {e}")
+                return rows
+        first, second = bisect_groups(groups)
+        return self._save_groups(first) + self._save_groups(second)
+    
+    def save_many(self, rows: List[tuple]) -> List[tuple]:
+        """
+        Сохранение группы строк одним многострочным INSERT и одним commit
+        
+        В режиме upsert строки с существующим ключом обновляются.
+        Ссылки и статусы URL из того же пакета записываются в web_links и
+        crawl_urls в той же транзакции, поэтому URL не отмечается обработанным
+        раньше, чем записана его строка. Если пакет не записался из-за
+        данных (например, NUL в заголовке), он повторяется по половинам,
+        пока не останутся строки отдельных URL: теряются только строки URL
+        с ошибкой, а его статус остается прежним и URL обрабатывается снова.
+        
+        Args:
+            rows: Список кортежей PageRow, LinkRow и StatusRow
+            
+        Returns:
+            List[tuple]: Строки, которые не удалось записать (пустой список - записаны все)
+        """
+        if not rows:
+            return []
+        return self._save_groups(url_groups(rows))
+    
     def close(self):
         """Закрытие соединения с базой данных"""
+        if self.pool is not None:
+            self.pool.closeall()
+            self.pool = None
+            self._pool_slots = None
+            logger.info("Пул соединений с базой данных закрыт")
         if self.cursor:
             self.cursor.close()
         if self.connection:
             self.connection.close()
             logger.info("Соединение с базой данных закрыто")
 
+class BatchWriter:
+    """
+    Буферизованная запись строк web_pages (и web_links) пакетами
+    
+    Строки накапливаются в памяти и сбрасываются одним многострочным INSERT,
+    когда буфер достигает batch_size, когда с последнего сброса прошло
+    flush_interval секунд, или при закрытии writer в конце работы.
+    Результаты, добавленные вместе со строками, после commit пакета
+    передаются в on_commit (кроме URL, строки которых не записаны).
+    """
+    
+    def __init__(self, manager: DatabaseManager, batch_size: int = DB_BATCH_SIZE,
+                 flush_interval: float = DB_FLUSH_INTERVAL,
+                 on_commit: Optional[Callable[[List[dict]], None]] = None):
+        self.manager = manager
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.on_commit = on_commit
+        self._rows: List[tuple] = []
+        self._results: List[dict] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._timer_thread = None
+        self._last_flush = time.monotonic()
+        self.write_stats = WriteStats()
+    
+    def start(self):
+        """Запуск фонового потока, сбрасывающего буфер по времени"""
+        if self.flush_interval > 0 and self._timer_thread is None:
+            self._timer_thread = threading.Thread(target=self._timer_loop, daemon=True)
+            self._timer_thread.start()
+        return self
+    
+    def _timer_loop(self):
+        """Периодическая проверка времени с последнего сброса"""
+        while not self._stop_event.wait(self.flush_interval / 2):
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self.flush()
+    
+    def add(self, url: str, title: str, parser_type: str, content_hash: Optional[str] = None):
+        """
+        Добавление строки в буфер
+        
+        Args:
+            url: URL веб-страницы
+            title: Заголовок страницы
+            parser_type: Тип парсера (async/threading/multiprocessing)
+            content_hash: Хэш тела ответа
+        """
+        with self._lock:
+            self._rows.append(PageRow(url, title, parser_type, content_hash))
+            full = len(self._rows) >= self.batch_size
+        if full:
+            self.flush()
+    
+    def add_many(self, rows: List[tuple], results: Sequence[dict] = ()):
+        """
+        Добавление группы строк (PageRow, LinkRow или StatusRow) в буфер
+        
+        Args:
+            rows: Строки группы
+            results: Результаты по URL группы для on_commit
+        """
+        with self._lock:
+            self._rows.extend(rows)
+            self._results.extend(results)
+            full = len(self._rows) >= self.batch_size
+        if full:
+            self.flush()
+    
+    def add_links(self, url: str, links: List[str]):
+        """
+        Добавление ссылок страницы в буфер
+        
+        Args:
+            url: URL страницы
+            links: Нормализованные ссылки страницы
+        """
+        if links:
+            self.add_many(link_rows(url, links))
+    
+    def flush(self) -> bool:
+        """
+        Сброс накопленных строк в базу данных
+        
+        Returns:
+            bool: Записаны ли все строки пакета
+        """
+        # С одним соединением одновременно выполняется только один сброс,
+        # в режиме пула каждый поток сбрасывает свой пакет через свое соединение
+        flush_guard = nullcontext() if self.manager.pooled else self._flush_lock
+        with flush_guard:
+            with self._lock:
+                rows, self._rows = self._rows, []
+                results, self._results = self._results, []
+                self._last_flush = time.monotonic()
+            
+            failed = []
+            if rows:
+                flush_start = time.perf_counter()
+                failed = self.manager.save_many(rows)
+                latency = time.perf_counter() - flush_start
+                
+                self.write_stats.record(len(rows), latency, len(failed))
+                logger.info(f"Сброс пакета: {len(rows)} строк за {latency * 1000:.1f} мс")
+            if self.on_commit is not None and results:
+                committed = committed_results(results, failed)
+                if committed:
+                    self.on_commit(committed)
+            return not failed
+    
+    def close(self) -> bool:
+        """Остановка фонового потока и финальный сброс буфера"""
+        self._stop_event.set()
+        if self._timer_thread is not None:
+            self._timer_thread.join()
+            self._timer_thread = None
+        return self.flush()
+    
+    def stats(self) -> dict:
+        """Статистика записи: строки, скорость и задержка сброса"""
+        return self.write_stats.as_dict()
+    
+    def report(self, prefix: str):
+        """Вывод статистики записи на экран"""
+        self.write_stats.report(prefix)
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+class NullWriter:
+    """Writer с интерфейсом BatchWriter, который ничего не записывает (прогон без базы данных)"""
+    
+    def __init__(self):
+        self.write_stats = WriteStats()
+    
+    def start(self):
+        return self
+    
+    def add(self, url: str, title: str, parser_type: str, content_hash: Optional[str] = None):
+        pass
+    
+    def add_many(self, rows: List[tuple], results: Sequence[dict] = ()):
+        pass
+    
+    def add_links(self, url: str, links: List[str]):
+        pass
+    
+    def flush(self) -> bool:
+        return True
+    
+    def close(self) -> bool:
+        return True
+    
+    def stats(self) -> dict:
+        return self.write_stats.as_dict()
+    
+    def report(self, prefix: str):
+        pass
+
 # Создание глобального экземпляра менеджера базы данных
 db_manager = DatabaseManager()
@@ -0,0 +1,355 @@
+import hashlib
+import logging
+import math
+import os
+import sys
+import tempfile
+import threading
+from collections import deque
+from config import (FRONTIER_WINDOW, FRONTIER_DEDUP, FRONTIER_CAPACITY, FRONTIER_ERROR_RATE,
+                    FRONTIER_SPOOL_DIR, CRAWL_DEPTH)
+from links import in_scope
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+def iter_url_file(path: str) -> Iterator[str]:
+    """
+    Потоковое чтение URL из файла или stdin (путь "-")
+    
+    Файл читается построчно, в памяти только текущая строка.
+    Пустые строки и строки, начинающиеся с #, пропускаются.
+    
+    Args:
+        path: Путь к файлу или "-"
+        
+    Yields:
+        str: URL
+    """
+    f = sys.stdin if path == '-' else open(path, encoding='utf-8')
+    try:
+        for line in f:
+            url = line.strip()
+            if url and not url.startswith('#'):
+                yield url
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+class BloomFilter:
+    """
+    Фильтр Блума для проверки уже встречавшихся URL
+    
+    Размер битового массива рассчитывается по ожидаемому числу URL и
+    допустимой доле ложных срабатываний и не растет с числом добавленных
+    URL: 10 млн URL при доле 0.001 занимают около 18 МБ. Ложное срабатывание
+    означает, что новый URL будет принят за повтор и пропущен.
+    """
+    
+    def __init__(self, capacity: int = FRONTIER_CAPACITY, error_rate: float = FRONTIER_ERROR_RATE):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+    
+    def _positions(self, item: str) -> List[int]:
+        # Двойное хэширование: k позиций из двух 64-битных половин одного хэша
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+    
+    def add(self, item: str) -> bool:
+        """
+        Добавление элемента
+        
+        Returns:
+            bool: True, если элемент раньше не встречался
+        """
+        new = False
+        for position in self._positions(item):
+            byte, bit = divmod(position, 8)
+            if not self.bits[byte] & (1 << bit):
+                self.bits[byte] |= 1 << bit
+                new = True
+        return new
+
+class SeenSet:
+    """Точная проверка повторов по 8-байтовым хэшам URL (память растет с числом URL)"""
+    
+    def __init__(self):
+        self._seen = set()
+    
+    def add(self, item: str) -> bool:
+        key = hashlib.blake2b(item.encode('utf-8'), digest_size=8).digest()
+        if key in self._seen:
+            return False
+        self._seen.add(key)
+        return True
+
+class NoDedup:
+    """Проверка повторов отключена"""
+    
+    def add(self, item: str) -> bool:
+        return True
+
+def seen_filter(kind: str = FRONTIER_DEDUP):
+    """
+    Фильтр повторов по названию из FRONTIER_DEDUP
+    
+    Args:
+        kind: "bloom", "set" или "none"
+    """
+    filters = {"bloom": BloomFilter, "set": SeenSet, "none": NoDedup}
+    if kind not in filters:
+        raise ValueError(f"Неизвестный FRONTIER_DEDUP: {kind}")
+    return filters[kind]()
+
+class DiskQueue:
+    """
+    FIFO-очередь строк в файле на диске
+    
+    Строки дописываются в конец файла и читаются отдельным дескриптором
+    с начала. Когда читатель догоняет писателя, файл обрезается, поэтому
+    его размер ограничен текущим числом ожидающих строк.
+    """
+    
+    def __init__(self, directory: Optional[str] = FRONTIER_SPOOL_DIR):
+        fd, self.path = tempfile.mkstemp(prefix='frontier-', suffix='.queue', dir=directory)
+        self._writer = os.fdopen(fd, 'ab')
+        self._reader = open(self.path, 'rb')
+        self.size = 0
+    
+    def put_many(self, items: Iterable[str]) -> int:
+        """Добавление строк в конец очереди, возвращает их количество"""
+        data = [item.encode('utf-8') + b'\n' for item in items]
+        if data:
+            self._writer.writelines(data)
+            self._writer.flush()
+            self.size += len(data)
+        return len(data)
+    
+    def get_many(self, count: int) -> List[str]:
+        """Чтение до count строк из начала очереди"""
+        items = []
+        while len(items) < count and self.size:
+            items.append(self._reader.readline().rstrip(b'\n').decode('utf-8'))
+            self.size -= 1
+        if not self.size:
+            # Очередь пуста: файл обрезается, чтение и запись начинаются заново
+            # (дескриптор mkstemp открыт без O_APPEND, поэтому позиция записи сбрасывается явно)
+            self._writer.truncate(0)
+            self._writer.seek(0)
+            self._reader.seek(0)
+        return items
+    
+    def close(self):
+        """Закрытие и удаление файла очереди"""
+        self._reader.close()
+        self._writer.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+class Frontier:
+    """
+    Очередь URL для всех режимов с постоянным расходом памяти
+    
+    URL читаются из источника (файл, stdin, таблица) лениво: только когда
+    рабочим нужны новые URL, поэтому источник не обгоняет обработку.
+    В памяти держится не больше window выданных, но не обработанных URL.
+    Повторы отсекаются фильтром Блума (FRONTIER_DEDUP). URL, добавленные
+    во время обхода через add, ждут своей очереди в файле на диске.
+    
+    При обходе по ссылкам (max_depth > 0) ссылки обработанной страницы
+    передаются в complete и ставятся в очередь с глубиной на единицу
+    больше, пока не достигнута max_depth. Глубина хранится в файле очереди
+    вместе с URL и в памяти только для выданных URL. Исходные URL имеют
+    глубину 0, если источник не выдает пары (url, depth).
+    
+    С checkpoint (CrawlRun) новые URL источника регистрируются в crawl_urls
+    пакетом при выдаче (get_batch), а complete возвращает строки статусов
+    crawl_urls, которые режим записывает вместе со строками страниц.
+    
+    Потокобезопасна: URL выдаются рабочим потокам или процессу-распределителю
+    через get_batch/get, а обработка отмечается через done. Обход завершен,
+    когда источник исчерпан, очередь пуста и все выданные URL обработаны.
+    """
+    
+    def __init__(self, source: Iterable[Union[str, Tuple[str, int]]], window: int = FRONTIER_WINDOW,
+                 dedup: str = FRONTIER_DEDUP, max_depth: int = CRAWL_DEPTH, checkpoint=None):
+        self._source = iter(source)
+        self.checkpoint = checkpoint
+        self._exhausted = False
+        self.window = max(1, window)
+        self.max_depth = max(0, max_depth)
+        self._seen = seen_filter(dedup)
+        self._spool: Optional[DiskQueue] = None
+        self._ready = deque()
+        self._unregistered: List[str] = []  # URL источника, еще не записанные в crawl_urls
+        self._depths: Dict[str, int] = {}
+        self._in_flight = 0
+        self._condition = threading.Condition()
+        
+        # Статистика
+        self.read = 0
+        self.duplicates = 0
+        self.spooled = 0
+        self.issued = 0
+    
+    def add(self, urls: Iterable[str], depth: int = 0) -> int:
+        """
+        Добавление URL в очередь на диске с отсевом повторов
+        
+        Args:
+            urls: Новые URL
+            depth: Глубина URL от исходных
+            
+        Returns:
+            int: Количество добавленных URL
+        """
+        return len(self._add(urls, depth))
+    
+    def _add(self, urls: Iterable[str], depth: int) -> List[str]:
+        with self._condition:
+            new = [url for url in urls if self._is_new(url)]
+            if new:
+                if self._spool is None:
+                    self._spool = DiskQueue()
+                self.spooled += self._spool.put_many(f"{depth}\t{url}" for url in new)
+                self._condition.notify_all()
+            return new
+    
+    def mark_seen(self, urls: Iterable[str]):
+        """Отметка URL как уже встречавшихся (обработанные URL возобновляемого обхода)"""
+        with self._condition:
+            for url in urls:
+                self._seen.add(url)
+    
+    def follows(self, url: str) -> bool:
+        """Нужно ли извлекать ссылки выданного URL: его глубина меньше max_depth"""
+        with self._condition:
+            return self._depths.get(url, 0) < self.max_depth
+    
+    def complete(self, result: dict) -> List[tuple]:
+        """
+        Учет результата выданного URL до отметки done
+        
+        Ссылки страницы в пределах CRAWL_SCOPE ставятся в очередь, если
+        глубина URL меньше max_depth. Вызывается для каждого выданного URL,
+        чтобы освободить его запись о глубине.
+        
+        Args:
+            result: Результат parse_and_save (url, success, error, links)
+            
+        Returns:
+            List[tuple]: Строки статусов crawl_urls для записи вместе со
+            строками страниц (пустой список без checkpoint)
+        """
+        url = result["url"]
+        with self._condition:
+            depth = self._depths.pop(url, 0)
+            added = []
+            if depth < self.max_depth:
+                added = self._add([link for link in result.get("links", ()) if in_scope(link, url)], depth + 1)
+        if self.checkpoint is None:
+            return []
+        return self.checkpoint.rows(result, depth, added)
+    
+    def _is_new(self, url: str) -> bool:
+        if self._seen.add(url):
+            return True
+        self.duplicates += 1
+        return False
+    
+    def _refill(self, count: int):
+        """Пополнение готовых URL сначала из источника, потом из очереди на диске"""
+        while len(self._ready) < count and not self._exhausted:
+            try:
+                url = next(self._source)
+            except StopIteration:
+                self._exhausted = True
+                break
+            self.read += 1
+            url, depth = url if isinstance(url, tuple) else (url, 0)
+            if self._is_new(url):
+                self._ready.append((url, depth))
+                if self.checkpoint is not None:
+                    self._unregistered.append(url)
+        if len(self._ready) < count and self._spool is not None and self._spool.size:
+            for line in self._spool.get_many(count - len(self._ready)):
+                depth, _, url = line.partition('\t')
+                self._ready.append((url, int(depth)))
+    
+    def get_batch(self, count: int) -> List[str]:
+        """
+        Выдача до count URL без ожидания
+        
+        Выдается не больше, чем позволяет окно: window минус URL,
+        выданные раньше и еще не отмеченные через done. Прочитанные
+        при этом URL источника регистрируются в checkpoint одним запросом
+        вне блокировки очереди.
+        
+        Args:
+            count: Максимальное количество URL
+            
+        Returns:
+            List[str]: URL (пустой список, если сейчас выдать нечего)
+        """
+        with self._condition:
+            count = min(count, self.window - self._in_flight)
+            if count <= 0:
+                return []
+            self._refill(count)
+            batch = []
+            for _ in range(min(count, len(self._ready))):
+                url, depth = self._ready.popleft()
+                if depth:
+                    self._depths[url] = depth
+                batch.append(url)
+            self._in_flight += len(batch)
+            self.issued += len(batch)
+            register, self._unregistered = self._unregistered, []
+        if register:
+            self.checkpoint.register(register)
+        return batch
+    
+    def get(self) -> Optional[str]:
+        """
+        Выдача одного URL с ожиданием, пока обрабатываются выданные URL
+        
+        Returns:
+            Optional[str]: URL или None, если обход завершен
+        """
+        with self._condition:
+            while True:
+                batch = self.get_batch(1)
+                if batch:
+                    return batch[0]
+                if self.finished:
+                    return None
+                self._condition.wait()
+    
+    def done(self, count: int = 1):
+        """Отметка об обработке count выданных URL"""
+        with self._condition:
+            self._in_flight -= count
+            self._condition.notify_all()
+    
+    @property
+    def finished(self) -> bool:
+        """Источник исчерпан, очередь пуста и все выданные URL обработаны"""
+        with self._condition:
+            spooled = self._spool is not None and self._spool.size
+            return self._exhausted and not self._ready and not spooled and self._in_flight == 0
+    
+    def close(self):
+        """Удаление файла очереди"""
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+    
+    def report(self, prefix: str):
+        """Вывод статистики очереди на экран"""
+        print(f"[{prefix}] Очередь URL: прочитано {self.read}, повторов {self.duplicates}, "
+              f"добавлено при обходе {self.spooled}, выдано {self.issued}")
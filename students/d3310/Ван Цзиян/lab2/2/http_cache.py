@@ -0,0 +1,216 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from config import HTTP_CACHE_ENABLED, HTTP_CACHE_PATH, CONTENT_HASH_ENABLED
+from crawl_stats import CrawlStats
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Параметров в одном запросе SQLite (ограничение старых версий - 999)
+SQLITE_MAX_PARAMS = 900
+
+# Ключ записи - URL и тип парсера: ответ 304 в одном режиме не должен
+# пропускать запись строки web_pages, которую записал только другой режим
+CREATE_CACHE_SQL = """
+CREATE TABLE IF NOT EXISTS http_cache (
+    url TEXT NOT NULL,
+    parser_type TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    title TEXT NOT NULL,
+    checked_at REAL NOT NULL,
+    PRIMARY KEY (url, parser_type)
+);
+"""
+
+UPSERT_CACHE_SQL = """
+INSERT INTO http_cache (url, parser_type, etag, last_modified, title, checked_at)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT(url, parser_type) DO UPDATE SET
+    etag = excluded.etag,
+    last_modified = excluded.last_modified,
+    title = excluded.title,
+    checked_at = excluded.checked_at;
+"""
+
+class HttpCache:
+    """
+    Кэш для условных запросов при повторном обходе
+    
+    Для каждого URL и режима хранятся ETag, Last-Modified и извлеченный
+    заголовок в локальном файле SQLite, общем для всех режимов. Записи
+    читаются пакетами для URL, выданных очередью (prefetch), и удаляются
+    из памяти после обработки URL (forget), поэтому память не растет с
+    числом URL. Новые валидаторы сохраняет writer процесса, собирающего
+    результаты, после commit пакета со строками этих URL (save как
+    on_commit), поэтому в кэше нет валидаторов страниц, строки которых
+    не записаны, а рабочие процессы в файл не пишут. Без базы данных
+    валидаторы не сохраняются.
+    
+    Для серверов без условных запросов кэш хранит также хэши тел и
+    заголовки из web_pages (with_stored): страница с тем же хэшем
+    не разбирается и не записывается повторно.
+    """
+    
+    def __init__(self, parser_type: str, path: str = HTTP_CACHE_PATH, enabled: bool = HTTP_CACHE_ENABLED):
+        self.parser_type = parser_type
+        self.path = path
+        self.enabled = enabled
+        self.entries: Dict[str, dict] = {}
+        self.pages: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        # Файл пишет один поток за раз: сбросы writer идут из разных потоков
+        self._save_lock = threading.Lock()
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Соединение с файлом кэша; таблица прежней схемы (ключ - только URL) пересоздается"""
+        conn = sqlite3.connect(self.path)
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(http_cache)")]
+        if columns and "parser_type" not in columns:
+            with conn:
+                conn.execute("DROP TABLE http_cache")
+        with conn:
+            conn.execute(CREATE_CACHE_SQL)
+        return conn
+    
+    def prefetch(self, urls: List[str]) -> "HttpCache":
+        """
+        Загрузка записей кэша для группы URL из файла
+        
+        Args:
+            urls: URL, которые скоро будут загружены
+            
+        Returns:
+            HttpCache: Этот же кэш
+        """
+        if not self.enabled or not urls or not os.path.exists(self.path):
+            return self
+        try:
+            conn = self._connect()
+            try:
+                rows = []
+                # Ограничение SQLite на число параметров в одном запросе
+                for i in range(0, len(urls), SQLITE_MAX_PARAMS):
+                    chunk = urls[i:i + SQLITE_MAX_PARAMS]
+                    placeholders = ",".join("?" * len(chunk))
+                    rows += conn.execute(
+                        "SELECT url, etag, last_modified, title FROM http_cache "
+                        f"WHERE parser_type = ? AND url IN ({placeholders})", [self.parser_type, *chunk]
+                    ).fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка чтения кэша {self.path}: {e}")
+            return self
+        with self._lock:
+            for url, etag, last_modified, title in rows:
+                self.entries[url] = {"etag": etag, "last_modified": last_modified, "title": title}
+        return self
+    
+    def with_stored(self, pages: Dict[str, dict]) -> "HttpCache":
+        """
+        Добавление хэшей и заголовков страниц, записанных прошлыми обходами
+        
+        Args:
+            pages: URL -> {"content_hash", "title"} из web_pages
+            
+        Returns:
+            HttpCache: Этот же кэш
+        """
+        with self._lock:
+            self.pages.update(pages)
+        return self
+    
+    def known(self, urls: List[str]) -> Tuple[Dict[str, dict], Dict[str, dict]]:
+        """
+        Записи кэша и прошлые записи страниц для передачи в рабочий процесс
+        
+        Args:
+            urls: Группа URL
+            
+        Returns:
+            Tuple[Dict, Dict]: Валидаторы и прошлые записи web_pages этих URL
+        """
+        with self._lock:
+            entries = {url: self.entries[url] for url in urls if url in self.entries}
+            pages = {url: self.pages[url] for url in urls if url in self.pages}
+        return entries, pages
+    
+    def remember(self, entries: Dict[str, dict], pages: Dict[str, dict]):
+        """Добавление записей, полученных от процесса-распределителя (см. known)"""
+        with self._lock:
+            self.entries.update(entries)
+            self.pages.update(pages)
+    
+    def get(self, url: str) -> Optional[dict]:
+        """
+        Запись кэша для условного запроса
+        
+        Args:
+            url: URL страницы
+            
+        Returns:
+            Optional[dict]: title, etag, last_modified или None
+        """
+        return self.entries.get(url) if self.enabled else None
+    
+    def stored(self, url: str) -> Optional[dict]:
+        """
+        Прошлая запись страницы в web_pages для сравнения по хэшу
+        
+        Args:
+            url: URL страницы
+            
+        Returns:
+            Optional[dict]: content_hash и title или None
+        """
+        return self.pages.get(url)
+    
+    def forget(self, url: str):
+        """Удаление записей обработанного URL из памяти"""
+        with self._lock:
+            self.entries.pop(url, None)
+            self.pages.pop(url, None)
+    
+    def save(self, results: Iterable[dict]):
+        """
+        Сохранение валидаторов из результатов обхода одной транзакцией
+        
+        Вызывается writer после commit пакета (on_commit) с результатами,
+        строки которых записаны. Сохраняются успешные результаты с ETag
+        или Last-Modified; для ответов 304 обновляется только время проверки.
+        
+        Args:
+            results: Результаты по URL
+        """
+        if not self.enabled:
+            return
+        now = time.time()
+        rows = [
+            (r["url"], self.parser_type, r.get("etag"), r.get("last_modified"), r["title"], now)
+            for r in results
+            if r["success"] and (r.get("etag") or r.get("last_modified"))
+        ]
+        if not rows:
+            return
+        with self._save_lock:
+            try:
+                conn = self._connect()
+                try:
+                    with conn:
+                        conn.executemany(UPSERT_CACHE_SQL, rows)
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка сохранения кэша {self.path}: {e}")
+    
+    def report(self, prefix: str, stats: CrawlStats):
+        """Вывод числа страниц, не изменившихся с прошлого обхода (ответ 304 или тот же хэш)"""
+        if self.enabled:
+            print(f"[{prefix}] Кэш: без изменений (304) {stats.not_modified} из {stats.total}")
+        if CONTENT_HASH_ENABLED:
+            print(f"[{prefix}] Хэш тела: тот же {stats.unchanged} (строка не записывается), "
+                  f"изменено или новых {stats.changed}")
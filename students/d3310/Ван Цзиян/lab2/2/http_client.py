@@ -0,0 +1,263 @@
+import logging
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from config import HTTP_CLIENT, HTTP2, HTTP_POOL_HOSTS
+from typing import Callable, List, Optional, Tuple, Union
+
+# Необязательный клиент с поддержкой HTTP/2
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+class ConnectionStats:
+    """Количество запросов и открытых соединений для оценки повторного использования"""
+    
+    def __init__(self, requests_sent: int = 0, connections: int = 0):
+        self.requests_sent = requests_sent
+        self.connections = connections
+    
+    def add(self, other: "ConnectionStats"):
+        """Добавление статистики другого клиента или процесса"""
+        self.requests_sent += other.requests_sent
+        self.connections += other.connections
+    
+    def __sub__(self, other: "ConnectionStats") -> "ConnectionStats":
+        return ConnectionStats(self.requests_sent - other.requests_sent, self.connections - other.connections)
+    
+    @property
+    def reuse_rate(self) -> float:
+        """Доля запросов, отправленных через уже открытое соединение"""
+        if not self.requests_sent:
+            return 0.0
+        return max(0.0, 1 - self.connections / self.requests_sent)
+    
+    def report(self, prefix: str):
+        """Вывод статистики соединений на экран"""
+        print(f"[{prefix}] HTTP: запросов {self.requests_sent}, новых соединений {self.connections}, "
+              f"повторное использование {self.reuse_rate:.0%}")
+
+def counting_pool_class(pool_cls, stats: ConnectionStats, on_connect: Optional[Callable[[float], None]] = None):
+    """
+    Подкласс пула urllib3, учитывающий каждое открытие TCP-соединения
+    
+    Счетчик num_connections самого пула не учитывает переподключение
+    соединения, закрытого сервером или недочитанным ответом.
+    on_connect получает время открытия соединения (с DNS и TLS) в секундах.
+    """
+    class CountingConnection(pool_cls.ConnectionCls):
+        def connect(self):
+            started = time.perf_counter()
+            super().connect()
+            stats.connections += 1
+            if on_connect is not None:
+                on_connect(time.perf_counter() - started)
+    
+    return type(pool_cls.__name__, (pool_cls,), {"ConnectionCls": CountingConnection})
+
+class RequestsClient:
+    """
+    requests.Session с keep-alive для одного потока или процесса
+    
+    Поток выполняет один запрос за раз, поэтому на каждый хост хватает
+    одного соединения, а число хостов в пуле задает HTTP_POOL_HOSTS.
+    """
+    
+    def __init__(self, pool_size: int = 1):
+        self._stats = ConnectionStats()
+        self._connect_time: Optional[float] = None
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=pool_size)
+        pool_classes = adapter.poolmanager.pool_classes_by_scheme
+        adapter.poolmanager.pool_classes_by_scheme = {
+            scheme: counting_pool_class(pool_cls, self._stats, self._on_connect) for scheme, pool_cls in pool_classes.items()
+        }
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+    
+    def _on_connect(self, seconds: float):
+        self._connect_time = (self._connect_time or 0.0) + seconds
+    
+    def get(self, url: str, **kwargs):
+        """
+        GET-запрос через сессию, аргументы как у requests.get
+        
+        В connect_time ответа - время открытия новых соединений запроса
+        (None, если соединение взято из пула).
+        """
+        self._stats.requests_sent += 1
+        self._connect_time = None
+        response = self.session.get(url, **kwargs)
+        response.connect_time = self._connect_time
+        return response
+    
+    def stats(self) -> ConnectionStats:
+        """Счетчики запросов и открытых TCP-соединений"""
+        return ConnectionStats(self._stats.requests_sent, self._stats.connections)
+    
+    def close(self):
+        """Закрытие сессии и ее соединений"""
+        self.session.close()
+
+class HttpxResponse:
+    """Ответ httpx с интерфейсом ответа requests, нужным title_extractor"""
+    
+    def __init__(self, response, connect_time: Optional[float] = None):
+        self._response = response
+        self.connect_time = connect_time
+        self.headers = response.headers
+        self.status_code = response.status_code
+        self.url = str(response.url)
+    
+    @property
+    def content(self) -> bytes:
+        return self._response.read()
+    
+    def raise_for_status(self):
+        self._response.raise_for_status()
+    
+    def iter_content(self, chunk_size: int):
+        return self._response.iter_bytes(chunk_size)
+    
+    def close(self):
+        self._response.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+class HttpxClient:
+    """
+    httpx.Client с keep-alive и необязательным HTTP/2
+    
+    Клиент потокобезопасен, поэтому один клиент используется всеми
+    потоками процесса, а размер пула равен числу рабочих потоков.
+    Новые соединения считаются по событиям трассировки httpcore.
+    """
+    
+    def __init__(self, pool_size: int = 1, http2: bool = HTTP2):
+        self._lock = threading.Lock()
+        self._stats = ConnectionStats()
+        limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        hooks = {"request": [self._on_request]}
+        try:
+            self.client = httpx.Client(http2=http2, limits=limits, event_hooks=hooks)
+        except ImportError:
+            # Для HTTP/2 нужен пакет h2 (pip install httpx[http2])
+            logger.warning("HTTP/2 недоступен: не установлен пакет h2, используется HTTP/1.1")
+            self.client = httpx.Client(limits=limits, event_hooks=hooks)
+    
+    def _on_request(self, request):
+        with self._lock:
+            self._stats.requests_sent += 1
+        request.extensions.setdefault("trace", self._trace)
+    
+    def _trace(self, event_name: str, info: dict):
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self._stats.connections += 1
+    
+    def get(self, url: str, timeout: Union[float, Tuple[float, float]] = 10, stream: bool = False,
+            headers: Optional[dict] = None) -> HttpxResponse:
+        """GET-запрос; при stream=True тело читается через iter_content, timeout как у requests"""
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            timeout = httpx.Timeout(read, connect=connect)
+        request = self.client.build_request("GET", url, timeout=timeout, headers=headers)
+        
+        # Трассировка запроса: общий учет соединений и время открытия соединения этого запроса
+        connect = {}
+        def trace(event_name: str, info: dict):
+            self._trace(event_name, info)
+            if event_name == "connection.connect_tcp.started":
+                connect["started"] = time.perf_counter()
+            elif event_name in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+                connect["time"] = time.perf_counter() - connect["started"]
+        request.extensions["trace"] = trace
+        
+        response = self.client.send(request, stream=True, follow_redirects=True)
+        if not stream:
+            response.read()
+        return HttpxResponse(response, connect.get("time"))
+    
+    def stats(self) -> ConnectionStats:
+        """Счетчики запросов и новых соединений"""
+        with self._lock:
+            return ConnectionStats(self._stats.requests_sent, self._stats.connections)
+    
+    def close(self):
+        """Закрытие клиента и его соединений"""
+        self.client.close()
+
+class ClientRegistry:
+    """
+    HTTP-клиенты рабочих потоков одного процесса
+    
+    При HTTP_CLIENT=requests каждый поток получает собственную сессию
+    (requests.Session не потокобезопасна), при HTTP_CLIENT=httpx все потоки
+    используют один клиент с пулом из pool_size соединений.
+    """
+    
+    def __init__(self, pool_size: int = 1, backend: str = HTTP_CLIENT):
+        if backend == "httpx" and httpx is None:
+            logger.warning("httpx не установлен, используется requests")
+            backend = "requests"
+        self.backend = backend
+        self.pool_size = max(1, pool_size)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._clients: List = []
+        self._shared: Optional[HttpxClient] = None
+    
+    def get_client(self):
+        """
+        HTTP-клиент текущего потока
+        
+        Returns:
+            RequestsClient или HttpxClient с методом get(url, timeout, stream)
+        """
+        if self.backend == "httpx":
+            with self._lock:
+                if self._shared is None:
+                    self._shared = HttpxClient(self.pool_size)
+                    self._clients.append(self._shared)
+                return self._shared
+        
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = RequestsClient()
+            self._local.client = client
+            with self._lock:
+                self._clients.append(client)
+        return client
+    
+    def stats(self) -> ConnectionStats:
+        """Суммарная статистика соединений всех клиентов"""
+        total = ConnectionStats()
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            total.add(client.stats())
+        return total
+    
+    def close(self) -> ConnectionStats:
+        """
+        Закрытие всех клиентов
+        
+        Returns:
+            ConnectionStats: Статистика, снятая перед закрытием
+        """
+        total = self.stats()
+        with self._lock:
+            clients, self._clients = self._clients, []
+            self._shared = None
+        for client in clients:
+            client.close()
+        self._local = threading.local()
+        return total
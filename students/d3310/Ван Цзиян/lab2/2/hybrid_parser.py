@@ -0,0 +1,330 @@
+import asyncio
+import aiohttp
+import multiprocessing
+import queue
+import threading
+import time
+from async_parser import ParseOffloader, crawl_worker
+from rate_limit import AsyncHostLimiter, SharedHostSlots
+from metrics import trace_config
+from http_cache import HttpCache
+from database import db_manager, BatchWriter, NullWriter, result_rows
+from config import (ASYNC_CONCURRENCY, ASYNC_WORKERS, HOST_CONCURRENCY, HYBRID_WORKERS, HYBRID_RESULT_BATCH,
+                    FRONTIER_POLL_INTERVAL, HTTP_TIMEOUT, HTTP_CONNECT_TIMEOUT)
+from crawl_stats import CrawlStats
+from frontier import Frontier
+import logging
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Задание процесса: группа URL, записи кэша, прошлые записи web_pages и URL, у которых извлекаются ссылки
+ShardTask = Tuple[List[str], Dict[str, dict], Dict[str, dict], List[str]]
+
+# Сообщение процесса агрегатору: (вид, номер процесса, данные)
+# "task" - URL взятого задания, "results" - группа результатов, "exit" - завершение (текст ошибки или None)
+ShardMessage = Tuple[str, int, object]
+
+async def feed_shard(take_task: Callable[[], Optional[ShardTask]], work_queue: asyncio.Queue, cache: HttpCache,
+                     follow: Set[str]):
+    """
+    Передача URL из заданий родителя рабочим корутинам процесса
+    
+    Следующее задание берется, когда в локальной очереди освобождается
+    место, поэтому процесс не забирает себе больше URL, чем успевает.
+    
+    Args:
+        take_task: Получение задания в потоке (None - заданий больше нет, queue.Empty - пока нет)
+        work_queue: Очередь URL рабочих корутин
+        cache: кэш процесса, в который добавляются записи из задания
+        follow: URL процесса, у которых нужно извлечь ссылки
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            task = await loop.run_in_executor(None, take_task)
+        except queue.Empty:
+            continue
+        if task is None:
+            break
+        urls, entries, stored, follow_urls = task
+        cache.remember(entries, stored)
+        follow.update(follow_urls)
+        for url in urls:
+            await work_queue.put(url)
+    for _ in range(ASYNC_WORKERS):
+        await work_queue.put(None)
+
+async def crawl_shard(shard_id: int, task_queue: multiprocessing.Queue, results_queue: multiprocessing.Queue,
+                      share: int = 1, slots: Optional[SharedHostSlots] = None):
+    """
+    Асинхронная обработка заданий родителя в рабочем процессе
+    
+    Результаты передаются агрегатору группами по HYBRID_RESULT_BATCH
+    по мере готовности (и сразу, когда локальная очередь пуста),
+    запись в базу данных выполняет только агрегатор.
+    
+    Args:
+        shard_id: Номер процесса в сообщениях агрегатору
+        task_queue: Очередь заданий от родителя
+        results_queue: Очередь результатов к агрегатору
+        share: Число процессов, между которыми делится скорость хостов
+        slots: Общие для процессов слоты хостов
+    """
+    semaphore = asyncio.Semaphore(ASYNC_CONCURRENCY)
+    limiter = AsyncHostLimiter(share=share, shared=slots)
+    connector = aiohttp.TCPConnector(limit=ASYNC_CONCURRENCY, limit_per_host=HOST_CONCURRENCY)
+    timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+    
+    # Каждый процесс сам по себе обработчик разбора: разбор в его цикле событий
+    offloader = ParseOffloader(mode="inline").start()
+    
+    # Валидаторы и хэши прошлого обхода приходят с заданиями; новые сохраняет агрегатор
+    cache = HttpCache("hybrid")
+    work_queue = asyncio.Queue(maxsize=ASYNC_WORKERS)
+    follow = set()
+    pending = []
+    
+    async def on_result(result: dict):
+        nonlocal pending
+        cache.forget(result["url"])
+        follow.discard(result["url"])
+        pending.append(result)
+        # Без новых URL неполная группа не задерживается: агрегатор ждет ее, чтобы завершить обход
+        if len(pending) >= HYBRID_RESULT_BATCH or work_queue.empty():
+            results_queue.put(("results", shard_id, pending))
+            pending = []
+    
+    def take_task() -> Optional[ShardTask]:
+        # Ожидание с таймаутом: поток не переживает цикл событий, завершившийся с ошибкой.
+        # Взятое задание сообщается агрегатору из этого же потока, до результатов его URL,
+        # даже если ожидавшая его корутина уже отменена
+        task = task_queue.get(timeout=FRONTIER_POLL_INTERVAL)
+        if task is not None:
+            results_queue.put(("task", shard_id, task[0]))
+        return task
+    
+    # Замеры этапов передаются агрегатору в результатах
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout, trace_configs=[trace_config()]) as session:
+        await asyncio.gather(
+            feed_shard(take_task, work_queue, cache, follow),
+            *[
+                crawl_worker(work_queue, session, semaphore, limiter, offloader, cache, on_result, "hybrid",
+                             follows=follow.__contains__)
+                for _ in range(ASYNC_WORKERS)
+            ],
+        )
+    
+    if pending:
+        results_queue.put(("results", shard_id, pending))
+    limiter.report("hybrid")
+
+def shard_worker(shard_id: int, task_queue: multiprocessing.Queue, results_queue: multiprocessing.Queue,
+                 share: int = 1, slots: Optional[SharedHostSlots] = None):
+    """
+    Точка входа рабочего процесса: собственный цикл событий для заданий родителя
+    
+    По завершении в очередь всегда отправляется сообщение "exit" с текстом
+    ошибки (или None), чтобы агрегатор не ждал процесс, завершившийся
+    с ошибкой, и завершил URL, которые тот не успел обработать.
+    
+    Args:
+        shard_id: Номер процесса
+        task_queue: Очередь заданий от родителя
+        results_queue: Очередь результатов к агрегатору
+        share: Число процессов, между которыми делится скорость хостов
+        slots: Общие для процессов слоты хостов
+    """
+    error = None
+    try:
+        asyncio.run(crawl_shard(shard_id, task_queue, results_queue, share, slots))
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        logger.error(f"Ошибка рабочего процесса {shard_id}: {error}")
+    finally:
+        results_queue.put(("exit", shard_id, error))
+
+def feed_tasks(frontier: Frontier, task_queue: multiprocessing.Queue, cache: HttpCache, store: bool,
+               workers: int, batch_size: int, stop: threading.Event):
+    """
+    Поток родителя: задания из Frontier для рабочих процессов
+    
+    Очередь заданий ограничена двумя заданиями на процесс, поэтому URL
+    читаются из источника по мере обработки. Когда обход завершен,
+    каждому процессу отправляется None.
+    
+    Args:
+        frontier: Очередь URL
+        task_queue: Очередь заданий процессам
+        cache: кэш родителя, из которого берутся записи для заданий
+        store: Читать ли хэши прошлого обхода из базы данных
+        workers: Число процессов
+        batch_size: URL в одном задании
+        stop: Сигнал остановки, если агрегатор завершился раньше
+    """
+    def put(item):
+        while not stop.is_set():
+            try:
+                task_queue.put(item, timeout=FRONTIER_POLL_INTERVAL)
+                return
+            except queue.Full:
+                continue
+    
+    while not stop.is_set():
+        batch = frontier.get_batch(batch_size)
+        if not batch:
+            if frontier.finished:
+                break
+            time.sleep(FRONTIER_POLL_INTERVAL)
+            continue
+        cache.prefetch(batch).with_stored(db_manager.stored_pages(batch, "hybrid") if store else {})
+        task = (batch, *cache.known(batch), [url for url in batch if frontier.follows(url)])
+        for url in batch:
+            cache.forget(url)
+        put(task)
+    for _ in range(workers):
+        put(None)
+
+def run(frontier: Frontier, store: bool = True) -> CrawlStats:
+    """
+    Гибридная обработка URL из очереди: процессы x asyncio
+    
+    Родитель раздает URL из Frontier заданиями HYBRID_WORKERS процессам,
+    каждый процесс загружает их в собственном цикле событий с ASYNC_CONCURRENCY
+    одновременными загрузками. Родитель агрегирует результаты и
+    записывает их в базу данных пакетами.
+    
+    Args:
+        frontier: Очередь URL
+        store: Записывать ли результаты в базу данных
+        
+    Returns:
+        CrawlStats: Итоги обхода
+    """
+    workers = max(1, HYBRID_WORKERS)
+    batch_size = max(1, frontier.window // (workers * 4))
+    
+    print(f"Использование {workers} процессов по {ASYNC_CONCURRENCY} конкурентных соединений "
+          f"(задание: {batch_size} URL, окно очереди: {frontier.window} URL)")
+    
+    # Процессы запускаются до подключения родителя к базе данных,
+    # чтобы не унаследовать его соединение
+    task_queue = multiprocessing.Queue(maxsize=workers * 2)
+    results_queue = multiprocessing.Queue()
+    slots = SharedHostSlots()
+    processes = [
+        multiprocessing.Process(target=shard_worker, args=(shard_id, task_queue, results_queue, workers, slots))
+        for shard_id in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    
+    # Валидаторы сохраняются в кэш после commit пакета со строками их URL
+    cache = HttpCache("hybrid")
+    if store:
+        # Подключение к базе данных
+        if not db_manager.connect():
+            for process in processes:
+                process.terminate()
+            raise RuntimeError("Не удалось подключиться к базе данных")
+        
+        # Создание таблицы данных
+        db_manager.create_table()
+        writer = BatchWriter(db_manager, on_commit=cache.save).start()
+    else:
+        writer = NullWriter()
+    
+    # Раздача заданий в отдельном потоке, агрегатор - в основном
+    stats = CrawlStats()
+    stop = threading.Event()
+    feeder = threading.Thread(
+        target=feed_tasks, args=(frontier, task_queue, cache, store, workers, batch_size, stop), daemon=True
+    )
+    feeder.start()
+    
+    def handle(batch: List[dict]):
+        stats.add_many(batch)
+        # Строки страниц и статусы URL одной группой, в одну транзакцию
+        writer.add_many([row for result in batch
+                         for row in result_rows(result, "hybrid") + frontier.complete(result)], batch)
+        frontier.done(len(batch))
+    
+    # URL, взятые каждым процессом и еще не вернувшиеся результатами
+    in_flight: Dict[int, Set[str]] = {shard_id: set() for shard_id in range(workers)}
+    exited: Set[int] = set()
+    
+    def abandon(shard_id: int, error: str):
+        """Завершение URL процесса, завершившегося с ошибкой, как неудачных"""
+        urls = in_flight.pop(shard_id, set())
+        if urls:
+            logger.error(f"Процесс {shard_id} завершился с ошибкой ({error}), URL без результата: {len(urls)}")
+            handle([{"url": url, "success": False, "error": f"рабочий процесс завершился: {error}",
+                     "elapsed": 0.0, "timings": {}} for url in sorted(urls)])
+    
+    def shut_down():
+        """Остановка раздачи: оставшиеся процессы дорабатывают взятые задания и завершаются"""
+        if stop.is_set():
+            return
+        stop.set()
+        feeder.join()
+        for shard_id, process in enumerate(processes):
+            if shard_id not in exited and process.is_alive():
+                try:
+                    task_queue.put(None, timeout=FRONTIER_POLL_INTERVAL * 20)
+                except queue.Full:
+                    process.terminate()
+    
+    # Агрегатор: очередь читается до сообщения "exit" от каждого процесса,
+    # до join, иначе процесс с недочитанной очередью не завершится
+    while len(exited) < len(processes):
+        try:
+            kind, shard_id, payload = results_queue.get(timeout=1)
+        except queue.Empty:
+            # Процесс, убитый без сообщения "exit" (сигнал, нехватка памяти): какие задания
+            # он успел взять, известно не точно, поэтому обход останавливается (--resume продолжит его)
+            for shard_id, process in enumerate(processes):
+                if shard_id not in exited and process.exitcode is not None:
+                    exited.add(shard_id)
+                    abandon(shard_id, f"код выхода {process.exitcode}")
+                    logger.error(f"Процесс {shard_id} завершился без сигнала завершения, обход останавливается")
+                    shut_down()
+            continue
+        if kind == "task":
+            in_flight[shard_id].update(payload)
+        elif kind == "results":
+            for result in payload:
+                in_flight[shard_id].discard(result["url"])
+            handle(payload)
+        else:
+            exited.add(shard_id)
+            abandon(shard_id, payload or "без результата")
+            if len(exited) == len(processes) and not frontier.finished:
+                logger.error("Все рабочие процессы завершились до окончания обхода")
+    
+    stop.set()
+    feeder.join()
+    for process in processes:
+        process.join()
+    
+    # Финальный сброс буфера (и валидаторов для следующего обхода)
+    writer.close()
+    writer.report("hybrid")
+    cache.report("hybrid", stats)
+    
+    if store:
+        # Закрытие соединения с базой данных
+        db_manager.close()
+    
+    return stats
+
+def main():
+    """Главная функция"""
+    import crawl_engine
+    crawl_engine.main(["--mode", "hybrid"])
+
+if __name__ == "__main__":
+    # Поддержка заморозки для Windows
+    multiprocessing.freeze_support()
+    main()
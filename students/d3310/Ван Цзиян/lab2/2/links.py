@@ -0,0 +1,126 @@
+import ipaddress
+from config import CRAWL_SCOPE, CRAWL_MAX_LINKS
+from typing import Iterable, List, Optional
+from urllib.parse import quote, urljoin, urlsplit, urlunsplit
+
+if CRAWL_SCOPE not in ("host", "domain", "any"):
+    raise ValueError(f"Неизвестный CRAWL_SCOPE: {CRAWL_SCOPE}")
+
+# Порт по умолчанию для схемы: такой порт в URL не пишется
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+# Символы, которые не экранируются в пути и запросе (RFC 3986)
+SAFE_PATH_CHARS = "/%:@!$&'()*+,;=-._~"
+SAFE_QUERY_CHARS = SAFE_PATH_CHARS + "?"
+
+def remove_dot_segments(path: str) -> str:
+    """
+    Удаление сегментов "." и ".." из абсолютного пути (RFC 3986, раздел 5.2.4)
+    
+    Пустые сегменты ("//") сохраняются: путь не склеивается повторно через
+    urljoin, который принял бы "//a" за имя хоста.
+    """
+    output = []
+    for segment in path.split("/")[1:]:
+        if segment == ".":
+            continue
+        if segment == "..":
+            if output:
+                output.pop()
+            continue
+        output.append(segment)
+    result = "/" + "/".join(output)
+    # "/a/." и "/a/b/.." указывают на каталог: завершающий "/" сохраняется
+    if path.rsplit("/", 1)[-1] in (".", "..") and not result.endswith("/"):
+        result += "/"
+    return result
+
+def normalize_url(href: str, base: str) -> Optional[str]:
+    """
+    Нормализация ссылки со страницы
+    
+    Ссылка приводится к абсолютному URL относительно страницы, схема и хост
+    переводятся в нижний регистр, порт по умолчанию, фрагмент и сегменты
+    "." и ".." убираются, небезопасные символы экранируются. Поэтому
+    разные записи одной ссылки дают один URL и один раз попадают в очередь.
+    
+    Args:
+        href: Значение атрибута href
+        base: URL страницы, на которой найдена ссылка
+        
+    Returns:
+        Optional[str]: URL или None для ссылок не на http(s)-страницы
+        (mailto:, javascript:, некорректный хост или порт)
+    """
+    try:
+        parts = urlsplit(urljoin(base, href.strip()))
+        scheme = parts.scheme.lower()
+        host = parts.hostname
+        port = parts.port
+    except ValueError:
+        return None
+    if scheme not in DEFAULT_PORTS or not host:
+        return None
+    
+    netloc = f"[{host}]" if ":" in host else host
+    if port is not None and port != DEFAULT_PORTS[scheme]:
+        netloc += f":{port}"
+    
+    # URL собирается из разобранных частей: сегменты "." и ".." убираются и в абсолютных ссылках
+    path = remove_dot_segments(parts.path or "/")
+    return urlunsplit((scheme, netloc, quote(path, safe=SAFE_PATH_CHARS),
+                       quote(parts.query, safe=SAFE_QUERY_CHARS), ""))
+
+def page_links(hrefs: Iterable[str], base: str, limit: int = CRAWL_MAX_LINKS) -> List[str]:
+    """
+    Нормализованные ссылки страницы без повторов и ссылок на саму страницу
+    
+    Args:
+        hrefs: Значения href в порядке появления на странице
+        base: URL страницы
+        limit: Максимальное количество ссылок
+        
+    Returns:
+        List[str]: Не больше limit URL в порядке появления
+    """
+    own = normalize_url(base, base)
+    links = []
+    seen = set()
+    for href in hrefs:
+        url = normalize_url(href, base)
+        if url is None or url == own or url in seen:
+            continue
+        seen.add(url)
+        links.append(url)
+        if len(links) >= limit:
+            break
+    return links
+
+def site_of(host: str) -> str:
+    """
+    Домен сайта для CRAWL_SCOPE=domain: два последних уровня имени хоста
+    
+    Это приближение без списка публичных суффиксов: для хостов вида
+    a.example.co.uk доменом будет co.uk. IP-адрес возвращается целиком.
+    """
+    try:
+        ipaddress.ip_address(host)
+        return host
+    except ValueError:
+        return ".".join(host.split(".")[-2:])
+
+def in_scope(url: str, source: str, scope: str = CRAWL_SCOPE) -> bool:
+    """
+    Входит ли ссылка в область обхода относительно страницы, где она найдена
+    
+    Args:
+        url: Нормализованный URL ссылки
+        source: URL страницы со ссылкой
+        scope: "host" - тот же хост и порт, "domain" - тот же домен, "any" - любой URL
+    """
+    if scope == "any":
+        return True
+    target, origin = urlsplit(url), urlsplit(normalize_url(source, source) or source)
+    if scope == "host":
+        return target.netloc.lower() == origin.netloc.lower()
+    return site_of(target.hostname or "") == site_of(origin.hostname or "")
@@ -0,0 +1,274 @@
+import bisect
+import json
+import logging
+import threading
+import time
+import aiohttp
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import METRICS_FILE, METRICS_PORT, TIMINGS_LOG
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Этапы обработки URL в порядке выполнения
+STAGES = ("dns", "connect", "ttfb", "download", "parse", "db_write")
+
+# Границы корзин гистограмм в секундах (как у клиентов Prometheus по умолчанию)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def add_timing(timings: Optional[dict], stage: str, seconds: float):
+    """
+    Добавление времени этапа к замерам URL
+    
+    Время повторных попыток складывается. timings None - замер отключен.
+    """
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+def response_timings(timings: Optional[dict], started: float, connect: Optional[float]):
+    """
+    Замер соединения и времени до первого байта ответа синхронного клиента
+    
+    Вызывается сразу после получения заголовков ответа. Синхронные
+    клиенты не различают разрешение имени и TCP-соединение, поэтому
+    DNS входит в connect.
+    
+    Args:
+        timings: Замеры URL
+        started: Время отправки запроса (time.perf_counter)
+        connect: Время открытия нового соединения или None, если соединение из пула
+    """
+    connect = connect or 0.0
+    if connect:
+        add_timing(timings, "connect", connect)
+    add_timing(timings, "ttfb", max(0.0, time.perf_counter() - started - connect))
+
+def trace_config() -> aiohttp.TraceConfig:
+    """
+    Трассировка aiohttp для замера DNS, соединения и времени до первого байта
+    
+    Замеры пишутся в словарь, переданный в session.get(trace_request_ctx=...);
+    запросы без него не замеряются. Время до первого байта считается от
+    начала запроса до получения заголовков без DNS, соединения и ожидания
+    свободного соединения в пуле сессии.
+    """
+    async def on_request_start(session, ctx, params):
+        ctx.started = time.perf_counter()
+        ctx.setup = 0.0
+    
+    async def on_queued_start(session, ctx, params):
+        ctx.queued_started = time.perf_counter()
+    
+    async def on_queued_end(session, ctx, params):
+        ctx.setup += time.perf_counter() - ctx.queued_started
+    
+    async def on_dns_start(session, ctx, params):
+        ctx.dns_started = time.perf_counter()
+    
+    async def on_dns_end(session, ctx, params):
+        elapsed = time.perf_counter() - ctx.dns_started
+        ctx.setup += elapsed
+        add_timing(timings_of(ctx), "dns", elapsed)
+    
+    async def on_connect_start(session, ctx, params):
+        ctx.connect_started = time.perf_counter()
+    
+    async def on_connect_end(session, ctx, params):
+        elapsed = time.perf_counter() - ctx.connect_started
+        ctx.setup += elapsed
+        add_timing(timings_of(ctx), "connect", elapsed)
+    
+    async def on_request_end(session, ctx, params):
+        add_timing(timings_of(ctx), "ttfb", max(0.0, time.perf_counter() - ctx.started - ctx.setup))
+    
+    def timings_of(ctx) -> Optional[dict]:
+        timings = ctx.trace_request_ctx
+        return timings if isinstance(timings, dict) else None
+    
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(on_request_start)
+    trace.on_connection_queued_start.append(on_queued_start)
+    trace.on_connection_queued_end.append(on_queued_end)
+    trace.on_dns_resolvehost_start.append(on_dns_start)
+    trace.on_dns_resolvehost_end.append(on_dns_end)
+    trace.on_connection_create_start.append(on_connect_start)
+    trace.on_connection_create_end.append(on_connect_end)
+    trace.on_request_end.append(on_request_end)
+    return trace
+
+class Histogram:
+    """Гистограмма длительностей с накопленными счетчиками корзин, как в Prometheus"""
+    
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+    
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """Пары (граница le, число значений не больше нее), последняя граница +Inf"""
+        total = 0
+        pairs = []
+        for bound, count in zip(list(self.buckets) + [float("inf")], self.counts):
+            total += count
+            pairs.append(("+Inf" if bound == float("inf") else repr(bound), total))
+        return pairs
+
+class StageMetrics:
+    """
+    Замеры этапов обработки URL по режимам (parser_type)
+    
+    Для каждого URL учитываются DNS, соединение, время до первого байта,
+    загрузка тела и разбор из поля timings результата, для каждого сброса
+    пакета - запись в базу данных. Замеры собираются в гистограммы
+    по (parser_type, этап) и выдаются в текстовом формате Prometheus:
+    HTTP-адресом /metrics (METRICS_PORT) во время обхода и файлом
+    (METRICS_FILE) по его окончании. С TIMINGS_LOG замеры каждого URL
+    пишутся строкой JSON.
+    
+    Потокобезопасна. Замеры рабочих процессов приходят в результатах
+    и учитываются в родительском процессе.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.parser_type = "none"
+        self.stages: Dict[Tuple[str, str], Histogram] = {}
+        self.urls: Dict[Tuple[str, str], Histogram] = {}
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._log: Optional[logging.Logger] = None
+    
+    def start(self, parser_type: str, port: int = METRICS_PORT, log_path: Optional[str] = TIMINGS_LOG):
+        """
+        Начало обхода: метка режима, HTTP-адрес /metrics и журнал замеров
+        
+        Args:
+            parser_type: Режим выполнения для метки parser_type
+            port: Порт HTTP-адреса /metrics, 0 - без него
+            log_path: Файл строк JSON с замерами каждого URL или None
+        """
+        self.parser_type = parser_type
+        if log_path and self._log is None:
+            self._log = logging.getLogger("timings")
+            self._log.setLevel(logging.INFO)
+            self._log.propagate = False
+            handler = logging.FileHandler(log_path, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._log.addHandler(handler)
+        if port and self._server is None:
+            try:
+                self._server = ThreadingHTTPServer(("", port), self._handler())
+            except OSError as e:
+                logger.error(f"Не удалось открыть порт метрик {port}: {e}")
+                return
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+            print(f"[{parser_type}] Метрики: http://127.0.0.1:{port}/metrics")
+    
+    def observe(self, stage: str, seconds: float, parser_type: Optional[str] = None):
+        """Учет одного замера этапа"""
+        key = (parser_type or self.parser_type, stage)
+        with self._lock:
+            histogram = self.stages.get(key)
+            if histogram is None:
+                histogram = self.stages[key] = Histogram()
+            histogram.observe(seconds)
+    
+    def observe_result(self, result: dict):
+        """
+        Учет замеров результата по одному URL
+        
+        Args:
+            result: Результат parse_and_save (url, success, elapsed, timings)
+        """
+        timings = result.get("timings") or {}
+        for stage, seconds in timings.items():
+            self.observe(stage, seconds)
+        key = (self.parser_type, "success" if result["success"] else "failed")
+        with self._lock:
+            histogram = self.urls.get(key)
+            if histogram is None:
+                histogram = self.urls[key] = Histogram()
+            histogram.observe(result["elapsed"])
+        if self._log is not None:
+            self._log.info(json.dumps({
+                "url": result["url"],
+                "parser_type": self.parser_type,
+                "success": result["success"],
+                "elapsed": round(result["elapsed"], 6),
+                **{stage: round(timings[stage], 6) for stage in STAGES if stage in timings},
+            }, ensure_ascii=False))
+    
+    def exposition(self) -> str:
+        """Гистограммы в текстовом формате Prometheus"""
+        lines = []
+        with self._lock:
+            families = [
+                ("crawl_stage_duration_seconds", "Время этапа обработки URL", "stage", self.stages),
+                ("crawl_url_duration_seconds", "Время обработки URL целиком", "result", self.urls),
+            ]
+            for name, help_text, label, histograms in families:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for (parser_type, value), histogram in sorted(histograms.items()):
+                    labels = f'parser_type="{parser_type}",{label}="{value}"'
+                    for bound, count in histogram.cumulative():
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+                    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+    
+    def _handler(self):
+        registry = self
+        
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.exposition().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, format, *args):
+                # Запросы сборщика метрик не выводятся
+                pass
+        
+        return MetricsHandler
+    
+    def finish(self, path: Optional[str] = METRICS_FILE):
+        """
+        Окончание обхода: запись метрик в файл и остановка HTTP-адреса
+        
+        Args:
+            path: Файл для метрик в формате Prometheus или None
+        """
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(self.exposition())
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+    
+    def report(self, prefix: str):
+        """Вывод суммарного и среднего времени этапов режима на экран"""
+        with self._lock:
+            parts = [
+                f"{stage} {histogram.sum:.2f}s / {histogram.sum / histogram.count * 1000:.1f} мс"
+                for stage in STAGES
+                for histogram in [self.stages.get((prefix, stage))]
+                if histogram is not None and histogram.count
+            ]
+        if parts:
+            print(f"[{prefix}] Этапы (сумма / среднее): {', '.join(parts)}")
+
+# Замеры процесса: обновляются режимами, выдаются движком обхода
+metrics = StageMetrics()
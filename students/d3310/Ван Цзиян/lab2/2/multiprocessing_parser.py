@@ -1,99 +1,246 @@
 import multiprocessing
+import queue
 import time
-import requests
-from bs4 import BeautifulSoup, XMLParsedAsHTMLWarning
 from multiprocessing import Pool
-from database import db_manager
-from config import URLS, MULTIPROCESSING_WORKERS
+from multiprocessing.util import Finalize
+from database import db_manager, BatchWriter, DatabaseManager, NullWriter, result_rows, row_url
+from config import (MULTIPROCESSING_WORKERS, MULTIPROCESSING_BATCH_SIZE, MULTIPROCESSING_DB_WRITES,
+                    FRONTIER_POLL_INTERVAL)
+from crawl_stats import CrawlStats
+from frontier import Frontier
+from title_extractor import fetch_page_title, page_changed, unchanged_reason
+from http_client import ClientRegistry, ConnectionStats
+from rate_limit import HostLimiter, SharedHostSlots
+from http_cache import HttpCache
 import logging
-import warnings
-from urllib.parse import urlparse
-
-# Игнорировать предупреждения XML парсинга
-warnings.filterwarnings("ignore", category=XMLParsedAsHTMLWarning)
+from typing import Dict, List, Optional, Tuple
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def parse_and_save(url: str) -> bool:
+# Собственное соединение рабочего процесса (режим MULTIPROCESSING_DB_WRITES = "worker")
+worker_db: Optional[DatabaseManager] = None
+
+# HTTP-сессия рабочего процесса с keep-alive соединениями
+worker_http: Optional[ClientRegistry] = None
+
+# Ограничения по хостам рабочего процесса (доля от общих ограничений)
+worker_limiter: Optional[HostLimiter] = None
+
+# Валидаторы и хэши прошлого обхода, полученные рабочим процессом вместе с пакетом URL
+worker_cache: Optional[HttpCache] = None
+
+def init_worker(store: bool = True, slots: Optional[SharedHostSlots] = None):
+    """
+    Инициализация рабочего процесса пула
+    
+    Каждый процесс создает одну HTTP-сессию на все свои URL и ограничения
+    по хостам: скорость делится между MULTIPROCESSING_WORKERS процессами,
+    одновременные запросы всех процессов ограничивает общий счетчик slots.
+    Соединение родителя не наследуется: в режиме записи из рабочих процессов
+    каждый процесс открывает собственное соединение с базой данных.
+    
+    Args:
+        store: Записывать ли результаты в базу данных
+        slots: Общие для процессов пула слоты хостов
+    """
+    global worker_db, worker_http, worker_limiter, worker_cache
+    worker_http = ClientRegistry()
+    worker_limiter = HostLimiter(share=MULTIPROCESSING_WORKERS, shared=slots)
+    worker_cache = HttpCache("multiprocessing")
+    Finalize(worker_http, worker_http.close, exitpriority=10)
+    
+    if not store or MULTIPROCESSING_DB_WRITES != "worker":
+        return
+    worker_db = DatabaseManager()
+    if worker_db.connect():
+        # Закрытие соединения при завершении рабочего процесса
+        Finalize(worker_db, worker_db.close, exitpriority=10)
+    else:
+        worker_db = None
+
+def parse_page(url: str, links: bool = False) -> dict:
     """
-    Парсинг указанного URL и сохранение в базу данных
+    Парсинг указанного URL в рабочем процессе
+    
+    Рабочий процесс только возвращает распарсенную строку, запись
+    выполняется пакетами в parse_batch или в родительском процессе.
     
     Args:
         url: URL веб-страницы для парсинга
+        links: Извлекать ли ссылки страницы (обход по ссылкам)
         
     Returns:
-        bool: Успешность парсинга и сохранения
+        dict: Результат по URL (url, success, title, etag, last_modified, not_modified,
+        content_hash, unchanged, links, elapsed, timings)
     """
+    started = time.perf_counter()
+    timings = {}
     try:
-        # Отправка HTTP-запроса
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        
-        # Единый HTML парсер, игнорировать XML предупреждения
-        soup = BeautifulSoup(response.content, 'html.parser')
-        title = soup.find('title')
-        
-        if title:
-            title_text = title.get_text().strip()
-        else:
-            # Для страниц без title использовать путь URL как заголовок
-            parsed_url = urlparse(url)
-            path = parsed_url.path.strip('/')
-            if path:
-                title_text = f"{parsed_url.netloc} - {path}"
-            else:
-                title_text = f"{parsed_url.netloc} - главная"
-        
-        # Сохранение в базу данных
-        success = db_manager.save_page_data(url, title_text, "multiprocessing")
+        # Загрузка и разбор: общий этап синхронных режимов
+        # Слот хоста на каждую попытку, повторы после временных ошибок
+        page = worker_limiter.fetch(url, lambda: fetch_page_title(url, worker_http.get_client(),
+                                                                  cached=worker_cache.get(url),
+                                                                  stored=worker_cache.stored(url), links=links,
+                                                                  timings=timings))
         
         # Вывод результата на экран
-        if success:
-            print(f"[multiprocessing] {url} -> {title_text}")
-        else:
-            print(f"[multiprocessing] {url} -> ошибка сохранения")
-            
-        return success
+        suffix = "" if page_changed(page) else f" ({unchanged_reason(page)})"
+        print(f"[multiprocessing] {url} -> {page['title']}{suffix}")
         
+        return {"url": url, "success": True, **page, "elapsed": time.perf_counter() - started, "timings": timings}
+    
     except Exception as e:
         logger.error(f"Ошибка парсинга {url}: {e}")
         print(f"[multiprocessing] {url} -> ошибка парсинга: {e}")
-        return False
+        return {"url": url, "success": False, "error": str(e), "elapsed": time.perf_counter() - started,
+                "timings": timings}
 
-def main():
-    """Главная функция"""
-    print("=== Многопроцессный парсер веб-страниц ===")
-    start_time = time.time()
+def page_rows(results: List[dict]) -> List[tuple]:
+    """Строки для записи: успешные и изменившиеся с прошлого обхода страницы и найденные ссылки"""
+    return [row for result in results for row in result_rows(result, "multiprocessing")]
+
+# Задание процесса: группа URL, записи кэша, прошлые записи web_pages и URL, у которых извлекаются ссылки
+BatchTask = Tuple[List[str], Dict[str, dict], Dict[str, dict], List[str]]
+
+def parse_batch(task: BatchTask) -> Tuple[List[dict], bool, ConnectionStats]:
+    """
+    Парсинг группы URL в рабочем процессе
     
-    # Подключение к базе данных
-    if not db_manager.connect():
-        print("Не удалось подключиться к базе данных, выход из программы")
-        return
+    Args:
+        task: Группа URL для парсинга, записи кэша этих URL, их прошлые записи в web_pages
+            и URL, у которых нужно извлечь ссылки
+            
+    Returns:
+        Tuple[List[dict], bool, ConnectionStats]: Результаты по URL, признак того,
+        что успешные строки уже сохранены рабочим процессом, и статистика
+        HTTP-соединений за этот пакет
+    """
+    urls, entries, stored, follow = task
+    worker_cache.remember(entries, stored)
+    follow = set(follow)
+    http_before = worker_http.stats()
+    results = [parse_page(url, url in follow) for url in urls]
+    http_stats = worker_http.stats() - http_before
+    for url in urls:
+        worker_cache.forget(url)
+    rows = page_rows(results)
     
-    # Создание таблицы данных
-    db_manager.create_table()
+    if worker_db is not None and rows:
+        # Одна пакетная запись через собственное соединение процесса
+        failed = {row_url(row) for row in worker_db.save_many(rows)}
+        for result in results:
+            if result["success"] and result["url"] in failed:
+                result["success"] = False
+                result["error"] = "ошибка сохранения"
+        return results, True, http_stats
     
-    print(f"Использование {MULTIPROCESSING_WORKERS} рабочих процессов для обработки {len(URLS)} URL")
+    return results, False, http_stats
+
+def run(frontier: Frontier, store: bool = True) -> CrawlStats:
+    """
+    Многопроцессная обработка URL из очереди
     
-    # Использование Pool для управления пулом процессов
-    with Pool(processes=MULTIPROCESSING_WORKERS) as pool:
-        # Неупорядоченное выполнение для повышения эффективности
-        results = list(pool.imap_unordered(parse_and_save, URLS))
+    Родитель берет из Frontier пакеты URL и держит в пуле не больше двух
+    пакетов на процесс, поэтому память не зависит от числа URL. Записи кэша
+    и хэши прошлого обхода читаются родителем для каждого пакета и
+    передаются процессу вместе с ним.
     
-    # Расчет времени выполнения
-    execution_time = time.time() - start_time
+    Args:
+        frontier: Очередь URL
+        store: Записывать ли результаты в базу данных
+        
+    Returns:
+        CrawlStats: Итоги обхода
+    """
+    # Размер пакета: по умолчанию около четырех пакетов на процесс в окне очереди,
+    # чтобы все процессы были загружены и нагрузка выравнивалась
+    batch_size = MULTIPROCESSING_BATCH_SIZE or max(1, frontier.window // (MULTIPROCESSING_WORKERS * 4))
+    max_outstanding = MULTIPROCESSING_WORKERS * 2
     
-    # Подсчет успешных и неудачных запросов
-    successful = sum(1 for result in results if result is True)
-    failed = len(results) - successful
+    print(f"Использование {MULTIPROCESSING_WORKERS} рабочих процессов "
+          f"(пакет: {batch_size} URL, окно очереди: {frontier.window} URL, "
+          f"запись: {MULTIPROCESSING_DB_WRITES if store else 'нет'})")
     
-    print(f"[multiprocessing] Завершено {len(URLS)} URL, успешно {successful}, неудачно {failed}")
-    print(f"[multiprocessing] Общее время {execution_time:.2f}s")
+    stats = CrawlStats()
+    cache = HttpCache("multiprocessing")
+    http_stats = ConnectionStats()
     
-    # Закрытие соединения с базой данных
-    db_manager.close()
+    # Пул создается до подключения родителя к базе данных,
+    # чтобы рабочие процессы не унаследовали его соединение
+    slots = SharedHostSlots()
+    with Pool(processes=MULTIPROCESSING_WORKERS, initializer=init_worker, initargs=(store, slots)) as pool:
+        if store:
+            # Подключение к базе данных
+            if not db_manager.connect():
+                raise RuntimeError("Не удалось подключиться к базе данных")
+            
+            # Создание таблицы данных
+            db_manager.create_table()
+            # Валидаторы сохраняются в кэш после commit пакета со статусами их URL
+            writer = BatchWriter(db_manager, on_commit=cache.save).start()
+        else:
+            writer = NullWriter()
+        
+        # Результаты пакетов приходят через очередь из потока обратных вызовов пула
+        done_queue = queue.Queue()
+        outstanding = 0
+        
+        def collect(item):
+            if isinstance(item, BaseException):
+                raise item
+            batch_results, saved, batch_http_stats = item
+            stats.add_many(batch_results)
+            http_stats.add(batch_http_stats)
+            # Статусы URL одной группой со строками страниц (если их не записал рабочий процесс):
+            # URL не отмечается обработанным в другой транзакции, чем записана его страница
+            writer.add_many((page_rows(batch_results) if not saved else [])
+                            + [row for result in batch_results for row in frontier.complete(result)], batch_results)
+            frontier.done(len(batch_results))
+        
+        # Буфер и соединение закрываются и тогда, когда пакет завершился ошибкой
+        try:
+            while True:
+                # Новые пакеты, пока в пуле меньше max_outstanding пакетов
+                while outstanding < max_outstanding:
+                    batch = frontier.get_batch(batch_size)
+                    if not batch:
+                        break
+                    # Записи кэша и хэши прошлого обхода только для URL этого пакета
+                    cache.prefetch(batch).with_stored(db_manager.stored_pages(batch, "multiprocessing") if store else {})
+                    task = (batch, *cache.known(batch), [url for url in batch if frontier.follows(url)])
+                    for url in batch:
+                        cache.forget(url)
+                    pool.apply_async(parse_batch, (task,), callback=done_queue.put, error_callback=done_queue.put)
+                    outstanding += 1
+                
+                if not outstanding:
+                    if frontier.finished:
+                        break
+                    time.sleep(FRONTIER_POLL_INTERVAL)
+                    continue
+                
+                # Неупорядоченное получение результатов: первый завершенный пакет
+                collect(done_queue.get())
+                outstanding -= 1
+        finally:
+            # Финальный сброс буфера
+            writer.close()
+            if store:
+                # Закрытие соединения с базой данных
+                db_manager.close()
+    
+    http_stats.report("multiprocessing")
+    cache.report("multiprocessing", stats)
+    writer.report("multiprocessing")
+    
+    return stats
+
+def main():
+    """Главная функция"""
+    import crawl_engine
+    crawl_engine.main(["--mode", "multiprocessing"])
 
 if __name__ == "__main__":
     # Поддержка заморозки для Windows
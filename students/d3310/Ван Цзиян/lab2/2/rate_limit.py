@@ -0,0 +1,288 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+import zlib
+from contextlib import asynccontextmanager, contextmanager
+from urllib.parse import urlparse
+from config import (HOST_LIMITS_ENABLED, HOST_LIMITS, HOST_CONCURRENCY, HOST_RATE, HOST_MIN_RATE,
+                    HOST_MAX_RATE, HOST_LATENCY_TARGET, AIMD_INCREASE, AIMD_DECREASE)
+from resilience import HostResilience, status_of
+from scheduler import host_of
+from typing import Awaitable, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Не чаще одного снижения скорости за это время: ответы, отправленные
+# до снижения, не должны снижать скорость повторно
+DECREASE_COOLDOWN = 1.0
+
+# Пауза корутины между попытками занять общий слот хоста
+SHARED_SLOT_POLL = 0.01
+
+def host_policy(url: str) -> dict:
+    """
+    Ограничения хоста из config.HOST_LIMITS с подстановкой общих значений
+    
+    Ключом HOST_LIMITS может быть хост с портом или только имя хоста.
+    
+    Args:
+        url: URL страницы
+        
+    Returns:
+        dict: concurrency, rate, min_rate, max_rate, latency_target
+    """
+    policy = {
+        "concurrency": HOST_CONCURRENCY,
+        "rate": HOST_RATE,
+        "min_rate": HOST_MIN_RATE,
+        "max_rate": HOST_MAX_RATE,
+        "latency_target": HOST_LATENCY_TARGET,
+    }
+    policy.update(HOST_LIMITS.get(host_of(url)) or HOST_LIMITS.get(urlparse(url).hostname or '') or {})
+    return policy
+
+class AdaptiveTokenBucket:
+    """
+    Корзина токенов со скоростью, подстраиваемой по принципу AIMD
+    
+    До первого снижения скорость растет как при медленном старте TCP:
+    каждый успешный ответ прибавляет 1 запрос/с, то есть скорость
+    удваивается за секунду. После снижения успешный ответ быстрее
+    latency_target увеличивает ее аддитивно (примерно на AIMD_INCREASE
+    запросов/с за секунду работы), а ответ 429/5xx или медленный ответ
+    уменьшает ее в AIMD_DECREASE раз.
+    Потокобезопасна, используется и потоками, и корутинами.
+    """
+    
+    def __init__(self, rate: float, min_rate: float, max_rate: float, latency_target: float):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.latency_target = latency_target
+        self._lock = threading.Lock()
+        self._next_free = time.monotonic()
+        self._last_decrease = 0.0
+        
+        # Статистика
+        self.requests_sent = 0
+        self.throttled = 0
+        self.decreases = 0
+    
+    def reserve(self) -> float:
+        """
+        Резервирование токена на следующий запрос
+        
+        Returns:
+            float: Сколько секунд ждать до отправки запроса
+        """
+        with self._lock:
+            now = time.monotonic()
+            # Токены не копятся: после простоя запрос отправляется сразу, но без всплеска
+            start = max(self._next_free, now)
+            self._next_free = start + 1 / self.rate
+            self.requests_sent += 1
+            return max(0.0, start - now)
+    
+    def feedback(self, latency: float, error: Optional[BaseException]):
+        """
+        Подстройка скорости по результату запроса
+        
+        Args:
+            latency: Время ответа в секундах
+            error: Исключение запроса или None при успехе
+        """
+        status = status_of(error)
+        throttled = status == 429 or (status is not None and status >= 500)
+        with self._lock:
+            if throttled:
+                self.throttled += 1
+            if throttled or latency > self.latency_target:
+                now = time.monotonic()
+                if now - self._last_decrease >= DECREASE_COOLDOWN:
+                    self.rate = max(self.min_rate, self.rate * AIMD_DECREASE)
+                    self._last_decrease = now
+                    self.decreases += 1
+            elif error is None:
+                increase = 1.0 if not self.decreases else AIMD_INCREASE / self.rate
+                self.rate = min(self.max_rate, self.rate + increase)
+
+class SharedHostSlots:
+    """
+    Число занятых слотов хостов, общее для процессов одного обхода
+    
+    Хост отображается в одну из size ячеек массива в общей памяти (crc32
+    имени хоста). Слот занимается, только если в ячейке меньше concurrency
+    запросов, поэтому все процессы вместе держат к хосту не больше
+    concurrency запросов, сколько бы их ни было. Хосты с общей ячейкой
+    делят ее ограничение: к ним может уйти меньше запросов, но не больше.
+    Создается родителем до запуска процессов и передается им при создании.
+    """
+    
+    def __init__(self, size: int = 4096):
+        self.size = size
+        self._counts = multiprocessing.Array('i', size, lock=False)
+        self._condition = multiprocessing.Condition()
+    
+    def _index(self, host: str) -> int:
+        return zlib.crc32(host.encode('utf-8')) % self.size
+    
+    def acquire(self, host: str, concurrency: int, block: bool = True) -> bool:
+        """
+        Занятие слота хоста
+        
+        Args:
+            host: Хост
+            concurrency: Ограничение хоста на все процессы
+            block: Ждать ли освобождения слота
+            
+        Returns:
+            bool: Занят ли слот (без ожидания - False, если свободных нет)
+        """
+        index = self._index(host)
+        with self._condition:
+            while self._counts[index] >= concurrency:
+                if not block:
+                    return False
+                self._condition.wait()
+            self._counts[index] += 1
+            return True
+    
+    def release(self, host: str):
+        index = self._index(host)
+        with self._condition:
+            self._counts[index] -= 1
+            self._condition.notify_all()
+
+class HostLimiter:
+    """
+    Ограничение одновременных запросов и скорости по хостам для потоков
+    
+    На каждый хост создаются семафор и адаптивная корзина токенов.
+    В многопроцессных режимах share - число процессов: скорость хоста
+    делится между ними, а одновременные запросы всех процессов
+    ограничивает общий счетчик shared (SharedHostSlots). Деление слотов
+    дало бы каждому процессу хотя бы один и при числе процессов больше
+    concurrency превысило бы ограничение хоста.
+    
+    Запрос через fetch повторяется после временных ошибок и не
+    отправляется к хосту с разомкнутой цепью (resilience.HostResilience).
+    """
+    
+    def __init__(self, share: int = 1, enabled: bool = HOST_LIMITS_ENABLED,
+                 shared: Optional[SharedHostSlots] = None):
+        self.share = max(1, share)
+        self.enabled = enabled
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._hosts = {}
+        self.resilience = HostResilience()
+    
+    def _new_semaphore(self, concurrency: int):
+        return threading.BoundedSemaphore(concurrency)
+    
+    def _host(self, url: str):
+        """Семафор, корзина токенов и ограничение одновременных запросов хоста (создаются при первом обращении)"""
+        host = host_of(url)
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None:
+                policy = host_policy(url)
+                concurrency = max(1, policy["concurrency"])
+                state = (
+                    self._new_semaphore(concurrency),
+                    AdaptiveTokenBucket(policy["rate"] / self.share, policy["min_rate"] / self.share,
+                                        policy["max_rate"] / self.share, policy["latency_target"]),
+                    concurrency,
+                )
+                self._hosts[host] = state
+            return state
+    
+    @contextmanager
+    def slot(self, url: str):
+        """
+        Ожидание свободного слота и токена хоста на время одного запроса
+        
+        Время ответа и статус ошибки из блока подстраивают скорость хоста.
+        """
+        if not self.enabled:
+            yield
+            return
+        semaphore, bucket, concurrency = self._host(url)
+        with semaphore:
+            if self.shared is not None:
+                self.shared.acquire(host_of(url), concurrency)
+            try:
+                time.sleep(bucket.reserve())
+                started = time.perf_counter()
+                error = None
+                try:
+                    yield
+                except Exception as e:
+                    error = e
+                    raise
+                finally:
+                    bucket.feedback(time.perf_counter() - started, error)
+            finally:
+                if self.shared is not None:
+                    self.shared.release(host_of(url))
+    
+    def fetch(self, url: str, request: Callable[[], T]) -> T:
+        """
+        Запрос к хосту с повторами
+        
+        Каждая попытка занимает слот хоста, а паузы между попытками
+        проходят вне слота.
+        
+        Args:
+            url: URL страницы
+            request: Одна попытка загрузки
+            
+        Returns:
+            Результат первой успешной попытки
+        """
+        return self.resilience.call(url, request, lambda: self.slot(url))
+    
+    def report(self, prefix: str):
+        """Вывод итоговой скорости, числа ответов 429/5xx и повторов по хостам"""
+        for host, (_, bucket, _) in sorted(self._hosts.items()):
+            print(f"[{prefix}] Хост {host}: запросов {bucket.requests_sent}, 429/5xx {bucket.throttled}, "
+                  f"снижений скорости {bucket.decreases}, итоговая скорость {bucket.rate:.1f} запросов/с")
+        self.resilience.report(prefix)
+
+class AsyncHostLimiter(HostLimiter):
+    """Ограничение запросов по хостам для корутин одного цикла событий"""
+    
+    def _new_semaphore(self, concurrency: int):
+        return asyncio.Semaphore(concurrency)
+    
+    @asynccontextmanager
+    async def slot(self, url: str):
+        """Асинхронный вариант HostLimiter.slot"""
+        if not self.enabled:
+            yield
+            return
+        semaphore, bucket, concurrency = self._host(url)
+        async with semaphore:
+            if self.shared is not None:
+                # Без ожидания на общей блокировке: цикл событий не останавливается
+                while not self.shared.acquire(host_of(url), concurrency, block=False):
+                    await asyncio.sleep(SHARED_SLOT_POLL)
+            try:
+                await asyncio.sleep(bucket.reserve())
+                started = time.perf_counter()
+                error = None
+                try:
+                    yield
+                except Exception as e:
+                    error = e
+                    raise
+                finally:
+                    bucket.feedback(time.perf_counter() - started, error)
+            finally:
+                if self.shared is not None:
+                    self.shared.release(host_of(url))
+    
+    async def fetch(self, url: str, request: Callable[[], Awaitable[T]]) -> T:
+        """Асинхронный вариант HostLimiter.fetch: request возвращает корутину одной попытки"""
+        return await self.resilience.acall(url, request, lambda: self.slot(url))
@@ -0,0 +1,316 @@
+import asyncio
+import random
+import threading
+import time
+import aiohttp
+import requests
+from contextlib import nullcontext
+from email.utils import parsedate_to_datetime
+from config import (RETRY_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY, RETRY_AFTER_MAX,
+                    BREAKER_THRESHOLD, BREAKER_COOLDOWN)
+from scheduler import host_of
+from typing import AsyncContextManager, Awaitable, Callable, ContextManager, Optional, TypeVar
+
+# Необязательный клиент с поддержкой HTTP/2
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+T = TypeVar("T")
+
+# Исключения соединения и таймаута всех HTTP-клиентов
+CONNECT_ERRORS = (requests.exceptions.ConnectionError, aiohttp.ClientConnectionError, ConnectionError)
+TIMEOUT_ERRORS = (requests.exceptions.Timeout, asyncio.TimeoutError, TimeoutError)
+if httpx is not None:
+    CONNECT_ERRORS += (httpx.ConnectError, httpx.RemoteProtocolError)
+    TIMEOUT_ERRORS += (httpx.TimeoutException,)
+
+class CircuitOpenError(Exception):
+    """Запрос не отправлен: цепь хоста разомкнута после серии ошибок"""
+
+def status_of(error: Optional[BaseException]) -> Optional[int]:
+    """HTTP-статус из исключения requests, httpx или aiohttp"""
+    if error is None:
+        return None
+    status = getattr(error, 'status', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status
+
+def classify(error: BaseException) -> Optional[str]:
+    """
+    Класс ошибки запроса для решения о повторе
+    
+    Args:
+        error: Исключение загрузки или разбора
+        
+    Returns:
+        Optional[str]: "timeout", "connect", "5xx", "429" или None,
+        если повтор не поможет (4xx, ошибка разбора, разомкнутая цепь)
+    """
+    if isinstance(error, CircuitOpenError):
+        return None
+    # Таймаут соединения requests - подкласс и ConnectionError, и Timeout
+    if isinstance(error, TIMEOUT_ERRORS):
+        return "timeout"
+    if isinstance(error, CONNECT_ERRORS):
+        return "connect"
+    status = status_of(error)
+    if status == 429:
+        return "429"
+    if status is not None and status >= 500:
+        return "5xx"
+    return None
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """
+    Пауза из заголовка Retry-After ответа 429/503 в секундах
+    
+    Заголовок может содержать число секунд или HTTP-дату.
+    """
+    headers = getattr(error, 'headers', None)
+    if headers is None:
+        headers = getattr(getattr(error, 'response', None), 'headers', None)
+    value = headers.get('Retry-After') if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt: int, error: BaseException, base: float = RETRY_BASE_DELAY,
+                  cap: float = RETRY_MAX_DELAY) -> float:
+    """
+    Пауза перед повтором: экспоненциальная с полным случайным разбросом
+    
+    Пауза выбирается равномерно от 0 до base * 2^attempt (не больше cap),
+    поэтому повторы к одному хосту не приходят одновременно. Retry-After
+    соблюдается, но не дольше RETRY_AFTER_MAX.
+    
+    Args:
+        attempt: Номер неудачной попытки, начиная с 0
+        error: Исключение попытки
+        base: Начальная пауза в секундах
+        cap: Наибольшая пауза без Retry-After
+    """
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    after = retry_after(error)
+    if after is not None:
+        delay = max(delay, min(after, RETRY_AFTER_MAX))
+    return delay
+
+class CircuitBreaker:
+    """
+    Автоматический выключатель запросов к одному хосту
+    
+    После threshold попыток подряд с ошибкой соединения, таймаутом или 5xx
+    цепь размыкается: запросы к хосту сразу завершаются CircuitOpenError, не
+    ожидая таймаута. Через cooldown секунд пропускается один пробный запрос:
+    успех замыкает цепь, ошибка размыкает ее еще на cooldown.
+    threshold 0 отключает выключатель.
+    """
+    
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        
+        # Статистика
+        self.trips = 0
+        self.rejected = 0
+    
+    def allow(self) -> bool:
+        """Можно ли отправить запрос (вызывается под блокировкой HostResilience)"""
+        if self.opened_at is None or self.threshold <= 0:
+            return True
+        if not self.probing and time.monotonic() - self.opened_at >= self.cooldown:
+            self.probing = True
+            return True
+        self.rejected += 1
+        return False
+    
+    def record(self, failed: bool):
+        """Учет результата пропущенного запроса"""
+        if not failed:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+            return
+        self.failures += 1
+        if self.threshold <= 0:
+            return
+        if self.probing or (self.opened_at is None and self.failures >= self.threshold):
+            if self.opened_at is None:
+                self.trips += 1
+            self.opened_at = time.monotonic()
+            self.probing = False
+    
+    def cancel_probe(self):
+        """Пробный запрос прерван без результата: следующий запрос снова может стать пробным"""
+        self.probing = False
+
+class HostResilience:
+    """
+    Повторы запросов и автоматические выключатели по хостам для всех режимов
+    
+    Попытка загрузки повторяется после ошибок соединения, таймаутов, 5xx
+    и 429 до RETRY_ATTEMPTS попыток с паузой backoff_delay. Пауза идет вне
+    слота хоста, поэтому повторы не занимают его. Остальные ошибки не
+    повторяются.
+    
+    Выключатель хоста (CircuitBreaker) учитывает каждую попытку. Порог
+    BREAKER_THRESHOLD выбран так, чтобы хост, отвечающий ошибкой на часть
+    запросов, не отключался случайной серией ошибок. 429 не считается
+    отказом: хост отвечает, а его скорость снижает AIMD. Выключатель
+    проверяется перед первой попыткой и еще раз после получения слота
+    хоста, поэтому URL, ждавшие слот, когда цепь разомкнулась, тоже не
+    отправляются. После размыкания цепи повторы URL хоста прекращаются.
+    Потокобезопасна; в многопроцессных режимах у каждого процесса свои
+    выключатели.
+    """
+    
+    def __init__(self, attempts: int = RETRY_ATTEMPTS):
+        self.attempts = max(1, attempts)
+        self._lock = threading.Lock()
+        self._breakers = {}
+        
+        # Статистика
+        self.retries = {}
+    
+    def _breaker(self, url: str) -> CircuitBreaker:
+        host = host_of(url)
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker()
+        return breaker
+    
+    def _before(self, url: str) -> bool:
+        """
+        Проверка выключателя хоста перед первой попыткой URL
+        
+        Returns:
+            bool: Попытка пробная (цепь разомкнута, прошел cooldown)
+        """
+        with self._lock:
+            breaker = self._breaker(url)
+            if not breaker.allow():
+                raise CircuitOpenError(f"цепь хоста {host_of(url)} разомкнута")
+            return breaker.probing
+    
+    def _recheck(self, url: str, probe: bool):
+        """Повторная проверка после ожидания слота: цепь могла разомкнуться за это время"""
+        with self._lock:
+            breaker = self._breaker(url)
+            if breaker.opened_at is not None and not probe:
+                breaker.rejected += 1
+                raise CircuitOpenError(f"цепь хоста {host_of(url)} разомкнута")
+    
+    def _cancelled(self, url: str, probe: bool):
+        """
+        Попытка прервана без результата (отмена корутины, KeyboardInterrupt)
+        
+        Без этого флаг пробного запроса остался бы установленным, и цепь
+        хоста больше не пропустила бы ни одного запроса.
+        """
+        if not probe:
+            return
+        with self._lock:
+            breaker = self._breaker(url)
+            if breaker.probing:
+                breaker.cancel_probe()
+    
+    def _after(self, url: str, attempt: int, error: Optional[BaseException]) -> Optional[float]:
+        """
+        Учет результата попытки
+        
+        Returns:
+            Optional[float]: Пауза перед повтором или None, если повтора не будет
+        """
+        if isinstance(error, CircuitOpenError):
+            return None
+        kind = classify(error) if error is not None else None
+        with self._lock:
+            breaker = self._breaker(url)
+            breaker.record(kind in ("timeout", "connect", "5xx"))
+            # После размыкания цепи URL, уже начавшие загрузку, тоже не повторяются
+            retry = kind is not None and attempt + 1 < self.attempts and breaker.opened_at is None
+            if not retry:
+                return None
+            self.retries[kind] = self.retries.get(kind, 0) + 1
+        return backoff_delay(attempt, error)
+    
+    def call(self, url: str, fetch: Callable[[], T],
+             slot: Callable[[], ContextManager] = nullcontext) -> T:
+        """
+        Загрузка с повторами для потоков и процессов
+        
+        Args:
+            url: URL страницы (хост выключателя)
+            fetch: Одна попытка загрузки
+            slot: Слот хоста, занимаемый на время каждой попытки
+            
+        Returns:
+            Результат fetch первой успешной попытки
+        """
+        probe = self._before(url)
+        attempt = 0
+        while True:
+            try:
+                with slot():
+                    if not attempt:
+                        self._recheck(url, probe)
+                    result = fetch()
+            except Exception as e:
+                delay = self._after(url, attempt, e)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                self._cancelled(url, probe)
+                raise
+            self._after(url, attempt, None)
+            return result
+    
+    async def acall(self, url: str, fetch: Callable[[], Awaitable[T]],
+                    slot: Callable[[], AsyncContextManager] = nullcontext) -> T:
+        """Асинхронный вариант call: fetch возвращает корутину одной попытки"""
+        probe = self._before(url)
+        attempt = 0
+        while True:
+            try:
+                async with slot():
+                    if not attempt:
+                        self._recheck(url, probe)
+                    result = await fetch()
+            except Exception as e:
+                delay = self._after(url, attempt, e)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                self._cancelled(url, probe)
+                raise
+            self._after(url, attempt, None)
+            return result
+    
+    def report(self, prefix: str):
+        """Вывод числа повторов и срабатываний выключателей на экран"""
+        with self._lock:
+            retries = ", ".join(f"{kind} {count}" for kind, count in sorted(self.retries.items())) or "нет"
+            tripped = [(host, breaker) for host, breaker in sorted(self._breakers.items()) if breaker.trips]
+        print(f"[{prefix}] Повторы запросов: {retries}")
+        for host, breaker in tripped:
+            print(f"[{prefix}] Хост {host}: цепь размыкалась {breaker.trips} раз, "
+                  f"отклонено без запроса {breaker.rejected}")
@@ -0,0 +1,111 @@
+import threading
+from collections import OrderedDict, defaultdict, deque
+from config import FRONTIER_POLL_INTERVAL
+from frontier import Frontier
+from typing import Callable, List, Optional
+from urllib.parse import urlparse
+
+def host_of(url: str) -> str:
+    """
+    Хост URL для группировки по сайтам
+    
+    Args:
+        url: URL страницы
+        
+    Returns:
+        str: Хост с портом в нижнем регистре
+    """
+    return urlparse(url).netloc.lower()
+
+class HostFairQueue:
+    """
+    Общая очередь URL для рабочих потоков с чередованием хостов
+    
+    URL хранятся в отдельной очереди на каждый хост. Освободившийся поток
+    берет следующий URL того хоста, который сейчас обрабатывается меньшим
+    числом потоков, а при равенстве - по кругу. Поэтому медленный хост
+    не задерживает остальные URL, а URL одного сайта расходятся по разным
+    потокам вместо одного.
+    
+    URL берутся из Frontier группами по половине ее окна, когда ожидающих
+    URL становится меньше этого числа; on_refill получает каждую группу
+    до выдачи потокам (например, для чтения кэша).
+    """
+    
+    def __init__(self, frontier: Frontier, on_refill: Optional[Callable[[List[str]], None]] = None):
+        self._frontier = frontier
+        self._on_refill = on_refill
+        self._batch_size = max(1, frontier.window // 2)
+        self._pending = OrderedDict()
+        self._pending_count = 0
+        self._in_flight = defaultdict(int)
+        self._condition = threading.Condition()
+        # Группу из Frontier в каждый момент получает не больше одного потока
+        self._refilling = False
+    
+    def _refill(self):
+        """
+        Пополнение очередей хостов из Frontier
+        
+        Вызывается под блокировкой очереди, но отпускает ее на время
+        get_batch и on_refill (чтение SQLite и базы данных): остальные потоки
+        тем временем берут уже поставленные URL и отмечают обработанные.
+        Группа ставится в очередь и при ошибке on_refill: URL уже выданы
+        Frontier и без обработки не дали бы обходу завершиться.
+        """
+        batch = []
+        self._refilling = True
+        self._condition.release()
+        try:
+            batch = self._frontier.get_batch(self._batch_size)
+            if batch and self._on_refill is not None:
+                self._on_refill(batch)
+        finally:
+            self._condition.acquire()
+            self._refilling = False
+            for url in batch:
+                self._pending.setdefault(host_of(url), deque()).append(url)
+            self._pending_count += len(batch)
+            self._condition.notify_all()
+    
+    def get(self) -> Optional[str]:
+        """
+        Следующий URL для освободившегося потока
+        
+        Если очередь пуста, а другие потоки еще обрабатывают URL,
+        поток ждет: обработка может добавить в Frontier новые URL.
+        
+        Returns:
+            Optional[str]: URL или None, если обход завершен
+        """
+        with self._condition:
+            while True:
+                if self._pending_count < self._batch_size and not self._refilling:
+                    self._refill()
+                if self._pending:
+                    break
+                if self._frontier.finished:
+                    return None
+                self._condition.wait(FRONTIER_POLL_INTERVAL)
+            
+            # min возвращает первый из равных, а порядок хостов сдвигается по кругу
+            host = min(self._pending, key=lambda h: self._in_flight.get(h, 0))
+            urls = self._pending[host]
+            url = urls.popleft()
+            if urls:
+                self._pending.move_to_end(host)
+            else:
+                del self._pending[host]
+            self._pending_count -= 1
+            self._in_flight[host] += 1
+            return url
+    
+    def done(self, url: str):
+        """Отметка о завершении обработки URL, полученного через get"""
+        host = host_of(url)
+        with self._condition:
+            self._in_flight[host] -= 1
+            if not self._in_flight[host]:
+                del self._in_flight[host]
+            self._frontier.done()
+            self._condition.notify_all()
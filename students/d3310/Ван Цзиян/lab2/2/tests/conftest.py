@@ -0,0 +1,7 @@
+"""
+Общие настройки тестов: модули парсера лежат в родительской папке
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,161 @@
+"""
+Тесты подготовки пакетов записи и пула соединений
+"""
+import threading
+import time
+
+import psycopg2.pool
+import pytest
+
+import database
+from database import BatchWriter, DatabaseManager, LinkRow, PageRow, StatusRow, row_url, split_rows, unique_links, unique_rows
+
+def page(url: str, title: str, parser_type: str = "async") -> PageRow:
+    return PageRow(url, title, parser_type, None)
+
+def status(url: str, value: str) -> StatusRow:
+    return StatusRow(1, url, value, 0, 0, None, 0)
+
+def test_split_rows_by_type():
+    """Строки пакета расходятся по таблицам по типу, статусы одного URL объединяются"""
+    rows = [page("http://a/", "A"), LinkRow("http://a/", "http://b/"),
+            status("http://b/", "pending"), status("http://a/", "done"), status("http://b/", "done")]
+    pages, links, statuses = split_rows(rows)
+    
+    assert pages == [page("http://a/", "A")]
+    assert links == [LinkRow("http://a/", "http://b/")]
+    assert [(row.url, row.status) for row in statuses] == [("http://a/", "done"), ("http://b/", "done")]
+
+def test_split_rows_keeps_final_status():
+    """Строка pending той же ссылки с другой страницы не заменяет итоговый статус"""
+    _, _, statuses = split_rows([status("http://a/", "done"), status("http://a/", "pending")])
+    assert [row.status for row in statuses] == ["done"]
+
+def test_split_rows_rejects_plain_tuple():
+    with pytest.raises(TypeError):
+        split_rows([("http://a/", "A", "async", None)])
+
+def test_unique_rows_keeps_last_and_sorts(monkeypatch):
+    """Из повторов ключа остается последний, строки упорядочены по ключу"""
+    monkeypatch.setattr(database, "UPSERT", True)
+    monkeypatch.setattr(database, "DB_UNIQUE_KEY", ("url",))
+    rows = [page("http://b/", "B1"), page("http://a/", "A"), page("http://b/", "B2", "threading")]
+    assert unique_rows(rows) == [page("http://a/", "A"), page("http://b/", "B2", "threading")]
+
+def test_unique_rows_by_parser_type(monkeypatch):
+    monkeypatch.setattr(database, "UPSERT", True)
+    monkeypatch.setattr(database, "DB_UNIQUE_KEY", ("url", "parser_type"))
+    rows = [page("http://a/", "A1"), page("http://a/", "A2", "threading"), page("http://a/", "A3")]
+    assert unique_rows(rows) == [page("http://a/", "A3"), page("http://a/", "A2", "threading")]
+
+def test_unique_rows_append_mode(monkeypatch):
+    """В режиме append повторы записываются как есть"""
+    monkeypatch.setattr(database, "UPSERT", False)
+    rows = [page("http://b/", "B"), page("http://b/", "B")]
+    assert unique_rows(rows) == rows
+
+def test_unique_links_sorted():
+    rows = [LinkRow("http://b/", "http://c/"), LinkRow("http://a/", "http://c/"), LinkRow("http://b/", "http://c/")]
+    assert unique_links(rows) == [LinkRow("http://a/", "http://c/"), LinkRow("http://b/", "http://c/")]
+
+class FakeConnection:
+    def rollback(self):
+        pass
+
+class FakePool:
+    """Пул с поведением ThreadedConnectionPool: getconn без свободного соединения бросает PoolError"""
+    
+    def __init__(self, maxconn: int):
+        self.maxconn = maxconn
+        self.used = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+    
+    def getconn(self):
+        with self._lock:
+            if self.used >= self.maxconn:
+                raise psycopg2.pool.PoolError("connection pool exhausted")
+            self.used += 1
+            self.peak = max(self.peak, self.used)
+            return FakeConnection()
+    
+    def putconn(self, conn):
+        with self._lock:
+            self.used -= 1
+
+def test_pool_exhaustion_waits_for_free_connection():
+    """Потоков больше, чем соединений: поток ждет свободного соединения, а не получает PoolError"""
+    manager = DatabaseManager()
+    manager.pool = FakePool(2)
+    manager._pool_slots = threading.BoundedSemaphore(2)
+    errors = []
+    done = []
+    
+    def work():
+        try:
+            for _ in range(5):
+                with manager.get_connection():
+                    time.sleep(0.002)
+                done.append(1)
+        except Exception as e:
+            errors.append(e)
+    
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert errors == []
+    assert len(done) == 40
+    assert manager.pool.peak == 2
+
+class RejectingManager(DatabaseManager):
+    """Менеджер, транзакция которого не проходит, если в ней есть заголовок с NUL"""
+    
+    def __init__(self, error: Exception = ValueError("NUL")):
+        super().__init__()
+        self.error = error
+        self.committed = []
+        self.attempts = 0
+    
+    def _insert_rows(self, rows):
+        self.attempts += 1
+        if any(type(row) is PageRow and "\x00" in row.title for row in rows):
+            raise self.error
+        self.committed.extend(rows)
+
+def test_save_many_drops_only_bad_url():
+    """Ошибка в строке одного URL не отбрасывает пакет: теряются только строки этого URL"""
+    rows = []
+    for i in range(8):
+        url = f"http://a/{i}"
+        rows += [page(url, "bad\x00" if i == 5 else "ok"), LinkRow(url, "http://b/"), status(url, "done")]
+    manager = RejectingManager()
+    failed = manager.save_many(rows)
+    
+    assert {row_url(row) for row in failed} == {"http://a/5"}
+    assert len(failed) == 3
+    assert len(manager.committed) == len(rows) - 3
+    assert set(manager.committed) == set(rows) - set(failed)
+
+def test_save_many_connection_error_not_split():
+    """Ошибка соединения не повторяется по частям: не записан весь пакет"""
+    rows = [page(f"http://a/{i}", "bad\x00") for i in range(4)]
+    manager = RejectingManager(psycopg2.OperationalError("server closed the connection"))
+    
+    assert manager.save_many(rows) == rows
+    assert manager.attempts == 1
+
+def test_on_commit_skips_failed_urls():
+    """Результаты передаются в on_commit после записи, кроме URL, строки которых не записаны"""
+    committed = []
+    writer = BatchWriter(RejectingManager(), batch_size=100, flush_interval=0, on_commit=committed.extend)
+    good = {"url": "http://a/1"}
+    bad = {"url": "http://a/2"}
+    writer.add_many([page("http://a/1", "ok"), status("http://a/1", "done")], [good])
+    writer.add_many([page("http://a/2", "bad\x00"), status("http://a/2", "done")], [bad])
+    assert committed == []
+    
+    assert not writer.close()
+    assert committed == [good]
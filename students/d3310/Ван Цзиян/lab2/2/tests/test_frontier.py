@@ -0,0 +1,90 @@
+"""
+Тесты очереди URL и фильтра повторов
+"""
+from frontier import BloomFilter, Frontier
+
+def test_bloom_filter_detects_repeats():
+    bloom = BloomFilter(capacity=1000, error_rate=0.001)
+    assert bloom.add("http://a/")
+    assert not bloom.add("http://a/")
+
+def test_bloom_filter_false_positive_rate():
+    """Доля ложных срабатываний при заполнении до capacity близка к заданной"""
+    bloom = BloomFilter(capacity=10000, error_rate=0.01)
+    for i in range(10000):
+        bloom.add(f"http://site/{i}")
+    
+    def contains(item: str) -> bool:
+        # Проверка без добавления: add изменил бы заполнение фильтра
+        return all(bloom.bits[p // 8] & (1 << p % 8) for p in bloom._positions(item))
+    
+    false_positives = sum(contains(f"http://other/{i}") for i in range(10000))
+    assert false_positives < 200
+
+def test_frontier_skips_duplicates_and_finishes():
+    frontier = Frontier(["http://a/", "http://b/", "http://a/"], window=10, max_depth=0)
+    batch = frontier.get_batch(10)
+    
+    assert batch == ["http://a/", "http://b/"]
+    assert frontier.duplicates == 1
+    assert not frontier.finished
+    frontier.done(len(batch))
+    assert frontier.get_batch(10) == []
+    assert frontier.finished
+
+def test_frontier_window_limits_issued_urls():
+    """Выдается не больше window необработанных URL"""
+    frontier = Frontier([f"http://a/{i}" for i in range(10)], window=3, max_depth=0)
+    assert len(frontier.get_batch(10)) == 3
+    assert frontier.get_batch(10) == []
+    frontier.done(2)
+    assert len(frontier.get_batch(10)) == 2
+
+def test_frontier_follows_links_to_max_depth():
+    """Ссылки ставятся в очередь, пока глубина страницы меньше max_depth"""
+    frontier = Frontier(["http://a/"], window=10, max_depth=1)
+    assert frontier.get_batch(10) == ["http://a/"]
+    assert frontier.follows("http://a/")
+    frontier.complete({"url": "http://a/", "success": True, "links": ["http://a/x", "http://a/"]})
+    frontier.done()
+    
+    assert frontier.get_batch(10) == ["http://a/x"]
+    assert not frontier.follows("http://a/x")
+    frontier.complete({"url": "http://a/x", "success": True, "links": ["http://a/y"]})
+    frontier.done()
+    assert frontier.get_batch(10) == []
+    assert frontier.finished
+    frontier.close()
+
+class RecordingRun:
+    """Обход, запоминающий пакеты регистрации URL"""
+    
+    def __init__(self):
+        self.batches = []
+    
+    def register(self, urls):
+        self.batches.append(list(urls))
+        return len(urls)
+    
+    def rows(self, result, depth, links):
+        return []
+
+def test_frontier_registers_source_urls_as_issued():
+    """URL источника регистрируются пакетами при выдаче, а не весь источник сразу"""
+    read = []
+    
+    def source():
+        for i in range(6):
+            read.append(i)
+            yield f"http://a/{i}"
+    
+    run = RecordingRun()
+    frontier = Frontier(source(), window=2, max_depth=0, checkpoint=run)
+    assert run.batches == [] and read == []
+    
+    assert frontier.get_batch(10) == ["http://a/0", "http://a/1"]
+    assert run.batches == [["http://a/0", "http://a/1"]]
+    assert len(read) == 2
+    frontier.done(2)
+    frontier.get_batch(10)
+    assert run.batches[1] == ["http://a/2", "http://a/3"]
@@ -0,0 +1,35 @@
+"""
+Тесты кэша условных запросов
+"""
+import sqlite3
+
+from http_cache import HttpCache
+
+def result(url: str, etag: str = '"v1"', success: bool = True) -> dict:
+    return {"url": url, "success": success, "etag": etag, "last_modified": None, "title": "T"}
+
+def test_entries_keyed_by_parser_type(tmp_path):
+    """Валидаторы одного режима не используются другим режимом"""
+    path = str(tmp_path / "cache.sqlite3")
+    HttpCache("async", path, enabled=True).save([result("http://a/"), result("http://b/", success=False)])
+    
+    own = HttpCache("async", path, enabled=True).prefetch(["http://a/", "http://b/"])
+    other = HttpCache("threading", path, enabled=True).prefetch(["http://a/"])
+    assert own.get("http://a/") == {"etag": '"v1"', "last_modified": None, "title": "T"}
+    assert own.get("http://b/") is None
+    assert other.get("http://a/") is None
+
+def test_old_schema_recreated(tmp_path):
+    """Таблица прежней схемы (ключ - только URL) пересоздается при первом обращении"""
+    path = str(tmp_path / "cache.sqlite3")
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("CREATE TABLE http_cache (url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, "
+                     "title TEXT NOT NULL, checked_at REAL NOT NULL)")
+        conn.execute("INSERT INTO http_cache VALUES ('http://a/', '\"old\"', NULL, 'T', 0)")
+    conn.close()
+    
+    cache = HttpCache("async", path, enabled=True)
+    assert cache.prefetch(["http://a/"]).get("http://a/") is None
+    cache.save([result("http://a/")])
+    assert HttpCache("async", path, enabled=True).prefetch(["http://a/"]).get("http://a/")["etag"] == '"v1"'
@@ -0,0 +1,37 @@
+"""
+Тесты нормализации ссылок
+"""
+import pytest
+
+from links import normalize_url, page_links
+
+@pytest.mark.parametrize("href, expected", [
+    ("/b", "http://example.com/b"),
+    ("HTTP://Example.COM:80/a/./b/../c#frag", "http://example.com/a/c"),
+    ("https://example.com:443/", "https://example.com/"),
+    ("https://example.com:8443", "https://example.com:8443/"),
+    ("c d?q=a b", "http://example.com/dir/c%20d?q=a%20b"),
+    ("//other.org/x", "http://other.org/x"),
+    ("/a/b/..", "http://example.com/a/"),
+    ("../../../x", "http://example.com/x"),
+])
+def test_normalize_url(href, expected):
+    assert normalize_url(href, "http://example.com/dir/page") == expected
+
+@pytest.mark.parametrize("href", ["mailto:a@example.com", "javascript:void(0)", "http://example.com:99999/"])
+def test_normalize_url_rejects(href):
+    assert normalize_url(href, "http://example.com/") is None
+
+def test_page_links_deduplicates():
+    """Разные записи одной ссылки и ссылка на саму страницу дают один URL или ни одного"""
+    hrefs = ["/a", "/a#top", "http://EXAMPLE.com/a", "/", "#", "/b"]
+    assert page_links(hrefs, "http://example.com/") == ["http://example.com/a", "http://example.com/b"]
+
+@pytest.mark.parametrize("href, expected", [
+    ("http://example.com//a/b", "http://example.com//a/b"),
+    ("/p//q/../r", "http://example.com/p//r"),
+    ("//other.org//x", "http://other.org//x"),
+])
+def test_normalize_url_keeps_empty_segments(href, expected):
+    """Путь, начинающийся с "//", не превращается в ссылку на другой хост"""
+    assert normalize_url(href, "http://example.com/dir/page") == expected
@@ -0,0 +1,21 @@
+"""
+Тесты перцентилей и гистограмм задержек
+"""
+from crawl_stats import percentile
+from metrics import Histogram
+
+def test_percentile_nearest_rank():
+    values = [5.0, 1.0, 4.0, 2.0, 3.0]
+    assert percentile(values, 50) == 3.0
+    assert percentile(values, 95) == 5.0
+    assert percentile(values, 0) == 1.0
+    assert percentile([], 50) == 0.0
+
+def test_histogram_cumulative():
+    """Счетчики корзин накопленные, значение на границе попадает в ее корзину"""
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+    assert histogram.cumulative() == [("0.1", 2), ("1.0", 3), ("+Inf", 4)]
+    assert histogram.count == 4
+    assert abs(histogram.sum - 2.65) < 1e-9
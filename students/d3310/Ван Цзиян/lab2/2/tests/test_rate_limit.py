@@ -0,0 +1,80 @@
+"""
+Тесты адаптивной корзины токенов и ограничения хостов
+"""
+import multiprocessing
+import time
+
+import rate_limit
+from rate_limit import AdaptiveTokenBucket, HostLimiter, SharedHostSlots
+
+class StatusError(Exception):
+    def __init__(self, status: int):
+        self.status = status
+
+def test_reserve_spaces_requests():
+    """Запросы следуют с интервалом 1 / rate, токены не копятся"""
+    bucket = AdaptiveTokenBucket(rate=10, min_rate=1, max_rate=100, latency_target=1.0)
+    waits = [bucket.reserve() for _ in range(3)]
+    assert waits[0] == 0.0
+    assert 0.09 < waits[1] <= 0.1
+    assert 0.19 < waits[2] <= 0.2
+
+def test_slow_start_then_decrease(monkeypatch):
+    """Успехи увеличивают скорость на 1 запрос/с, 429 уменьшает ее, но не ниже min_rate"""
+    monkeypatch.setattr(rate_limit, "DECREASE_COOLDOWN", 0)
+    bucket = AdaptiveTokenBucket(rate=4, min_rate=1, max_rate=100, latency_target=1.0)
+    for _ in range(4):
+        bucket.feedback(0.1, None)
+    assert bucket.rate == 8
+    
+    bucket.feedback(0.1, StatusError(429))
+    assert bucket.rate == 8 * rate_limit.AIMD_DECREASE
+    assert bucket.throttled == 1
+    for _ in range(10):
+        bucket.feedback(0.1, StatusError(503))
+    assert bucket.rate == 1
+
+def test_decrease_cooldown(monkeypatch):
+    """Серия ошибок за время DECREASE_COOLDOWN снижает скорость один раз"""
+    monkeypatch.setattr(rate_limit, "DECREASE_COOLDOWN", 60)
+    bucket = AdaptiveTokenBucket(rate=8, min_rate=1, max_rate=100, latency_target=1.0)
+    for _ in range(5):
+        bucket.feedback(0.1, StatusError(429))
+    assert bucket.decreases == 1
+
+def test_additive_increase_after_decrease(monkeypatch):
+    monkeypatch.setattr(rate_limit, "DECREASE_COOLDOWN", 0)
+    bucket = AdaptiveTokenBucket(rate=10, min_rate=1, max_rate=100, latency_target=1.0)
+    bucket.feedback(2.0, None)
+    assert bucket.rate == 10 * rate_limit.AIMD_DECREASE
+    bucket.feedback(0.1, None)
+    assert bucket.rate == 5 + rate_limit.AIMD_INCREASE / 5
+
+def hold_slots(slots, share, active, peak, lock):
+    """Запросы одного процесса к общему хосту с подсчетом одновременных"""
+    limiter = HostLimiter(share=share, enabled=True, shared=slots)
+    for _ in range(3):
+        with limiter.slot("http://shared.test/page"):
+            with lock:
+                active.value += 1
+                peak.value = max(peak.value, active.value)
+            time.sleep(0.05)
+            with lock:
+                active.value -= 1
+
+def test_shared_slots_cap_all_processes(monkeypatch):
+    """Процессов больше ограничения хоста, но одновременных запросов к хосту не больше HOST_CONCURRENCY"""
+    monkeypatch.setattr(rate_limit, "HOST_CONCURRENCY", 4)
+    monkeypatch.setattr(rate_limit, "HOST_RATE", 1000)
+    monkeypatch.setattr(rate_limit, "HOST_MAX_RATE", 1000)
+    context = multiprocessing.get_context("fork")
+    slots = SharedHostSlots()
+    active, peak, lock = context.Value('i', 0), context.Value('i', 0), context.Lock()
+    processes = [context.Process(target=hold_slots, args=(slots, 8, active, peak, lock)) for _ in range(8)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=30)
+    
+    assert all(process.exitcode == 0 for process in processes)
+    assert 1 < peak.value <= 4
@@ -0,0 +1,66 @@
+"""
+Тесты автоматического выключателя и повторов
+"""
+import asyncio
+
+import pytest
+
+from resilience import CircuitBreaker, CircuitOpenError, HostResilience
+
+URL = "http://example.com/page"
+
+def open_breaker(resilience: HostResilience, cooldown: float) -> CircuitBreaker:
+    """Выключатель хоста URL с разомкнутой цепью"""
+    breaker = CircuitBreaker(threshold=1, cooldown=cooldown)
+    breaker.record(True)
+    resilience._breakers["example.com"] = breaker
+    return breaker
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker(threshold=3, cooldown=60)
+    for _ in range(2):
+        breaker.record(True)
+    assert breaker.allow()
+    breaker.record(True)
+    assert not breaker.allow()
+    assert breaker.trips == 1
+
+def test_breaker_probe_closes_circuit():
+    """После cooldown проходит один пробный запрос, его успех замыкает цепь"""
+    breaker = CircuitBreaker(threshold=1, cooldown=0)
+    breaker.record(True)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record(False)
+    assert breaker.opened_at is None
+    assert breaker.allow()
+
+def test_open_circuit_rejects_without_request():
+    resilience = HostResilience(attempts=1)
+    open_breaker(resilience, cooldown=60)
+    calls = []
+    with pytest.raises(CircuitOpenError):
+        resilience.call(URL, lambda: calls.append(1))
+    assert calls == []
+
+def test_breaker_recovers_after_cancelled_probe():
+    """Отмененный пробный запрос не оставляет цепь разомкнутой навсегда"""
+    resilience = HostResilience(attempts=1)
+    breaker = open_breaker(resilience, cooldown=0)
+    
+    async def hang():
+        await asyncio.sleep(60)
+    
+    async def ok():
+        return "ok"
+    
+    async def scenario():
+        probe = asyncio.create_task(resilience.acall(URL, hang))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        return await resilience.acall(URL, ok)
+    
+    assert asyncio.run(scenario()) == "ok"
+    assert breaker.opened_at is None
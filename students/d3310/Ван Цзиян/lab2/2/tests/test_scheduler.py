@@ -0,0 +1,52 @@
+"""
+Тесты общей очереди URL с чередованием хостов
+"""
+import threading
+
+import pytest
+
+from frontier import Frontier
+from scheduler import HostFairQueue
+
+def drain(queue: HostFairQueue) -> list:
+    """URL в порядке выдачи одним потоком"""
+    urls = []
+    while True:
+        url = queue.get()
+        if url is None:
+            return urls
+        urls.append(url)
+        queue.done(url)
+
+def test_hosts_alternate():
+    """URL разных хостов выдаются по очереди, а не подряд по одному хосту"""
+    urls = [f"http://a/{i}" for i in range(3)] + [f"http://b/{i}" for i in range(3)]
+    frontier = Frontier(urls, window=10, max_depth=0)
+    issued = drain(HostFairQueue(frontier))
+    
+    assert sorted(issued) == sorted(urls)
+    assert [url[7] for url in issued] == ["a", "b", "a", "b", "a", "b"]
+
+def test_failed_refill_keeps_batch():
+    """Ошибка on_refill не теряет выданные Frontier URL: обход завершается"""
+    calls = []
+    
+    def on_refill(batch):
+        calls.append(batch)
+        if len(calls) == 1:
+            raise RuntimeError("cache read failed")
+    
+    urls = [f"http://a/{i}" for i in range(4)]
+    frontier = Frontier(urls, window=4, max_depth=0)
+    queue = HostFairQueue(frontier, on_refill=on_refill)
+    with pytest.raises(RuntimeError):
+        queue.get()
+    
+    result = []
+    worker = threading.Thread(target=lambda: result.extend(drain(queue)), daemon=True)
+    worker.start()
+    worker.join(timeout=5)
+    
+    assert not worker.is_alive()
+    assert sorted(result) == urls
+    assert frontier.finished
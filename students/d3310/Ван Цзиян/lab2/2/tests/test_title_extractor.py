@@ -0,0 +1,52 @@
+"""
+Тесты хэша тела страницы
+"""
+import random
+
+from title_extractor import BodyHasher, PrefixHasher, content_hash
+
+PAGE = (b'<!DOCTYPE html><html><head><meta charset="utf-8">'
+        b'<title>Page title</title></head><body>' + b'<p>text</p>' * 500 + b'</body></html>')
+
+def hash_chunks(content: bytes, cuts: list, max_bytes: int = 1 << 20) -> str:
+    """Хэш тела, разбитого на части по позициям cuts"""
+    hasher = PrefixHasher(max_bytes)
+    bounds = [0] + sorted(cuts) + [len(content)]
+    for start, end in zip(bounds, bounds[1:]):
+        hasher.update(content[start:end])
+    return hasher.hexdigest()
+
+def test_hash_does_not_depend_on_chunking():
+    """Любое разбиение тела на части дает хэш тела, прочитанного одной частью"""
+    expected = hash_chunks(PAGE, [])
+    rng = random.Random(1)
+    for _ in range(200):
+        cuts = rng.sample(range(1, len(PAGE)), rng.randint(1, 20))
+        assert hash_chunks(PAGE, cuts) == expected
+
+def test_prefix_hash_covers_only_prefix():
+    """Изменение тела после </title> не меняет хэш начала тела, изменение заголовка меняет"""
+    assert hash_chunks(PAGE.replace(b'<p>text</p>', b'<p>other</p>'), []) == hash_chunks(PAGE, [])
+    assert hash_chunks(PAGE.replace(b'Page title', b'New title'), []) != hash_chunks(PAGE, [])
+
+def test_full_body_hash_covers_whole_body():
+    """Хэш полностью загруженного тела меняется при изменении после </title> и не зависит от разбиения"""
+    assert content_hash(PAGE.replace(b'<p>text</p>', b'<p>other</p>', 1)) != content_hash(PAGE)
+    hasher = BodyHasher()
+    for start in range(0, len(PAGE), 700):
+        hasher.update(PAGE[start:start + 700])
+    assert hasher.hexdigest() == content_hash(PAGE)
+
+def test_boundary_split_inside_tag():
+    """Граница </title> разрезана между частями в каждом возможном месте"""
+    end = PAGE.index(b'</title>')
+    expected = hash_chunks(PAGE, [])
+    for cut in range(end - 2, end + len(b'</title>') + 2):
+        assert hash_chunks(PAGE, [cut]) == expected
+
+def test_hash_stops_at_max_bytes():
+    """Без </title> и <body> хэшируется не больше max_bytes, независимо от разбиения"""
+    content = b'x' * 5000
+    expected = hash_chunks(content, [], max_bytes=1000)
+    assert hash_chunks(content, [10, 999, 1001, 3000], max_bytes=1000) == expected
+    assert hash_chunks(content + b'tail', [], max_bytes=1000) == expected
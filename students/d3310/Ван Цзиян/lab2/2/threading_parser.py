@@ -1,115 +1,210 @@
-import threading
+import math
 import time
-import requests
-from bs4 import BeautifulSoup, XMLParsedAsHTMLWarning
 from concurrent.futures import ThreadPoolExecutor
-from database import db_manager
-from config import URLS, THREADING_WORKERS
+from database import db_manager, BatchWriter, NullWriter, result_rows
+from config import THREADING_WORKERS, DB_POOL_SIZE, THREADING_SCHEDULING, FRONTIER_POLL_INTERVAL
+from crawl_stats import CrawlStats
+from frontier import Frontier
+from scheduler import HostFairQueue
+from http_client import ClientRegistry
+from rate_limit import HostLimiter
+from http_cache import HttpCache
+from title_extractor import fetch_page_title, page_changed, unchanged_reason
+from typing import List
 import logging
-import warnings
-from urllib.parse import urlparse
-
-# Игнорировать предупреждения XML парсинга
-warnings.filterwarnings("ignore", category=XMLParsedAsHTMLWarning)
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def parse_and_save(url: str) -> bool:
+def parse_and_save(url: str, clients: ClientRegistry, limiter: HostLimiter,
+                   cache: HttpCache, links: bool = False) -> dict:
     """
-    Парсинг указанного URL и сохранение в базу данных
+    Парсинг указанного URL
+    
+    Строки страницы, ссылок и статуса URL записывает вызывающий поток
+    (result_rows) одной группой, чтобы они попали в одну транзакцию.
     
     Args:
         url: URL веб-страницы для парсинга
+        clients: HTTP-клиенты с keep-alive соединениями потоков
+        limiter: ограничения запросов по хостам
+        cache: кэш валидаторов для условных запросов и хэшей прошлого обхода
+        links: Извлекать ли ссылки страницы (обход по ссылкам)
         
     Returns:
-        bool: Успешность парсинга и сохранения
+        dict: Результат по URL (url, success, title, etag, last_modified, not_modified,
+        content_hash, unchanged, links, elapsed, timings)
     """
+    started = time.perf_counter()
+    timings = {}
     try:
-        # Отправка HTTP-запроса
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
+        # Загрузка и разбор: общий этап синхронных режимов
+        # Слот хоста на каждую попытку, повторы после временных ошибок
+        page = limiter.fetch(url, lambda: fetch_page_title(url, clients.get_client(), cached=cache.get(url),
+                                                           stored=cache.stored(url), links=links,
+                                                           timings=timings))
+        title_text = page["title"]
         
-        # Единый HTML парсер, игнорировать XML предупреждения
-        soup = BeautifulSoup(response.content, 'html.parser')
-        title = soup.find('title')
-        
-        if title:
-            title_text = title.get_text().strip()
+        if not page_changed(page):
+            # Страница не изменилась с прошлого обхода: строка не записывается
+            print(f"[threading] {url} -> {title_text} ({unchanged_reason(page)})")
         else:
-            # Для страниц без title использовать путь URL как заголовок
-            parsed_url = urlparse(url)
-            path = parsed_url.path.strip('/')
-            if path:
-                title_text = f"{parsed_url.netloc} - {path}"
-            else:
-                title_text = f"{parsed_url.netloc} - главная"
-        
-        # Сохранение в базу данных
-        success = db_manager.save_page_data(url, title_text, "threading")
-        
-        # Вывод результата на экран
-        if success:
+            # Вывод результата на экран
             print(f"[threading] {url} -> {title_text}")
-        else:
-            print(f"[threading] {url} -> ошибка сохранения")
-            
-        return success
         
+        return {"url": url, "success": True, **page, "elapsed": time.perf_counter() - started, "timings": timings}
+    
     except Exception as e:
         logger.error(f"Ошибка парсинга {url}: {e}")
         print(f"[threading] {url} -> ошибка парсинга: {e}")
-        return False
+        return {"url": url, "success": False, "error": str(e), "elapsed": time.perf_counter() - started,
+                "timings": timings}
 
-def worker(urls: list):
+def process(url: str, frontier: Frontier, writer: BatchWriter, clients: ClientRegistry, limiter: HostLimiter,
+            cache: HttpCache, stats: CrawlStats):
+    """Обработка URL и учет результата: итоги обхода, ссылки и статус URL, валидаторы для кэша"""
+    result = parse_and_save(url, clients, limiter, cache, frontier.follows(url))
+    stats.add(result)
+    # Страница, ссылки и статус URL одной группой: сброс буфера не разделит их между транзакциями,
+    # валидаторы сохраняются в кэш после commit группы
+    writer.add_many(result_rows(result, "threading") + frontier.complete(result), [result])
+    cache.forget(url)
+
+def worker(urls: list, frontier: Frontier, writer: BatchWriter, clients: ClientRegistry, limiter: HostLimiter,
+           cache: HttpCache, stats: CrawlStats):
     """
     Функция рабочего потока, обработка группы URL
     
     Args:
         urls: Список URL для обработки
+        frontier: Очередь URL (глубина и найденные ссылки)
+        writer: буферизованный writer для пакетной записи
+        clients: HTTP-клиенты с keep-alive соединениями потоков
+        limiter: ограничения запросов по хостам
+        cache: кэш валидаторов для условных запросов
+        stats: итоги обхода
     """
     for url in urls:
-        parse_and_save(url)
+        process(url, frontier, writer, clients, limiter, cache, stats)
 
-def main():
-    """Главная функция"""
-    print("=== Многопоточный парсер веб-страниц ===")
-    start_time = time.time()
+def queue_worker(work_queue: HostFairQueue, frontier: Frontier, writer: BatchWriter, clients: ClientRegistry,
+                 limiter: HostLimiter, cache: HttpCache, stats: CrawlStats):
+    """
+    Функция рабочего потока, обработка URL из общей очереди
+    
+    Поток берет следующий URL, как только освобождается, поэтому
+    медленные страницы не задерживают заранее назначенную группу.
+    
+    Args:
+        work_queue: общая очередь URL с чередованием хостов
+        frontier: Очередь URL (глубина и найденные ссылки)
+        writer: буферизованный writer для пакетной записи
+        clients: HTTP-клиенты с keep-alive соединениями потоков
+        limiter: ограничения запросов по хостам
+        cache: кэш валидаторов для условных запросов
+        stats: итоги обхода
+    """
+    while True:
+        url = None
+        try:
+            url = work_queue.get()
+            if url is None:
+                return
+            process(url, frontier, writer, clients, limiter, cache, stats)
+        finally:
+            if url is not None:
+                work_queue.done(url)
+
+def run(frontier: Frontier, store: bool = True, scheduling: str = THREADING_SCHEDULING) -> CrawlStats:
+    """
+    Многопоточная обработка URL из очереди
+    
+    Args:
+        frontier: Очередь URL
+        store: Записывать ли результаты в базу данных
+        scheduling: "dynamic" - общая очередь, "static" - равные части каждого окна очереди
+        
+    Returns:
+        CrawlStats: Итоги обхода
+    """
+    # Валидаторы и хэши прошлого обхода читаются для каждой группы URL из очереди
+    cache = HttpCache("threading")
+    
+    if store:
+        # Подключение к базе данных через пул: каждый поток пишет через свое соединение
+        if not db_manager.connect_pool(maxconn=DB_POOL_SIZE):
+            raise RuntimeError("Не удалось подключиться к базе данных")
+        
+        # Создание таблицы данных
+        db_manager.create_table()
+        writer = BatchWriter(db_manager, on_commit=cache.save).start()
+    else:
+        writer = NullWriter()
     
-    # Подключение к базе данных
-    if not db_manager.connect():
-        print("Не удалось подключиться к базе данных, выход из программы")
-        return
+    print(f"Использование {THREADING_WORKERS} рабочих потоков и {DB_POOL_SIZE} соединений с БД "
+          f"(распределение: {scheduling}, окно очереди: {frontier.window} URL)")
     
-    # Создание таблицы данных
-    db_manager.create_table()
+    stats = CrawlStats()
     
-    # Разделение списка URL на равные части
-    chunk_size = len(URLS) // THREADING_WORKERS
-    if len(URLS) % THREADING_WORKERS != 0:
-        chunk_size += 1
+    # Сессия с keep-alive на каждый поток (или общий клиент httpx с пулом на все потоки)
+    clients = ClientRegistry(pool_size=THREADING_WORKERS)
     
-    url_chunks = [URLS[i:i + chunk_size] for i in range(0, len(URLS), chunk_size)]
+    # Семафор и адаптивная скорость на каждый хост
+    limiter = HostLimiter()
     
-    print(f"Использование {THREADING_WORKERS} рабочих потоков для обработки {len(URLS)} URL")
+    def prefetch(batch: List[str]):
+        cache.prefetch(batch).with_stored(db_manager.stored_pages(batch, "threading") if store else {})
     
     # Использование ThreadPoolExecutor для управления пулом потоков
     with ThreadPoolExecutor(max_workers=THREADING_WORKERS) as executor:
-        # Отправка всех задач
-        futures = [executor.submit(worker, chunk) for chunk in url_chunks]
-        
-        # Ожидание завершения всех задач
-        for future in futures:
-            future.result()
+        if scheduling == "static":
+            # Каждое окно очереди делится на равные части заранее
+            while True:
+                batch = frontier.get_batch(frontier.window)
+                if not batch:
+                    if frontier.finished:
+                        break
+                    time.sleep(FRONTIER_POLL_INTERVAL)
+                    continue
+                prefetch(batch)
+                chunk_size = math.ceil(len(batch) / THREADING_WORKERS)
+                url_chunks = [batch[i:i + chunk_size] for i in range(0, len(batch), chunk_size)]
+                futures = [executor.submit(worker, chunk, frontier, writer, clients, limiter, cache, stats)
+                           for chunk in url_chunks]
+                for future in futures:
+                    future.result()
+                frontier.done(len(batch))
+        else:
+            # Общая очередь: каждый поток берет следующий URL по мере освобождения
+            work_queue = HostFairQueue(frontier, on_refill=prefetch)
+            futures = [executor.submit(queue_worker, work_queue, frontier, writer, clients, limiter, cache, stats)
+                       for _ in range(THREADING_WORKERS)]
+            
+            # Ожидание завершения всех задач
+            for future in futures:
+                future.result()
     
-    # Расчет времени выполнения
-    execution_time = time.time() - start_time
+    # Закрытие HTTP-клиентов и статистика повторного использования соединений
+    http_stats = clients.close()
+    http_stats.report("threading")
+    limiter.report("threading")
     
-    print(f"[threading] Завершено {len(URLS)} URL, время {execution_time:.2f}s")
+    # Финальный сброс буфера (и валидаторов для следующего обхода)
+    writer.close()
+    writer.report("threading")
+    cache.report("threading", stats)
     
-    # Закрытие соединения с базой данных
-    db_manager.close()
+    if store:
+        # Закрытие соединения с базой данных
+        db_manager.close()
+    
+    return stats
+
+def main():
+    """Главная функция"""
+    import crawl_engine
+    crawl_engine.main(["--mode", "threading"])
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,614 @@
+import codecs
+import hashlib
+import html
+import logging
+import re
+import time
+import warnings
+import aiohttp
+import requests
+from bs4 import BeautifulSoup, XMLParsedAsHTMLWarning
+from html.parser import HTMLParser
+from links import page_links
+from metrics import add_timing, response_timings
+from config import (STREAM_MAX_BYTES, STREAM_CHUNK_SIZE, STREAM_DRAIN_BYTES, TITLE_BACKENDS, REGEX_MAX_BYTES,
+                    TITLE_STREAMING, CONTENT_HASH_ENABLED, HTTP_TIMEOUT, HTTP_CONNECT_TIMEOUT)
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+from urllib.parse import urlparse
+
+# Необязательные быстрые бэкенды разбора
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+try:
+    from selectolax.parser import HTMLParser as SelectolaxParser
+except ImportError:
+    SelectolaxParser = None
+
+# Игнорировать предупреждения XML парсинга
+warnings.filterwarnings("ignore", category=XMLParsedAsHTMLWarning)
+
+logger = logging.getLogger(__name__)
+
+# Таймаут синхронных запросов: (соединение, чтение) в формате requests
+Timeout = Union[float, Tuple[float, float]]
+REQUEST_TIMEOUT = (HTTP_CONNECT_TIMEOUT, HTTP_TIMEOUT)
+
+# Ограниченный поиск title регулярным выражением
+TITLE_RE = re.compile(rb'<title[^>]*>(.*?)</title\s*>', re.IGNORECASE | re.DOTALL)
+
+# Конец хэшируемого начала тела: первый </title> или <body>
+HASH_END_RE = re.compile(rb'</title\s*>|<body\b[^<>]*>', re.IGNORECASE)
+
+def fallback_title(url: str) -> str:
+    """
+    Заголовок по умолчанию для страниц без title
+    
+    Args:
+        url: URL страницы
+        
+    Returns:
+        str: Заголовок из домена и пути URL
+    """
+    parsed_url = urlparse(url)
+    path = parsed_url.path.strip('/')
+    if path:
+        return f"{parsed_url.netloc} - {path}"
+    return f"{parsed_url.netloc} - главная"
+
+def title_html_parser(content: bytes) -> Optional[str]:
+    """Бэкенд BeautifulSoup + html.parser (самый медленный, без зависимостей)"""
+    title = BeautifulSoup(content, 'html.parser').find('title')
+    return title.get_text().strip() if title else None
+
+def title_lxml(content: bytes) -> Optional[str]:
+    """Бэкенд lxml.html"""
+    if lxml is None:
+        raise RuntimeError("lxml не установлен")
+    title = lxml.html.fromstring(content).findtext('.//title')
+    return title.strip() if title is not None else None
+
+def title_selectolax(content: bytes) -> Optional[str]:
+    """Бэкенд selectolax (парсер Lexbor)"""
+    if SelectolaxParser is None:
+        raise RuntimeError("selectolax не установлен")
+    node = SelectolaxParser(content).css_first('title')
+    return node.text(strip=True) if node is not None else None
+
+def title_regex(content: bytes) -> Optional[str]:
+    """
+    Быстрый путь: регулярное выражение по первым REGEX_MAX_BYTES байтам
+    
+    Если title не найден, а тело длиннее границы поиска, результат
+    недостоверен, и разбор передается следующему бэкенду цепочки.
+    """
+    match = TITLE_RE.search(content, 0, REGEX_MAX_BYTES)
+    if match:
+        return html.unescape(match.group(1).decode('utf-8', errors='replace')).strip()
+    if len(content) > REGEX_MAX_BYTES:
+        raise ValueError(f"title не найден в первых {REGEX_MAX_BYTES} байтах")
+    return None
+
+# Доступные бэкенды извлечения заголовка
+BACKENDS: Dict[str, Callable[[bytes], Optional[str]]] = {
+    'html.parser': title_html_parser,
+    'lxml': title_lxml,
+    'selectolax': title_selectolax,
+    'regex': title_regex,
+}
+
+def available_backends() -> List[str]:
+    """Бэкенды, библиотеки которых установлены"""
+    missing = {'lxml': lxml is None, 'selectolax': SelectolaxParser is None}
+    return [name for name in BACKENDS if not missing.get(name, False)]
+
+def resolve_backends(names: Iterable[str]) -> List[Tuple[str, Callable[[bytes], Optional[str]]]]:
+    """
+    Цепочка бэкендов из конфигурации без неустановленных библиотек
+    
+    Args:
+        names: Имена бэкендов в порядке приоритета
+        
+    Returns:
+        List: Пары (имя, функция); html.parser всегда замыкает цепочку
+    """
+    available = available_backends()
+    chain = []
+    for name in names:
+        name = name.strip()
+        if name not in BACKENDS:
+            logger.warning(f"Неизвестный бэкенд извлечения заголовка: {name}")
+        elif name not in available:
+            logger.warning(f"Бэкенд {name} недоступен, пропускается")
+        else:
+            chain.append((name, BACKENDS[name]))
+    if 'html.parser' not in [name for name, _ in chain]:
+        chain.append(('html.parser', title_html_parser))
+    return chain
+
+# Цепочка бэкендов из config.TITLE_BACKENDS
+BACKEND_CHAIN = resolve_backends(TITLE_BACKENDS)
+
+def extract_title(content: bytes, url: str, chain=None) -> str:
+    """
+    Извлечение заголовка из тела страницы цепочкой бэкендов
+    
+    Бэкенды пробуются по порядку; при ошибке бэкенда разбор передается
+    следующему. Если заголовка нет, используется заголовок по умолчанию.
+    
+    Args:
+        content: Тело HTTP-ответа
+        url: URL страницы
+        chain: Цепочка бэкендов (по умолчанию из конфигурации)
+        
+    Returns:
+        str: Заголовок страницы
+    """
+    for name, backend in chain or BACKEND_CHAIN:
+        try:
+            title = backend(content)
+        except Exception as e:
+            logger.debug(f"Бэкенд {name} не справился с {url}: {e}")
+            continue
+        return title or fallback_title(url)
+    return fallback_title(url)
+
+def response_encoding(content_type: Optional[str]) -> str:
+    """
+    Кодировка из заголовка Content-Type
+    
+    Args:
+        content_type: Значение заголовка Content-Type
+        
+    Returns:
+        str: Кодировка из параметра charset или utf-8
+    """
+    if content_type:
+        for param in content_type.split(';')[1:]:
+            name, _, value = param.strip().partition('=')
+            if name.lower() == 'charset' and value:
+                encoding = value.strip('"\' ')
+                try:
+                    codecs.lookup(encoding)
+                    return encoding
+                except LookupError:
+                    break
+    return 'utf-8'
+
+class TitleStreamParser(HTMLParser):
+    """
+    Инкрементальный токенизатор, который ищет <title> и, при обходе по ссылкам, <a href>
+    
+    Данные подаются частями через feed(). Без сбора ссылок разбор завершается,
+    как только встретился </title> или начался <body> (title бывает только
+    в <head>). Со сбором ссылок разбирается вся страница, а значения href
+    добавляются в список links.
+    """
+    
+    def __init__(self, links: Optional[List[str]] = None):
+        super().__init__()
+        self.done = False
+        self.found = False
+        self.links = links
+        self._in_title = False
+        self._parts = []
+    
+    def handle_starttag(self, tag, attrs):
+        if tag == 'title' and not self.found:
+            self._in_title = True
+        elif tag == 'a' and self.links is not None:
+            href = dict(attrs).get('href')
+            if href:
+                self.links.append(href)
+        elif tag == 'body' and self.links is None:
+            self.done = True
+    
+    def handle_endtag(self, tag):
+        if tag == 'title' and self._in_title:
+            self._in_title = False
+            self.found = True
+            self.done = self.links is None
+    
+    def handle_data(self, data):
+        if self._in_title:
+            self._parts.append(data)
+    
+    def feed_text(self, text: str):
+        """
+        Подача очередной части текста
+        
+        Если в части есть </title> или <body>, сначала разбирается только текст
+        до этого тега, чтобы не токенизировать остаток части после остановки.
+        """
+        if self.links is not None:
+            # Ссылки собираются по всей странице, остановки нет
+            self.feed(text)
+            return
+        lowered = text.lower()
+        stops = [pos for pos in (lowered.find('</title'), lowered.find('<body')) if pos >= 0]
+        if stops:
+            close = lowered.find('>', min(stops))
+            if close >= 0:
+                self.feed(text[:close + 1])
+                if self.done:
+                    return
+                text = text[close + 1:]
+        self.feed(text)
+    
+    @property
+    def title(self) -> Optional[str]:
+        """Текст заголовка или None, если </title> не встретился"""
+        if not self.found:
+            return None
+        return ''.join(self._parts).strip()
+
+class PrefixHasher:
+    """
+    Хэш начала тела до конца первого </title> или <body>, но не дальше max_bytes
+    
+    Заголовок зависит только от этой части тела, поэтому потоковому чтению
+    заголовка не нужно дочитывать страницу ради хэша. Такой хэш замечает
+    только изменения начала страницы (заголовка и <head>). Граница ищется
+    в байтах тела, а не по границам частей ответа: хэш одного и того же
+    тела не зависит от того, как сеть разбила его на части.
+    """
+    
+    def __init__(self, max_bytes: int = STREAM_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.complete = False
+        self._hasher = hashlib.blake2b(digest_size=16)
+        self._tail = b''  # начало возможного тега на стыке частей, еще не хэшировано
+        self._read = 0
+    
+    def update(self, chunk: bytes):
+        if self.complete:
+            return
+        chunk = chunk[:self.max_bytes - self._read]
+        self._read += len(chunk)
+        data = self._tail + chunk
+        self._tail = b''
+        match = HASH_END_RE.search(data)
+        if match:
+            self._hasher.update(data[:match.end()])
+            self.complete = True
+        elif self._read >= self.max_bytes:
+            self._hasher.update(data)
+            self.complete = True
+        else:
+            # Тег границы начинается с "<" и не содержит других "<"
+            keep = data.rfind(b'<')
+            if keep < 0:
+                keep = len(data)
+            self._hasher.update(data[:keep])
+            self._tail = data[keep:]
+    
+    def hexdigest(self) -> str:
+        hasher = self._hasher.copy()
+        hasher.update(self._tail)
+        return hasher.hexdigest()
+
+class BodyHasher:
+    """
+    Хэш всего прочитанного тела с интерфейсом PrefixHasher
+    
+    Используется, когда тело читается целиком (обход по ссылкам и
+    TITLE_STREAMING=0): совпадение хэша означает, что не изменилась вся
+    страница, а не только заголовок. Хэш не бывает законченным раньше
+    конца тела, поэтому не останавливает чтение.
+    """
+    
+    complete = False
+    
+    def __init__(self):
+        self._hasher = hashlib.blake2b(digest_size=16)
+    
+    def update(self, chunk: bytes):
+        self._hasher.update(chunk)
+    
+    def hexdigest(self) -> str:
+        return self._hasher.hexdigest()
+
+def content_hasher(whole: bool = False):
+    """
+    Объект хэширования тела ответа
+    
+    Args:
+        whole: Читается ли тело целиком; иначе хэшируется только начало тела до </title>
+        
+    Returns:
+        BodyHasher или PrefixHasher (blake2b, 128 бит) или None, если сравнение по хэшу отключено
+    """
+    if not CONTENT_HASH_ENABLED:
+        return None
+    return BodyHasher() if whole else PrefixHasher()
+
+def content_hash(content: bytes) -> Optional[str]:
+    """Хэш всего полностью загруженного тела (hex) или None"""
+    hasher = content_hasher(whole=True)
+    if hasher is None:
+        return None
+    hasher.update(content)
+    return hasher.hexdigest()
+
+def reading_done(parser: TitleStreamParser, hasher, read: int, max_bytes: int) -> bool:
+    """Можно ли прекратить чтение частей: разбор и хэш закончены или прочитано max_bytes"""
+    return (parser.done and (hasher is None or hasher.complete)) or read >= max_bytes
+
+def stream_title(chunks: Iterable[bytes], max_bytes: int = STREAM_MAX_BYTES, encoding: str = 'utf-8',
+                 hasher=None, links: Optional[List[str]] = None,
+                 timings: Optional[dict] = None) -> Tuple[Optional[str], int]:
+    """
+    Поиск заголовка в потоке частей тела ответа
+    
+    Args:
+        chunks: Части тела ответа
+        max_bytes: Максимальное количество байт для чтения
+        encoding: Кодировка тела ответа
+        hasher: PrefixHasher или BodyHasher прочитанных частей или None; чтение продолжается, пока хэш не закончен
+        links: Список для значений href; если задан, читается вся страница до max_bytes
+        timings: Замеры URL: время разбора частей - "parse", остальное время чтения - "download"
+        
+    Returns:
+        Tuple[Optional[str], int]: Заголовок (или None) и количество прочитанных байт
+    """
+    parser = TitleStreamParser(links)
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    read = 0
+    parse_time = 0.0
+    started = time.perf_counter()
+    for chunk in chunks:
+        read += len(chunk)
+        if hasher is not None:
+            hasher.update(chunk)
+        parse_started = time.perf_counter()
+        if not parser.done:
+            parser.feed_text(decoder.decode(chunk))
+        parse_time += time.perf_counter() - parse_started
+        if reading_done(parser, hasher, read, max_bytes):
+            break
+    add_timing(timings, "download", time.perf_counter() - started - parse_time)
+    add_timing(timings, "parse", parse_time)
+    return parser.title, read
+
+def extract_title_links(content: bytes, url: str, encoding: str = 'utf-8') -> Tuple[str, List[str]]:
+    """
+    Заголовок и ссылки полного тела страницы за один проход токенизатора
+    
+    Args:
+        content: Тело HTTP-ответа
+        url: URL страницы (для заголовка по умолчанию)
+        encoding: Кодировка тела ответа
+        
+    Returns:
+        Tuple[str, List[str]]: Заголовок и значения href в порядке появления
+    """
+    hrefs = []
+    title, _ = stream_title([content], max_bytes=len(content) + 1, encoding=encoding, links=hrefs)
+    return title or fallback_title(url), hrefs
+
+def conditional_headers(cached: Optional[dict]) -> Dict[str, str]:
+    """
+    Заголовки условного запроса по валидаторам из кэша
+    
+    Args:
+        cached: Запись кэша (title, etag, last_modified) или None
+        
+    Returns:
+        Dict[str, str]: If-None-Match и/или If-Modified-Since
+    """
+    headers = {}
+    if cached:
+        if cached.get("etag"):
+            headers['If-None-Match'] = cached["etag"]
+        if cached.get("last_modified"):
+            headers['If-Modified-Since'] = cached["last_modified"]
+    return headers
+
+def unchanged(digest: Optional[str], stored: Optional[dict]) -> bool:
+    """
+    Совпадает ли хэш тела с хэшем, записанным в web_pages прошлым обходом
+    
+    Args:
+        digest: Хэш тела ответа или None
+        stored: Прошлая запись страницы (content_hash, title) или None
+    """
+    return digest is not None and stored is not None and stored["content_hash"] == digest
+
+def page_result(title: str, headers, cached: Optional[dict] = None, digest: Optional[str] = None,
+                stored: Optional[dict] = None, links: Optional[List[str]] = None) -> dict:
+    """
+    Результат загрузки страницы с валидаторами для кэша
+    
+    Args:
+        title: Заголовок страницы
+        headers: Заголовки ответа
+        cached: Запись кэша, если сервер ответил 304
+        digest: Хэш тела ответа
+        stored: Прошлая запись страницы, если хэш совпал
+        links: Нормализованные ссылки страницы при обходе по ссылкам
+        
+    Returns:
+        dict: title, etag, last_modified, not_modified, content_hash, unchanged и links
+    """
+    cached_validators = cached or {}
+    return {
+        "title": stored["title"] if stored else title,
+        "etag": headers.get('ETag') or cached_validators.get("etag"),
+        "last_modified": headers.get('Last-Modified') or cached_validators.get("last_modified"),
+        "not_modified": cached is not None,
+        "content_hash": digest,
+        "unchanged": stored is not None,
+        "links": links or [],
+    }
+
+def page_changed(page: dict) -> bool:
+    """Нужно ли записывать страницу: нет ответа 304 и хэш тела отличается от прошлого"""
+    return not page["not_modified"] and not page["unchanged"]
+
+def unchanged_reason(page: dict) -> str:
+    """Пометка для вывода неизменившейся страницы"""
+    return "без изменений" if page["not_modified"] else "тот же хэш"
+
+def fetch_title(url: str, http=requests, timeout: Timeout = REQUEST_TIMEOUT, cached: Optional[dict] = None,
+                stored: Optional[dict] = None, links: bool = False, timings: Optional[dict] = None) -> dict:
+    """
+    Потоковая загрузка страницы до </title>
+    
+    Тело читается частями до </title> или до max_bytes. Остаток страницы
+    дочитывается, только если он не больше STREAM_DRAIN_BYTES: полностью
+    прочитанный ответ возвращает соединение в пул сессии, а недочитанный
+    закрывает его. Хэш считается по началу тела до </title> (PrefixHasher):
+    заголовок зависит только от него.
+    
+    При links=True читается вся страница до max_bytes и собираются ссылки,
+    а запрос отправляется без условных заголовков: ответ 304 не содержит
+    ссылок. Хэш тогда считается по всему прочитанному телу (BodyHasher),
+    чтобы изменение ссылок после заголовка не считалось тем же хэшем.
+    
+    Args:
+        url: URL веб-страницы
+        http: Модуль requests, requests.Session или клиент из http_client
+        timeout: Таймаут в секундах или пара (соединение, чтение)
+        cached: Запись кэша для условного запроса
+        stored: Прошлая запись страницы в web_pages (content_hash, title)
+        links: Извлекать ли ссылки страницы
+        timings: Замеры этапов URL (connect, ttfb, download, parse) или None
+        
+    Returns:
+        dict: Заголовок (или заголовок по умолчанию), валидаторы, хэш ответа и ссылки
+    """
+    if links:
+        cached = None
+    hrefs = [] if links else None
+    started = time.perf_counter()
+    with http.get(url, timeout=timeout, stream=True, headers=conditional_headers(cached)) as response:
+        response_timings(timings, started, getattr(response, 'connect_time', None))
+        if response.status_code == 304 and cached:
+            # Страница не изменилась: заголовок берется из кэша
+            return page_result(cached["title"], response.headers, cached)
+        response.raise_for_status()
+        encoding = response_encoding(response.headers.get('Content-Type'))
+        chunks = response.iter_content(STREAM_CHUNK_SIZE)
+        hasher = content_hasher(whole=links)
+        title, _ = stream_title(chunks, encoding=encoding, hasher=hasher, links=hrefs, timings=timings)
+        
+        # Короткий остаток дешевле дочитать, чем открывать новое соединение
+        drain_started = time.perf_counter()
+        drained = 0
+        for chunk in chunks:
+            drained += len(chunk)
+            if drained > STREAM_DRAIN_BYTES:
+                break
+        add_timing(timings, "download", time.perf_counter() - drain_started)
+    digest = hasher.hexdigest() if hasher is not None else None
+    stored = stored if unchanged(digest, stored) else None
+    return page_result(title or fallback_title(url), response.headers, digest=digest, stored=stored,
+                       links=page_links(hrefs, response.url) if links else None)
+
+async def fetch_title_async(url: str, session: aiohttp.ClientSession, cached: Optional[dict] = None,
+                            stored: Optional[dict] = None, links: bool = False,
+                            timings: Optional[dict] = None) -> dict:
+    """
+    Асинхронная потоковая загрузка страницы до </title> (при links=True - всей страницы, см. fetch_title)
+    
+    Args:
+        url: URL веб-страницы
+        session: aiohttp сессия
+        cached: Запись кэша для условного запроса
+        stored: Прошлая запись страницы в web_pages (content_hash, title)
+        links: Извлекать ли ссылки страницы
+        timings: Замеры этапов URL; dns, connect и ttfb пишет трассировка сессии (metrics.trace_config)
+        
+    Returns:
+        dict: Заголовок (или заголовок по умолчанию), валидаторы, хэш ответа и ссылки
+    """
+    if links:
+        cached = None
+    hrefs = [] if links else None
+    async with session.get(url, headers=conditional_headers(cached), trace_request_ctx=timings) as response:
+        if response.status == 304 and cached:
+            return page_result(cached["title"], response.headers, cached)
+        response.raise_for_status()
+        parser = TitleStreamParser(hrefs)
+        decoder = codecs.getincrementaldecoder(response_encoding(response.headers.get('Content-Type')))(errors='replace')
+        hasher = content_hasher(whole=links)
+        read = 0
+        parse_time = 0.0
+        body_started = time.perf_counter()
+        async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+            read += len(chunk)
+            if hasher is not None:
+                hasher.update(chunk)
+            parse_started = time.perf_counter()
+            if not parser.done:
+                parser.feed_text(decoder.decode(chunk))
+            parse_time += time.perf_counter() - parse_started
+            if reading_done(parser, hasher, read, STREAM_MAX_BYTES):
+                break
+        add_timing(timings, "download", time.perf_counter() - body_started - parse_time)
+        add_timing(timings, "parse", parse_time)
+        if not response.content.at_eof():
+            # Остаток тела не нужен: соединение закрывается, а не возвращается в пул
+            response.close()
+    digest = hasher.hexdigest() if hasher is not None else None
+    stored = stored if unchanged(digest, stored) else None
+    return page_result(parser.title or fallback_title(url), response.headers, digest=digest, stored=stored,
+                       links=page_links(hrefs, str(response.url)) if links else None)
+
+def fetch_page_title(url: str, http=requests, timeout: Timeout = REQUEST_TIMEOUT, cached: Optional[dict] = None,
+                     stored: Optional[dict] = None, links: bool = False, timings: Optional[dict] = None) -> dict:
+    """
+    Общий этап загрузки и разбора для синхронных режимов
+    
+    При TITLE_STREAMING ответ читается частями до </title>,
+    иначе загружается все тело и разбирается цепочкой бэкендов.
+    Если есть запись кэша, запрос условный, и на ответ 304 заголовок
+    берется из кэша без загрузки и разбора тела. Если хэш тела совпал
+    с хэшем прошлого обхода в web_pages, тело не разбирается, а заголовок
+    берется из прошлой записи. Полностью загруженное тело хэшируется
+    целиком (content_hash).
+    
+    При links=True запрос безусловный, и тело разбирается всегда: заголовок
+    и ссылки извлекаются одним проходом токенизатора (extract_title_links).
+    
+    Args:
+        url: URL веб-страницы
+        http: Модуль requests, requests.Session или клиент из http_client
+        timeout: Таймаут в секундах или пара (соединение, чтение)
+        cached: Запись кэша (title, etag, last_modified) или None
+        stored: Прошлая запись страницы в web_pages (content_hash, title) или None
+        links: Извлекать ли ссылки страницы
+        timings: Замеры этапов URL (connect, ttfb, download, parse) или None
+        
+    Returns:
+        dict: title, etag, last_modified, not_modified, content_hash, unchanged и links
+    """
+    if TITLE_STREAMING:
+        return fetch_title(url, http, timeout, cached, stored, links, timings)
+    if links:
+        cached = None
+    # Тело читается отдельно от заголовков ответа, чтобы разделить первый байт и загрузку
+    started = time.perf_counter()
+    with http.get(url, timeout=timeout, stream=True, headers=conditional_headers(cached)) as response:
+        response_timings(timings, started, getattr(response, 'connect_time', None))
+        if response.status_code == 304 and cached:
+            return page_result(cached["title"], response.headers, cached)
+        response.raise_for_status()
+        body_started = time.perf_counter()
+        content = response.content
+        add_timing(timings, "download", time.perf_counter() - body_started)
+    digest = content_hash(content)
+    parse_started = time.perf_counter()
+    if links:
+        title, hrefs = extract_title_links(content, url, response_encoding(response.headers.get('Content-Type')))
+        add_timing(timings, "parse", time.perf_counter() - parse_started)
+        stored = stored if unchanged(digest, stored) else None
+        return page_result(title, response.headers, digest=digest, stored=stored,
+                           links=page_links(hrefs, response.url))
+    if unchanged(digest, stored):
+        return page_result(stored["title"], response.headers, digest=digest, stored=stored)
+    title = extract_title(content, url)
+    add_timing(timings, "parse", time.perf_counter() - parse_started)
+    return page_result(title, response.headers, digest=digest)